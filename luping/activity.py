@@ -0,0 +1,221 @@
+"""
+逐帧活动索引（recording_*.activity）
+
+录制时在写入线程里顺便计算每帧的画面变化：把帧按步长抽样成小图（只取绿色通道近似亮度），
+与上一帧逐像素求绝对差，得到整帧平均差（变化分数）和按网格划分的各块平均差，
+超过阈值的块记为“变化块”，打包成位图。每帧一条定长记录追加到旁路文件：
+
+    头部: magic, 版本, 网格列数, 网格行数, 抽样步长, 块阈值
+    记录: float32 变化分数 + ceil(列数 * 行数 / 8) 字节变化块位图
+
+默认 16x9 网格每帧 22 字节，一小时 30fps 录像约 2.4 MB。之后查找活动高峰、静止时间段和场景切换
+都只读这个文件，不需要重新解码视频：
+
+    index = ActivityIndex.load(activity_path_for("recordings/recording_20250101_120000.mp4"))
+    index.static_spans(min_frames=90)
+    index.scene_changes()
+
+用法:
+    python -m luping.activity recording.mp4            # 打印概要（没有索引时先解码视频生成）
+"""
+import argparse
+import os
+import struct
+import sys
+from pathlib import Path
+
+import numpy as np
+
+_MAGIC = b'LPAC'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIHHHf')  # magic, version, cols, rows, step, tile_threshold
+
+DEFAULT_GRID = (16, 9)        # 列数, 行数
+DEFAULT_STEP = 8              # 每 8 个像素取一个
+DEFAULT_TILE_THRESHOLD = 2.0  # 块内平均差（0-255）超过该值记为变化
+
+
+def activity_path_for(video_path):
+    """视频文件对应的活动索引路径（与视频同名，后缀 .activity）"""
+    video_path = Path(video_path)
+    return video_path.with_name(video_path.stem + ".activity")
+
+
+def _record_dtype(cols, rows):
+    return np.dtype([('score', '<f4'), ('tiles', 'u1', ((cols * rows + 7) // 8,))])
+
+
+class ActivityIndexWriter:
+    """逐帧计算变化分数和变化块位图，追加写入活动索引文件"""
+
+    def __init__(self, path, grid=DEFAULT_GRID, step=DEFAULT_STEP, tile_threshold=DEFAULT_TILE_THRESHOLD):
+        self.path = Path(path)
+        self.cols, self.rows = grid
+        self.step = step
+        self.tile_threshold = tile_threshold
+        self._dtype = _record_dtype(self.cols, self.rows)
+        self._record = np.zeros(1, dtype=self._dtype)
+        self._previous = None
+        self.frames = 0
+        self._file = open(self.path, 'wb')
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION, self.cols, self.rows, self.step, self.tile_threshold))
+
+    def update(self, img):
+        """处理一帧 BGR 图像，返回变化分数；第一帧的分数为 0"""
+        small = img[::self.step, ::self.step, 1].astype(np.int16)
+        record = self._record[0]
+        if self._previous is None or self._previous.shape != small.shape:
+            record['score'] = 0.0
+            record['tiles'][:] = 0
+        else:
+            diff = np.abs(small - self._previous)
+            record['score'] = diff.mean()
+            h, w = diff.shape
+            th, tw = max(1, h // self.rows), max(1, w // self.cols)
+            tiles = diff[:th * self.rows, :tw * self.cols].reshape(self.rows, th, self.cols, tw).mean(axis=(1, 3))
+            record['tiles'][:] = np.packbits(tiles.ravel() > self.tile_threshold)
+        self._previous = small
+        self._file.write(self._record.tobytes())
+        self.frames += 1
+        return float(record['score'])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ActivityIndex:
+    """只读的活动索引，scores 为每帧变化分数（numpy 数组）"""
+
+    def __init__(self, scores, tiles, cols, rows, step=DEFAULT_STEP, tile_threshold=DEFAULT_TILE_THRESHOLD):
+        self.scores = scores
+        self.tiles = tiles
+        self.cols = cols
+        self.rows = rows
+        self.step = step
+        self.tile_threshold = tile_threshold
+
+    def __len__(self):
+        return len(self.scores)
+
+    @classmethod
+    def load(cls, path):
+        """读取活动索引（内存映射）；录制中断导致末尾不完整的记录会被忽略
+
+        Raises:
+            ValueError: 文件格式不对
+        """
+        path = Path(path)
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"活动索引不完整: {path}")
+        magic, version, cols, rows, step, tile_threshold = _HEADER.unpack(header)
+        if magic != _MAGIC or version > _VERSION:
+            raise ValueError(f"不是活动索引文件: {path}")
+        dtype = _record_dtype(cols, rows)
+        count = (path.stat().st_size - _HEADER.size) // dtype.itemsize
+        if count > 0:
+            records = np.memmap(path, dtype=dtype, mode='r', offset=_HEADER.size, shape=(count,))
+        else:
+            records = np.zeros(0, dtype=dtype)
+        return cls(records['score'], records['tiles'], cols, rows, step, tile_threshold)
+
+    def changed_tiles(self, index):
+        """第 index 帧的变化块，(rows, cols) 布尔数组"""
+        bits = np.unpackbits(self.tiles[index])[:self.cols * self.rows]
+        return bits.reshape(self.rows, self.cols).astype(bool)
+
+    def changed_fraction(self):
+        """每帧变化块占全部块的比例"""
+        if not len(self.tiles):
+            return np.zeros(0)
+        counts = np.unpackbits(np.asarray(self.tiles), axis=1)[:, :self.cols * self.rows].sum(axis=1)
+        return counts / float(self.cols * self.rows)
+
+    def peaks(self, min_score=1.0, min_gap=30):
+        """活动高峰：变化分数不低于 min_score 的局部最大值，相邻高峰至少间隔 min_gap 帧（保留较高者）"""
+        scores = np.asarray(self.scores)
+        candidates = np.flatnonzero(scores >= min_score)
+        suppressed = np.zeros(len(scores), dtype=bool)
+        chosen = []
+        for i in candidates[np.argsort(-scores[candidates], kind='stable')]:
+            if not suppressed[i]:
+                chosen.append(int(i))
+                suppressed[max(0, i - min_gap + 1):i + min_gap] = True
+        return sorted(chosen)
+
+    def static_spans(self, max_score=0.5, min_frames=30):
+        """静止时间段：连续至少 min_frames 帧的变化分数都不超过 max_score，返回 [(起始帧, 结束帧), ...]（不含结束帧）"""
+        static = np.asarray(self.scores) <= max_score
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], static.view(np.int8), [0]))))
+        return [(int(start), int(end)) for start, end in zip(edges[::2], edges[1::2]) if end - start >= min_frames]
+
+    def scene_changes(self, min_fraction=0.5):
+        """场景切换：变化块比例不低于 min_fraction 的帧（连续多帧只取第一帧）"""
+        hits = self.changed_fraction() >= min_fraction
+        starts = np.flatnonzero(hits & ~np.concatenate(([False], hits[:-1])))
+        return [int(i) for i in starts]
+
+
+def build_activity_index(video_path, path=None, grid=DEFAULT_GRID, step=DEFAULT_STEP,
+                         tile_threshold=DEFAULT_TILE_THRESHOLD):
+    """为没有活动索引的旧录像解码一遍生成索引（写到临时文件后原子替换），返回索引路径"""
+    import cv2
+
+    video_path = Path(video_path)
+    path = Path(path) if path else activity_path_for(video_path)
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise RuntimeError(f"无法打开视频: {video_path}")
+    tmp_path = path.with_name(path.name + ".tmp")
+    writer = ActivityIndexWriter(tmp_path, grid, step, tile_threshold)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            writer.update(frame)
+    finally:
+        cap.release()
+        writer.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看录像的活动索引：活动高峰、静止时间段、场景切换")
+    parser.add_argument("video", help="录像文件")
+    parser.add_argument("--fps", type=float, default=None, help="换算时间用的帧率（默认取帧时间表，没有时为 30）")
+    parser.add_argument("--min-static", type=float, default=3.0, help="静止时间段的最短秒数（默认 3）")
+    args = parser.parse_args()
+
+    path = activity_path_for(args.video)
+    try:
+        if not path.exists():
+            print(f"未找到活动索引，正在解码视频生成: {path}")
+            build_activity_index(args.video, path)
+        index = ActivityIndex.load(path)
+    except Exception as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+    fps = args.fps
+    if fps is None:
+        from luping.timeline import FrameTimeline, timeline_path_for
+        timeline_path = timeline_path_for(args.video)
+        fps = FrameTimeline.load(timeline_path).video_fps if timeline_path.exists() else 30.0
+    spans = index.static_spans(min_frames=max(1, round(args.min_static * fps)))
+    static_frames = sum(end - start for start, end in spans)
+    print(f"✓ {len(index)} 帧，静止 {static_frames / fps:.1f} 秒（{len(spans)} 段）")
+    for start, end in spans:
+        print(f"  静止 {start / fps:8.2f}s - {end / fps:8.2f}s")
+    for i in index.scene_changes():
+        print(f"  场景切换 {i / fps:8.2f}s")
+    for i in index.peaks():
+        print(f"  活动高峰 {i / fps:8.2f}s  分数 {float(index.scores[i]):.1f}")
+
+
+if __name__ == "__main__":
+    main()
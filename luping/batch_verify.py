@@ -0,0 +1,369 @@
+"""
+批量校验与修复录像目录
+
+扫描录像目录，在进程池中并行校验每一对"录像 + 事件文件"（容器结构解析，不解码视频），
+输出机器可读的 JSON 报告。结果按文件大小和修改时间缓存在目录下的 .verify_cache.json，
+重复运行时只处理新增或变化的文件。
+
+录像有匹配的清单（recording_*.manifest.json）时直接使用清单中的容器信息，连容器也不用解析；
+--checksums 时按清单校验各文件的 sha256，清单中还没有校验和的文件（录制时默认不计算）在这次补上。
+
+发现问题的文件会排入修复队列：
+    remux         流复制重新封装（修复缺少索引、时间戳错乱等）
+    fix_duration  按帧时间表重新缩放时间戳（流复制），修正时长与实际录制时长不符
+
+用法:
+    python -m luping.batch_verify recordings
+    python -m luping.batch_verify recordings --report report.json --workers 4 --repair
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from luping.container import probe_container, verify_container
+from luping.eventlog import EventLogReader, events_path_for
+from luping.ffmpeg_tools import run_ffmpeg
+from luping.manifest import (container_summary, file_entry, load_manifest, manifest_for, manifest_path_for,
+                             record_checksums, save_manifest, verify_checksums)
+from luping.timeline import FrameTimeline, timeline_path_for
+
+CACHE_NAME = ".verify_cache.json"
+CACHE_VERSION = 1
+REPORT_NAME = "verify_report.json"
+VIDEO_SUFFIXES = (".mp4", ".avi")
+# 只校验录制器直接产生的录像；附加输出（*.proxy.mp4）、分段（*.seg001.mp4）、
+# 处理过程中的中间文件（*.temp.mp4、*.subs.mp4、*.join.tmp.mp4 等）和剪辑、导出结果都不单独校验
+_RECORDING_NAME = re.compile(r"recording_\d{8}_\d{6}")
+DURATION_TOLERANCE = 1.0  # 时长差异超过该值（秒）时排入 fix_duration
+
+
+def find_recordings(directory):
+    """列出目录中的录像及其事件文件，返回 [(video_path, events_path 或 None), ...]"""
+    directory = Path(directory)
+    pairs = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() not in VIDEO_SUFFIXES or not path.is_file():
+            continue
+        if not _RECORDING_NAME.fullmatch(path.stem):
+            continue
+        events_path = events_path_for(path)
+        pairs.append((path, events_path if events_path.exists() else None))
+    return pairs
+
+
+def _fingerprint(path):
+    if path is None or not Path(path).exists():
+        return None
+    stat = Path(path).stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _expected_duration(video_path, manifest=None):
+    """实际录制时长：优先取清单记录，其次根据帧时间表估计（都没有时返回 None）"""
+    if manifest is not None and (manifest.get("frames") or {}).get("actual_duration"):
+        return manifest["frames"]["actual_duration"]
+    timeline_path = timeline_path_for(video_path)
+    if not timeline_path.exists():
+        return None
+    timeline = FrameTimeline.load(timeline_path)
+    count = len(timeline.capture_times)
+    if count < 2:
+        return None
+    span = timeline.capture_times[-1] - timeline.capture_times[0]
+    return span * count / (count - 1)
+
+
+def _check_events(events_path):
+    """检查事件文件：能否建立索引、事件数量、最后一个事件时间、文件是否完整写出"""
+    result = {"count": 0, "last_timestamp": None, "complete": False}
+    with open(events_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 64))
+        result["complete"] = f.read().rstrip().endswith(b']')
+    with EventLogReader(events_path, use_cache=False) as log:
+        result["count"] = len(log)
+        last = log.nearest_event(float('inf'))
+        if last is not None:
+            result["last_timestamp"] = last.get("timestamp")
+    return result
+
+
+def verify_pair(video_path, events_path=None, checksums=False):
+    """校验一对录像和事件文件，返回报告条目（在工作进程中运行）"""
+    video_path = Path(video_path)
+    entry = {
+        "video": video_path.name,
+        "events": Path(events_path).name if events_path else None,
+        "status": "ok",
+        "problems": [],
+        "repair": None,
+    }
+    try:
+        manifest = manifest_for(video_path)
+        if manifest is not None and manifest.get("video"):
+            # 快速路径：视频自写入清单后未变化
+            # 复制一份：下面会删掉关键帧列表，而 --checksums 时清单会被写回
+            summary = dict(manifest["video"])
+            info = {"problems": [], **summary}
+            entry["source"] = "manifest"
+        else:
+            info = probe_container(video_path)
+            summary = container_summary(info)
+            entry["source"] = "probe"
+        expected = _expected_duration(video_path, manifest)
+        ok, problems = verify_container(info, expected_duration=expected, duration_tolerance=DURATION_TOLERANCE)
+        summary.pop("keyframes", None)
+        summary.pop("keyframe_times", None)
+        entry["container"] = summary
+        mismatches = []
+        if checksums:
+            manifest = manifest or load_manifest(manifest_path_for(video_path))
+            if manifest is None:
+                problems.append("没有录制清单，无法校验 sha256")
+            else:
+                mismatches = verify_checksums(video_path, manifest)
+                problems.extend(mismatches)
+                added = record_checksums(video_path, manifest)
+                if added:
+                    save_manifest(manifest_path_for(video_path), manifest)
+                    entry["checksums_recorded"] = added
+        entry["expected_duration"] = round(expected, 3) if expected is not None else None
+        entry["problems"].extend(problems)
+        if not ok:
+            entry["status"] = "broken"
+            # 缺少 moov 的 MP4 没有样本表，流复制无法恢复
+            if info["format"] == "avi" or (info["format"] == "mp4" and info["frame_count"] > 0):
+                entry["repair"] = "remux"
+        elif mismatches:
+            # 内容与清单不一致无法自动修复，只报告
+            entry["status"] = "broken"
+        elif expected is not None and abs(info["duration"] - expected) > DURATION_TOLERANCE:
+            entry["status"] = "warning"
+            entry["repair"] = "fix_duration"
+        elif problems:
+            entry["status"] = "warning"
+    except Exception as e:
+        entry["status"] = "broken"
+        entry["problems"].append(f"解析视频失败: {e}")
+
+    if events_path is None:
+        entry["problems"].append("缺少事件文件")
+        if entry["status"] == "ok":
+            entry["status"] = "warning"
+        return entry
+    try:
+        entry["events_info"] = _check_events(events_path)
+        if not entry["events_info"]["complete"]:
+            entry["problems"].append("事件文件不完整（未以 ] 结尾）")
+            if entry["status"] == "ok":
+                entry["status"] = "warning"
+    except Exception as e:
+        entry["problems"].append(f"读取事件文件失败: {e}")
+        if entry["status"] == "ok":
+            entry["status"] = "warning"
+    return entry
+
+
+def _verify_job(job):
+    video_path, events_path, checksums = job
+    return verify_pair(video_path, events_path, checksums)
+
+
+def _load_cache(directory):
+    try:
+        with open(Path(directory) / CACHE_NAME, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("version") == CACHE_VERSION:
+            return data.get("entries", {})
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _save_cache(directory, entries):
+    path = Path(directory) / CACHE_NAME
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": CACHE_VERSION, "entries": entries}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def verify_directory(directory, workers=None, use_cache=True, checksums=False):
+    """并行校验目录中的所有录像，返回报告字典"""
+    directory = Path(directory)
+    started = time.perf_counter()
+    cache = _load_cache(directory) if use_cache else {}
+    results = {}
+    jobs = []
+    fingerprints = {}
+    for video_path, events_path in find_recordings(directory):
+        key = [_fingerprint(video_path), _fingerprint(events_path), _fingerprint(timeline_path_for(video_path)),
+               _fingerprint(manifest_path_for(video_path)), checksums]
+        fingerprints[video_path.name] = key
+        cached = cache.get(video_path.name)
+        if cached and cached.get("key") == key:
+            results[video_path.name] = cached["result"]
+        else:
+            jobs.append((str(video_path), str(events_path) if events_path else None, checksums))
+
+    if len(jobs) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for entry in pool.map(_verify_job, jobs, chunksize=max(1, len(jobs) // 32)):
+                results[entry["video"]] = entry
+    else:
+        for job in jobs:
+            entry = _verify_job(job)
+            results[entry["video"]] = entry
+
+    if use_cache:
+        _save_cache(directory, {name: {"key": fingerprints[name], "result": entry}
+                                for name, entry in results.items()})
+
+    entries = [results[name] for name in sorted(results)]
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "directory": str(directory.absolute()),
+        "total": len(entries),
+        "checked": len(jobs),
+        "cached": len(entries) - len(jobs),
+        "ok": sum(1 for e in entries if e["status"] == "ok"),
+        "warning": sum(1 for e in entries if e["status"] == "warning"),
+        "broken": sum(1 for e in entries if e["status"] == "broken"),
+        "repair_queue": [{"video": e["video"], "action": e["repair"]} for e in entries if e["repair"]],
+        "elapsed": round(time.perf_counter() - started, 3),
+        "results": entries,
+    }
+
+
+def repair_recording(video_path, action, expected_duration=None, timeout=600):
+    """执行一项修复，成功后原文件保留为 *.bak，返回 (ok, message)"""
+    video_path = Path(video_path)
+    tmp_path = video_path.with_name(f"{video_path.stem}.repair{video_path.suffix}")
+    args = ['-y', '-loglevel', 'error']
+    if action == "fix_duration":
+        info = probe_container(video_path)
+        if not expected_duration or not info["duration"]:
+            return False, "缺少时长信息，无法修正"
+        # 流复制时按比例缩放输入时间戳
+        args += ['-itsscale', f"{expected_duration / info['duration']:.6f}"]
+    elif action != "remux":
+        return False, f"未知的修复操作: {action}"
+    args += ['-err_detect', 'ignore_err', '-fflags', '+genpts', '-i', video_path, '-map', '0', '-c', 'copy']
+    if video_path.suffix.lower() == '.mp4':
+        args += ['-movflags', '+faststart']
+    args.append(tmp_path)
+    try:
+        proc = run_ffmpeg(args, timeout=timeout)
+    except Exception as e:
+        return False, str(e)
+    if proc.returncode != 0 or not tmp_path.exists():
+        tmp_path.unlink(missing_ok=True)
+        return False, f"ffmpeg 失败: {proc.stderr.strip()[-300:]}"
+    ok, problems = verify_container(probe_container(tmp_path), expected_duration=expected_duration,
+                                    duration_tolerance=DURATION_TOLERANCE)
+    if not ok:
+        tmp_path.unlink(missing_ok=True)
+        return False, "修复后的文件仍然无效: " + "; ".join(problems)
+    os.replace(video_path, video_path.with_name(video_path.name + ".bak"))
+    os.replace(tmp_path, video_path)
+    timeline_path = timeline_path_for(video_path)
+    if action == "fix_duration" and timeline_path.exists():
+        # 帧时间表的帧率也要与新的时长一致
+        timeline = FrameTimeline.load(timeline_path)
+        timeline.video_fps = len(timeline.capture_times) / expected_duration
+        timeline.save(timeline_path)
+    _update_manifest(video_path, action)
+    return True, "修复成功"
+
+
+def _update_manifest(video_path, action):
+    """修复后刷新清单中的视频信息，使快速路径继续有效"""
+    path = manifest_path_for(video_path)
+    manifest = load_manifest(path)
+    if manifest is None:
+        return
+    checksum = "sha256" in ((manifest.get("files") or {}).get("video") or {})
+    manifest["video"] = container_summary(probe_container(video_path))
+    manifest.setdefault("files", {})["video"] = file_entry(video_path, checksum)
+    if action == "fix_duration":
+        manifest["files"]["timeline"] = file_entry(timeline_path_for(video_path), checksum)
+    manifest.setdefault("encoder", {}).setdefault("post_processing", []).append(f"repair:{action}")
+    save_manifest(path, manifest)
+
+
+def _repair_job(job):
+    video_path, action, expected = job
+    return Path(video_path).name, action, repair_recording(video_path, action, expected)
+
+
+def run_repairs(directory, report, workers=None):
+    """执行报告中的修复队列，返回 [(video, action, ok, message), ...]"""
+    directory = Path(directory)
+    by_name = {e["video"]: e for e in report["results"]}
+    jobs = [(str(directory / item["video"]), item["action"], by_name[item["video"]].get("expected_duration"))
+            for item in report["repair_queue"]]
+    if not jobs:
+        return []
+    if len(jobs) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(_repair_job, jobs))
+    else:
+        outcomes = [_repair_job(job) for job in jobs]
+    return [(name, action, ok, message) for name, action, (ok, message) in outcomes]
+
+
+def print_summary(report):
+    print(f"共 {report['total']} 个录像（本次检查 {report['checked']}，缓存 {report['cached']}），"
+          f"用时 {report['elapsed']:.2f} 秒")
+    print(f"✓ 正常 {report['ok']}  ⚠️ 警告 {report['warning']}  ✗ 损坏 {report['broken']}")
+    for entry in report["results"]:
+        if entry["status"] == "ok":
+            continue
+        mark = "✗" if entry["status"] == "broken" else "⚠️"
+        repair = f" [待修复: {entry['repair']}]" if entry["repair"] else ""
+        print(f"{mark} {entry['video']}{repair}")
+        for problem in entry["problems"]:
+            print(f"    {problem}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量校验录像目录（并行、带缓存），可选修复")
+    parser.add_argument("directory", help="录像目录")
+    parser.add_argument("--report", default=None, help=f"JSON 报告路径（默认 <目录>/{REPORT_NAME}）")
+    parser.add_argument("--workers", type=int, default=None, help="进程数（默认 CPU 核数）")
+    parser.add_argument("--no-cache", action="store_true", help="忽略缓存，重新检查所有文件")
+    parser.add_argument("--repair", action="store_true", help="执行修复队列（原文件保留为 *.bak）")
+    parser.add_argument("--checksums", action="store_true", help="按录制清单校验各文件的 sha256（需读取全部数据）")
+    args = parser.parse_args()
+
+    directory = Path(args.directory)
+    if not directory.is_dir():
+        print(f"✗ 目录不存在: {directory}")
+        sys.exit(1)
+    report = verify_directory(directory, workers=args.workers, use_cache=not args.no_cache,
+                              checksums=args.checksums)
+    print_summary(report)
+
+    if args.repair and report["repair_queue"]:
+        print(f"\n正在修复 {len(report['repair_queue'])} 个文件...")
+        for name, action, ok, message in run_repairs(directory, report, workers=args.workers):
+            print(f"{'✓' if ok else '✗'} {name} ({action}): {message}")
+        # 修复后的文件重新校验
+        report = verify_directory(directory, workers=args.workers, checksums=args.checksums)
+
+    report_path = Path(args.report) if args.report else directory / REPORT_NAME
+    tmp_path = report_path.with_name(report_path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, report_path)
+    print(f"\n报告已写入: {report_path}")
+    sys.exit(1 if report["broken"] else 0)
+
+
+if __name__ == "__main__":
+    main()
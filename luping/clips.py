@@ -0,0 +1,292 @@
+"""
+按关键帧对齐的流复制剪辑
+
+从长录像中截取片段时不重新编码整段视频：片段中间从关键帧开始流复制，
+只有两端不足一个 GOP 的部分重新编码（smart cut），再无损拼接。
+一小时录像中截取 10 秒片段通常不到一秒。多个片段并行生成。
+
+    ranges = ranges_around_events("recordings/recording_20250101_120000.mp4", "mouse_click", 5, 5)
+    make_clips("recordings/recording_20250101_120000.mp4", ranges)
+
+用法:
+    python -m luping.clips recording.mp4 --range 65-75 --range 1:30-1:42
+    python -m luping.clips recording.mp4 --around mouse_click --before 5 --after 5 -o clips/
+
+录像没有音轨，剪辑只处理视频流。
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from luping.container import probe_container
+from luping.eventlog import EVENT_TYPES, EventLogReader, events_path_for
+from luping.ffmpeg_tools import find_ffmpeg, run_ffmpeg
+from luping.manifest import manifest_for
+from luping.timeline import FrameTimeline, event_video_time, timeline_path_for
+
+# 可以与 libx264 重新编码的两端无缝拼接的编码
+_SMART_CUT_CODECS = ("avc1", "avc3", "h264")
+
+
+def parse_time(text):
+    """"75" / "1:15" / "0:01:15.5" -> 秒"""
+    seconds = 0.0
+    for part in str(text).strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_range(text):
+    """"65-75" / "1:05-1:15" -> (start, end)"""
+    start, _, end = str(text).partition("-")
+    start, end = parse_time(start), parse_time(end)
+    if end <= start:
+        raise ValueError(f"无效的时间范围: {text}")
+    return start, end
+
+
+def merge_ranges(ranges, gap=0.0):
+    """合并重叠（或间隔不超过 gap 秒）的时间范围"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def ranges_around_events(video_path, event_type="mouse_click", before=5.0, after=5.0, events_path=None, merge=True):
+    """以每个指定类型事件为中心生成时间范围（视频时间），默认合并重叠的范围"""
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"未知的事件类型: {event_type}")
+    video_path = Path(video_path)
+    events_path = Path(events_path) if events_path else events_path_for(video_path)
+    video_fps = None
+    timeline_path = timeline_path_for(video_path)
+    if timeline_path.exists():
+        video_fps = FrameTimeline.load(timeline_path).video_fps
+    ranges = []
+    with EventLogReader(events_path) as log:
+        for event in log.events_of_type(event_type):
+            if event_type == "mouse_click" and not event.get("pressed", True):
+                continue
+            t = event_video_time(event, video_fps)
+            ranges.append((max(0.0, t - before), t + after))
+    return merge_ranges(ranges) if merge else ranges
+
+
+def _video_info(video_path):
+    """时长、帧率、编码、解码器配置、关键帧时间和编码参数
+
+    keyframe_times 为 None 表示每一帧都是关键帧。容器解析只需几毫秒；
+    录制清单（如有）提供录制时的编码参数，两端重新编码时沿用。
+    """
+    info = probe_container(video_path)
+    result = {key: info.get(key) for key in
+              ("duration", "frame_count", "fps", "codec", "codec_config", "keyframe_times")}
+    manifest = manifest_for(video_path)
+    result["encoder"] = (manifest or {}).get("encoder") or {}
+    return result
+
+
+def _edge_encode_args(encoder):
+    """两端重新编码的参数：与录制时的编码参数一致，生成的 SPS/PPS 才能与原视频相同"""
+    return ['-c:v', 'libx264', '-preset', encoder.get("preset", "veryfast"),
+            '-pix_fmt', encoder.get("pix_fmt", "yuv420p")]
+
+
+def plan_cut(start, end, keyframe_times, frame_duration):
+    """把 [start, end) 拆成需要重新编码 / 流复制的分段
+
+    Returns:
+        [(start, end, "encode" 或 "copy"), ...]
+    """
+    if keyframe_times is None:
+        # 全部是关键帧（如 MJPG），可以在任意帧上流复制
+        return [(start, end, "copy")]
+    eps = frame_duration / 4
+    first = bisect_left(keyframe_times, start - eps)
+    last = bisect_right(keyframe_times, end + eps) - 1
+    if first >= len(keyframe_times) or last < first:
+        # 片段落在一个 GOP 内，整段重新编码
+        return [(start, end, "encode")]
+    k_first, k_last = keyframe_times[first], keyframe_times[last]
+    parts = []
+    if k_first - start > eps:
+        parts.append((start, k_first, "encode"))
+    if k_last > k_first:
+        parts.append((k_first, k_last, "copy"))
+    if end - k_last > eps:
+        # 末尾不在关键帧上：流复制截断会丢失 B 帧的后向参考，这部分也重新编码
+        parts.append((k_last, end, "encode"))
+    return parts
+
+
+def _segment_args(video_path, start, end, mode, info, intermediate=True):
+    fps = info.get("fps") or 30.0
+    if mode == "copy" and info.get("keyframe_times") is not None:
+        # 输入端定位时间向上取整到微秒，保证不早于关键帧（否则会回退到前一个关键帧）；
+        # 按帧数截止：两个关键帧之间（封闭 GOP）的包正好是这段时间内的全部帧
+        frames = max(1, round((end - start) * fps))
+        args = ['-ss', f"{math.ceil(start * 1e6) / 1e6:.6f}", '-i', video_path,
+                '-frames:v', str(frames), '-c', 'copy']
+    elif mode == "copy":
+        args = ['-ss', f"{start:.6f}", '-i', video_path, '-t', f"{end - start:.6f}", '-c', 'copy']
+    else:
+        args = ['-ss', f"{start:.6f}", '-i', video_path, '-t', f"{end - start:.6f}"] + \
+            _edge_encode_args(info["encoder"])
+    args = ['-y', '-loglevel', 'error'] + args + ['-map', '0:v:0']
+    if intermediate:
+        # 各分段时间戳从 0 开始，拼接时才不会出现 DTS 回退
+        args += ['-avoid_negative_ts', 'make_zero']
+    return args
+
+
+def _run(args, ffmpeg_path, timeout, what):
+    proc = run_ffmpeg(args, timeout=timeout, ffmpeg_path=ffmpeg_path)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{what}失败: {proc.stderr.strip()[-500:]}")
+
+
+def make_clip(video_path, start, end, output_path, info=None, smart=True, timeout=600):
+    """截取 [start, end) 秒为新文件，返回输出路径
+
+    Args:
+        info: _video_info 的结果（批量剪辑时复用）
+        smart: False 时整段重新编码
+
+    Raises:
+        RuntimeError: 找不到 ffmpeg 或 ffmpeg 失败
+    """
+    video_path = Path(video_path)
+    output_path = Path(output_path)
+    info = info or _video_info(video_path)
+    ffmpeg_path = find_ffmpeg()
+    if not ffmpeg_path:
+        raise RuntimeError("未找到 ffmpeg，无法剪辑")
+    duration = info.get("duration") or 0.0
+    if duration:
+        end = min(end, duration)
+    # 起止时间对齐到最近的帧边界，分段之间不会重复或遗漏帧
+    fps = info.get("fps") or 30.0
+    start, end = round(start * fps) / fps, round(end * fps) / fps
+    if end <= start:
+        raise ValueError(f"时间范围超出视频时长: {start:.2f}-{end:.2f}")
+    frame_duration = 1.0 / fps
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    movflags = ['-movflags', '+faststart'] if output_path.suffix in ('.mp4', '.mov') else []
+
+    keyframe_times = info.get("keyframe_times")
+    if keyframe_times is None:
+        parts = [(start, end, "copy")]
+    elif smart and info.get("codec") in _SMART_CUT_CODECS:
+        parts = plan_cut(start, end, keyframe_times, frame_duration)
+    else:
+        parts = [(start, end, "encode")]
+
+    if len(parts) > 1:
+        with tempfile.TemporaryDirectory(prefix=".clip_", dir=output_path.parent) as tmp:
+            tmp = Path(tmp)
+            list_lines = []
+            compatible = True
+            for i, (seg_start, seg_end, mode) in enumerate(parts):
+                segment_path = tmp / f"part{i}.mp4"
+                _run(_segment_args(video_path, seg_start, seg_end, mode, info) + [segment_path],
+                     ffmpeg_path, timeout, f"生成分段 ({mode} {seg_start:.2f}-{seg_end:.2f}) ")
+                if mode == "encode" and probe_container(segment_path)["codec_config"] != info.get("codec_config"):
+                    # 编码参数与原视频不同（如录制后转码过），拼接后无法解码，改为整段重新编码
+                    compatible = False
+                    break
+                list_lines.append(f"file '{segment_path.name}'")
+            if compatible:
+                list_path = tmp / "parts.txt"
+                list_path.write_text("\n".join(list_lines) + "\n", encoding='utf-8')
+                _run(['-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy']
+                     + movflags + [output_path], ffmpeg_path, timeout, "拼接分段")
+                return output_path
+        parts = [(start, end, "encode")]
+
+    start, end, mode = parts[0]
+    args = _segment_args(video_path, start, end, mode, info, intermediate=False)
+    _run(args + movflags + [output_path], ffmpeg_path, timeout, "剪辑")
+    return output_path
+
+
+def clip_path_for(video_path, start, end, output_dir=None):
+    """片段的默认输出路径：<目录>/clips/<录像名>_clip_<开始>-<结束>.<后缀>"""
+    video_path = Path(video_path)
+    output_dir = Path(output_dir) if output_dir else video_path.parent / "clips"
+    suffix = video_path.suffix if video_path.suffix in ('.mp4', '.mov', '.mkv') else '.mkv'
+    return output_dir / f"{video_path.stem}_clip_{start:.1f}-{end:.1f}{suffix}"
+
+
+def make_clips(video_path, ranges, output_dir=None, workers=None, smart=True):
+    """并行截取多个片段
+
+    Returns:
+        [(start, end, 输出路径 或 None, 错误信息 或 None), ...]
+    """
+    video_path = Path(video_path)
+    info = _video_info(video_path)
+    if not info.get("frame_count"):
+        raise RuntimeError(f"无法读取视频信息: {video_path}")
+    workers = workers or min(4, os.cpu_count() or 1)
+
+    def run(item):
+        start, end = item
+        output_path = clip_path_for(video_path, start, end, output_dir)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            return start, end, make_clip(video_path, start, end, output_path, info=info, smart=smart), None
+        except Exception as e:
+            return start, end, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, ranges))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按关键帧对齐、流复制截取录像片段")
+    parser.add_argument("video", help="录像文件")
+    parser.add_argument("--range", dest="ranges", action="append", default=[],
+                        help="时间范围，如 65-75 或 1:05-1:15（可重复）")
+    parser.add_argument("--around", choices=EVENT_TYPES, default=None, help="以每个该类型事件为中心截取片段")
+    parser.add_argument("--before", type=float, default=5.0, help="事件之前的秒数（默认 5）")
+    parser.add_argument("--after", type=float, default=5.0, help="事件之后的秒数（默认 5）")
+    parser.add_argument("--events", default=None, help="事件文件（默认按录像文件名推断）")
+    parser.add_argument("-o", "--output-dir", default=None, help="输出目录（默认录像目录下的 clips/）")
+    parser.add_argument("--workers", type=int, default=None, help="并行数（默认 min(4, CPU 核数)）")
+    parser.add_argument("--reencode", action="store_true", help="整段重新编码，不使用 smart cut")
+    args = parser.parse_args()
+
+    try:
+        ranges = [parse_range(text) for text in args.ranges]
+        if args.around:
+            ranges += ranges_around_events(args.video, args.around, args.before, args.after, args.events)
+        if not ranges:
+            print("✗ 请用 --range 或 --around 指定要截取的范围")
+            sys.exit(1)
+        results = make_clips(args.video, merge_ranges(ranges), args.output_dir, args.workers,
+                             smart=not args.reencode)
+    except Exception as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+    failed = 0
+    for start, end, path, error in results:
+        if path:
+            print(f"✓ {start:.1f}-{end:.1f}s -> {path}")
+        else:
+            failed += 1
+            print(f"✗ {start:.1f}-{end:.1f}s: {error}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,596 @@
+"""
+容器级快速校验
+
+直接解析 MP4 box / AVI chunk 结构读取时长、帧数、分辨率和关键帧位置，
+不需要用 OpenCV 打开并解码视频，长录像也只需几毫秒。完整解码检查是可选的，并且只抽样几帧。
+
+    info = probe_container("recordings/recording_20250101_120000.mp4")
+    ok, problems = verify_container(info, expected_frames=1800)
+"""
+import struct
+from pathlib import Path
+
+# 可以包含子 box 的 MP4 容器 box
+_MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts', b'mvex', b'moof', b'traf', b'dinf'}
+# moov 以外需要读取内容的顶层 box 的大小上限（防止损坏文件导致读取整个 mdat）
+_MAX_META_BOX = 64 * 1024 * 1024
+
+_AVIIF_KEYFRAME = 0x10
+
+
+def _empty_info(path, fmt):
+    return {
+        "path": str(path),
+        "format": fmt,
+        "size": 0,
+        "duration": 0.0,
+        "frame_count": 0,
+        "fps": 0.0,
+        "width": 0,
+        "height": 0,
+        "codec": None,
+        "codec_config": None,  # 解码器配置（avcC / hvcC，十六进制）
+        "keyframes": None,  # 关键帧的帧序号（从 0 开始）；None 表示未知或全部为关键帧
+        "keyframe_times": None,  # 关键帧的显示时间（秒）
+        "truncated": False,
+        "problems": [],
+    }
+
+
+def probe_container(path):
+    """解析视频容器结构，返回信息字典（无法识别的格式 format 为 "unknown"）"""
+    path = Path(path)
+    info = _empty_info(path, "unknown")
+    if not path.exists():
+        info["problems"].append("文件不存在")
+        return info
+    info["size"] = path.stat().st_size
+    if info["size"] == 0:
+        info["problems"].append("文件大小为 0")
+        return info
+    with open(path, 'rb') as f:
+        head = f.read(12)
+        f.seek(0)
+        try:
+            if head[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'):
+                info["format"] = "mp4"
+                _probe_mp4(f, info)
+            elif head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+                info["format"] = "avi"
+                _probe_avi(f, info)
+            else:
+                info["problems"].append(f"无法识别的文件头: {head.hex()}")
+        except (struct.error, IndexError) as e:
+            # 解析到不完整的结构：诊断工具正是要处理这类文件，不能抛出异常
+            info["truncated"] = True
+            info["problems"].append(f"容器结构不完整，文件可能被截断: {e}")
+    if info["duration"] > 0 and info["frame_count"] > 0 and not info["fps"]:
+        info["fps"] = info["frame_count"] / info["duration"]
+    return info
+
+
+def verify_container(info, expected_frames=None, expected_duration=None, duration_tolerance=1.0):
+    """根据 probe_container 的结果判断文件是否有效
+
+    Returns:
+        (ok, problems)：ok 为 False 表示文件不可用；problems 同时包含警告信息
+    """
+    problems = list(info["problems"])
+    ok = info["format"] != "unknown" and not info["truncated"]
+    if info["frame_count"] <= 0:
+        problems.append("没有视频帧")
+        ok = False
+    if info["width"] <= 0 or info["height"] <= 0:
+        problems.append("缺少视频分辨率信息")
+        ok = False
+    if expected_frames is not None and info["frame_count"] and info["frame_count"] != expected_frames:
+        problems.append(f"帧数与预期不符: {info['frame_count']} != {expected_frames}")
+    if expected_duration is not None and abs(info["duration"] - expected_duration) > duration_tolerance:
+        problems.append(f"时长与预期差异较大: {info['duration']:.2f}s vs {expected_duration:.2f}s")
+    return ok, problems
+
+
+def sampled_decode_check(path, samples=3):
+    """抽样解码检查（可选的慢速检查）：解码开头、中间、结尾附近的几帧
+
+    Returns:
+        (ok, message)
+    """
+    import cv2
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        return False, "OpenCV 无法打开视频文件"
+    try:
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count <= 0:
+            return False, "视频没有帧数据"
+        samples = max(1, min(samples, frame_count))
+        positions = sorted({round(i * (frame_count - 1) / max(1, samples - 1)) for i in range(samples)})
+        for pos in positions:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, pos)
+            ret, _ = cap.read()
+            if not ret:
+                return False, f"无法解码第 {pos} 帧"
+        return True, f"抽样解码 {len(positions)} 帧成功"
+    finally:
+        cap.release()
+
+
+def trim_fragmented_mp4(path):
+    """把异常结束的分片 MP4（moof + mdat 交替）截断为可以完整解码、显示时间连续的部分，返回保留的帧数
+
+    编码进程被强制结束时，文件末尾的分片可能只写了一半。另外分片按解码顺序切分，边界常常落在一组 B 帧中间，
+    只保留到某个分片结尾时，显示时间会跳过还在下一个分片里的 B 帧。这里按解码顺序逐帧检查，
+    保留到最后一个"已有帧的显示时间连续且数据完整"的位置：截在分片中间时改写该分片 trun 的样本数和 mdat 的大小。
+    截断后 probe_container 得到的帧数与可解码帧数一致。不是分片 MP4（没有 moof）时不修改文件，返回 None。
+    """
+    path = Path(path)
+    file_size = path.stat().st_size
+    movie = {}
+    best = None  # (截断位置, 保留帧数, 截在分片中间时的改写信息)
+    fragment = None  # 上一个 moof 中的样本
+    fragmented = False
+    frames = 0
+    span_start = None
+    span_end = total = 0
+    with open(path, 'rb') as f:
+        if f.read(8)[4:8] != b'ftyp':
+            return None
+        box_start = 0
+        for box_type, payload, payload_size, box_end in _iter_boxes(f, 0, file_size):
+            if box_type == b'moov' and best is None:
+                if box_end > file_size:
+                    break
+                _parse_mp4_box(f, payload, box_end, movie, [], None)
+                best = (box_end, 0, None)  # 还没有可用的分片时截断到 moov 之后（0 帧）
+            elif box_type == b'moof':
+                fragmented = True
+                if box_end > file_size or payload_size >= _MAX_META_BOX:
+                    break
+                fragment = _fragment_samples(f, box_start, payload, box_end, movie)
+            elif box_type == b'mdat' and fragment is not None:
+                samples, count_pos = fragment
+                data_limit = min(box_end, file_size)
+                used = 0
+                for pts, duration, data_start, size in samples:
+                    if data_start is None or data_start < payload or data_start + size > data_limit:
+                        break
+                    used += 1
+                    span_start = pts if span_start is None else min(span_start, pts)
+                    span_end = max(span_end, pts + duration)
+                    total += duration
+                    if span_end - span_start != total:
+                        continue  # 还有更早显示的帧在后面
+                    if used == len(samples) and box_end <= file_size:
+                        best = (box_end, frames + used, None)
+                    elif count_pos is not None:
+                        best = (data_start + size, frames + used, (count_pos, used, box_start, payload - box_start))
+                if used < len(samples) or box_end > file_size:
+                    break
+                frames += used
+                fragment = None
+            box_start = box_end
+    if not fragmented:
+        return None
+    end, kept, patch = best or (0, 0, None)
+    with open(path, 'r+b') as f:
+        if patch is not None:
+            count_pos, count, mdat_start, header_size = patch
+            f.seek(count_pos)
+            f.write(struct.pack('>I', count))
+            if header_size == 16:
+                f.seek(mdat_start + 8)
+                f.write(struct.pack('>Q', end - mdat_start))
+            else:
+                f.seek(mdat_start)
+                f.write(struct.pack('>I', end - mdat_start))
+        f.truncate(end)
+    return kept
+
+
+def _fragment_samples(f, moof_start, start, end, movie):
+    """moof 中第一个 traf 的样本列表 [(显示时间, 时长, 数据位置, 字节数)] 和 trun 样本数字段的位置
+
+    时间单位为媒体时间；数据位置未知时为 None。traf 中有多个 trun 时样本数位置为 None（不在分片中间截断）。
+    """
+    samples = []
+    count_pos = None
+    for box_type, payload, _size, box_end in _iter_boxes(f, start, end):
+        if box_type != b'traf':
+            continue
+        decode_time = 0
+        base = moof_start
+        default_duration = movie.get("default_sample_duration", 0)
+        default_size = None
+        truns = 0
+        for sub_type, sub_payload, sub_size, _ in _iter_boxes(f, payload, min(box_end, end)):
+            if sub_type not in (b'tfhd', b'tfdt', b'trun'):
+                continue
+            f.seek(sub_payload)
+            data = f.read(sub_size)
+            version = data[0]
+            flags = struct.unpack('>I', data[0:4])[0] & 0xFFFFFF
+            if sub_type == b'tfhd':
+                pos = 8
+                if flags & 0x1:
+                    base = struct.unpack('>Q', data[pos:pos + 8])[0]
+                    pos += 8
+                pos += 4 if flags & 0x2 else 0
+                if flags & 0x8:
+                    default_duration = struct.unpack('>I', data[pos:pos + 4])[0]
+                    pos += 4
+                if flags & 0x10:
+                    default_size = struct.unpack('>I', data[pos:pos + 4])[0]
+            elif sub_type == b'tfdt':
+                decode_time = struct.unpack('>Q' if version == 1 else '>I', data[4:12 if version == 1 else 8])[0]
+            else:
+                truns += 1
+                count_pos = sub_payload + 4
+                count = struct.unpack('>I', data[4:8])[0]
+                pos = 8
+                offset = None
+                if flags & 0x1:
+                    offset = base + struct.unpack('>i', data[pos:pos + 4])[0]
+                    pos += 4
+                pos += 4 if flags & 0x4 else 0
+                for _ in range(count):
+                    duration, size, composition = default_duration, default_size, 0
+                    if flags & 0x100:
+                        duration = struct.unpack('>I', data[pos:pos + 4])[0]
+                        pos += 4
+                    if flags & 0x200:
+                        size = struct.unpack('>I', data[pos:pos + 4])[0]
+                        pos += 4
+                    pos += 4 if flags & 0x400 else 0
+                    if flags & 0x800:
+                        composition = struct.unpack('>i' if version == 1 else '>I', data[pos:pos + 4])[0]
+                        pos += 4
+                    known = offset is not None and size is not None
+                    samples.append((decode_time + composition, duration, offset if known else None, size or 0))
+                    decode_time += duration
+                    offset = offset + size if known else None
+        if truns != 1:
+            count_pos = None
+        break
+    return samples, count_pos
+
+
+# -------------------- MP4 --------------------
+def _iter_boxes(f, start, end):
+    """遍历 [start, end) 范围内的 box，产出 (type, payload_offset, payload_size, box_end)"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack('>Q', large)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size:
+            return
+        yield box_type, pos + header_size, size - header_size, pos + size
+        pos += size
+
+
+def _probe_mp4(f, info):
+    file_size = info["size"]
+    top = {}
+    moof_samples = 0
+    moof_duration = 0  # 分片中样本的总时长（媒体时间单位）
+    traks = []
+    movie = {}
+    for box_type, payload, payload_size, box_end in _iter_boxes(f, 0, file_size):
+        top.setdefault(box_type, 0)
+        top[box_type] += 1
+        if box_end > file_size:
+            info["truncated"] = True
+            info["problems"].append(f"{box_type.decode(errors='replace')} box 超出文件末尾，文件可能被截断")
+        if box_type == b'moov':
+            _parse_mp4_box(f, payload, min(box_end, file_size), movie, traks, None)
+        elif box_type == b'moof' and payload_size < _MAX_META_BOX:
+            frag = []
+            _parse_mp4_box(f, payload, min(box_end, file_size), movie, frag, None)
+            moof_samples += sum(t.get("trun_samples", 0) for t in frag)
+            moof_duration += sum(t.get("trun_duration", 0) for t in frag)
+        elif box_type == b'ftyp' and payload_size >= 4:
+            f.seek(payload)
+            info["brand"] = f.read(4).decode('ascii', errors='replace')
+
+    if movie.pop("truncated", False):
+        info["truncated"] = True
+        info["problems"].append("moov / moof 中的 box 数据不完整，文件可能被截断")
+    if b'ftyp' not in top:
+        info["problems"].append("缺少 ftyp box")
+    if b'moov' not in top:
+        info["truncated"] = True
+        info["problems"].append("缺少 moov box（录制可能未正常结束）")
+        return
+    if b'mdat' not in top:
+        info["problems"].append("缺少 mdat box")
+    info["fragmented"] = b'moof' in top
+
+    video = next((t for t in traks if t.get("handler") == b'vide'), None)
+    if video is None:
+        info["problems"].append("没有视频轨道")
+        return
+    info["width"] = video.get("width", 0)
+    info["height"] = video.get("height", 0)
+    info["codec"] = video.get("codec")
+    info["codec_config"] = video.get("codec_config")
+    info["frame_count"] = video.get("sample_count", 0) + moof_samples
+    timescale = video.get("timescale") or 0
+    media_duration = video.get("media_duration", 0) + moof_duration
+    if timescale and media_duration:
+        # 用视频轨道自己的时长：mvhd 是最长轨道的时长，嵌入的事件字幕轨会比画面长，按它算出的帧率偏低
+        info["duration"] = media_duration / timescale
+    elif movie.get("timescale"):
+        info["duration"] = movie.get("duration", 0) / movie["timescale"]
+    if video.get("max_chunk_offset", 0) > file_size:
+        info["truncated"] = True
+        info["problems"].append("样本偏移超出文件末尾，文件可能被截断")
+    if info["duration"] > 0 and info["frame_count"] > 0:
+        info["fps"] = info["frame_count"] / info["duration"]
+
+    sync = video.get("sync_samples")
+    if sync is not None and timescale:
+        info["keyframes"] = [n - 1 for n in sync]
+        info["keyframe_times"] = _mp4_sample_times(video, info["keyframes"], timescale)
+    # 没有 stss 表示每个样本都是关键帧（或分片文件），keyframes 保持 None
+
+
+def _mp4_sample_times(track, samples, timescale):
+    """计算指定样本（从 0 开始、升序）的显示时间（秒）"""
+    times = []
+    stts = track.get("stts", [])
+    ctts = track.get("ctts", [])
+    shift = track.get("media_time", 0)
+    run, run_left, dts, current = 0, stts[0][0] if stts else 0, 0, 0
+    c_run, c_first = 0, 0  # 当前 ctts 游程及其第一个样本序号
+    for target in samples:
+        # stts / ctts 都是游程编码，样本升序时各自只需向前推进一次
+        while current < target and run < len(stts):
+            step = min(run_left, target - current)
+            dts += step * stts[run][1]
+            current += step
+            run_left -= step
+            if run_left == 0:
+                run += 1
+                run_left = stts[run][0] if run < len(stts) else 0
+        offset = 0
+        while c_run < len(ctts) and target >= c_first + ctts[c_run][0]:
+            c_first += ctts[c_run][0]
+            c_run += 1
+        if c_run < len(ctts):
+            offset = ctts[c_run][1]
+        times.append(max(0.0, (dts + offset - shift) / timescale))
+    return times
+
+
+def _parse_mp4_box(f, start, end, movie, traks, track):
+    for box_type, payload, payload_size, box_end in _iter_boxes(f, start, end):
+        box_end = min(box_end, end)
+        if box_type == b'trak' or box_type == b'traf':
+            track = {}
+            traks.append(track)
+            _parse_mp4_box(f, payload, box_end, movie, traks, track)
+            continue
+        if box_type in _MP4_CONTAINERS:
+            _parse_mp4_box(f, payload, box_end, movie, traks, track)
+            continue
+        if box_type == b'stsd':
+            # stsd 的 payload 头部之后紧跟第一个样本描述（4 字节大小 + 4 字节格式）
+            f.seek(payload + 8)
+            data = f.read(8)
+            if track is not None and len(data) == 8:
+                entry_size, codec = struct.unpack('>I4s', data)
+                track["codec"] = codec.decode('ascii', errors='replace')
+                # 视频样本描述的固定字段共 78 字节，之后是 avcC / hvcC 等解码器配置
+                entry_end = min(payload + 8 + entry_size, box_end)
+                for sub_type, sub_payload, sub_size, _ in _iter_boxes(f, payload + 8 + 8 + 78, entry_end):
+                    if sub_type in (b'avcC', b'hvcC') and sub_size <= 4096:
+                        f.seek(sub_payload)
+                        track["codec_config"] = f.read(sub_size).hex()
+                        break
+            continue
+        if payload_size > _MAX_META_BOX:
+            continue
+        f.seek(payload)
+        data = f.read(payload_size)
+        if len(data) < payload_size:
+            # 文件截断在这个 box 内部（moov 不在文件开头的 MP4 被截断时常见）
+            movie["truncated"] = True
+            continue
+        try:
+            _parse_mp4_leaf(box_type, data, movie, track)
+        except (struct.error, IndexError):
+            movie["truncated"] = True
+
+
+def _parse_mp4_leaf(box_type, data, movie, track):
+    """解析一个完整读入的叶子 box；数据长度不够时由 struct / 索引抛出异常"""
+    if box_type == b'mvhd':
+        version = data[0]
+        if version == 1:
+            timescale, duration = struct.unpack('>IQ', data[20:32])
+        else:
+            timescale, duration = struct.unpack('>II', data[12:20])
+        movie["timescale"] = timescale
+        movie["duration"] = duration
+    elif box_type == b'trex' and len(data) >= 16:
+        movie["default_sample_duration"] = struct.unpack('>I', data[12:16])[0]
+    elif track is None:
+        return
+    elif box_type == b'tkhd':
+        width, height = struct.unpack('>II', data[-8:])
+        track["width"] = width >> 16
+        track["height"] = height >> 16
+    elif box_type == b'mdhd':
+        version = data[0]
+        if version == 1:
+            timescale, duration = struct.unpack('>IQ', data[20:32])
+        else:
+            timescale, duration = struct.unpack('>II', data[12:20])
+        track["timescale"] = timescale
+        track["media_duration"] = duration
+    elif box_type == b'hdlr':
+        track["handler"] = data[8:12]
+    elif box_type == b'elst':
+        version = data[0]
+        entry_count = struct.unpack('>I', data[4:8])[0]
+        if entry_count:
+            if version == 1:
+                media_time = struct.unpack('>q', data[16:24])[0]
+            else:
+                media_time = struct.unpack('>i', data[12:16])[0]
+            if media_time > 0:
+                track["media_time"] = media_time
+    elif box_type == b'stsz':
+        track["sample_count"] = struct.unpack('>I', data[8:12])[0]
+    elif box_type == b'stts':
+        count = struct.unpack('>I', data[4:8])[0]
+        track["stts"] = [struct.unpack('>II', data[8 + i * 8:16 + i * 8]) for i in range(count)]
+    elif box_type == b'ctts':
+        version = data[0]
+        count = struct.unpack('>I', data[4:8])[0]
+        fmt = '>Ii' if version == 1 else '>II'
+        track["ctts"] = [struct.unpack(fmt, data[8 + i * 8:16 + i * 8]) for i in range(count)]
+    elif box_type == b'stss':
+        count = struct.unpack('>I', data[4:8])[0]
+        track["sync_samples"] = list(struct.unpack(f'>{count}I', data[8:8 + count * 4]))
+    elif box_type in (b'stco', b'co64'):
+        count = struct.unpack('>I', data[4:8])[0]
+        if count:
+            if box_type == b'stco':
+                last = struct.unpack('>I', data[4 + count * 4:8 + count * 4])[0]
+            else:
+                last = struct.unpack('>Q', data[count * 8:8 + count * 8])[0]
+            track["max_chunk_offset"] = last
+    elif box_type == b'tfhd':
+        flags = struct.unpack('>I', data[0:4])[0] & 0xFFFFFF
+        pos = 8 + (8 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0)
+        if flags & 0x8:
+            track["default_duration"] = struct.unpack('>I', data[pos:pos + 4])[0]
+    elif box_type == b'trun':
+        flags = struct.unpack('>I', data[0:4])[0] & 0xFFFFFF
+        count = struct.unpack('>I', data[4:8])[0]
+        track["trun_samples"] = track.get("trun_samples", 0) + count
+        if flags & 0x100:
+            # 每个样本单独记录时长
+            pos = 8 + (4 if flags & 0x1 else 0) + (4 if flags & 0x4 else 0)
+            stride = 4 * bin(flags & 0xF00).count('1')
+            duration = sum(struct.unpack('>I', data[pos + i * stride:pos + i * stride + 4])[0]
+                           for i in range(count))
+        else:
+            duration = count * track.get("default_duration", movie.get("default_sample_duration", 0))
+        track["trun_duration"] = track.get("trun_duration", 0) + duration
+
+
+# -------------------- AVI --------------------
+def _iter_chunks(f, start, end):
+    """遍历 RIFF chunk，产出 (fourcc, list_type 或 None, payload_offset, payload_size)"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(12)
+        if len(header) < 8:
+            return
+        fourcc, size = struct.unpack('<4sI', header[:8])
+        if fourcc in (b'LIST', b'RIFF') and len(header) >= 12:
+            yield fourcc, header[8:12], pos + 12, size - 4
+        else:
+            yield fourcc, None, pos + 8, size
+        pos += 8 + size + (size & 1)
+
+
+def _probe_avi(f, info):
+    file_size = info["size"]
+    f.seek(4)
+    riff_size = struct.unpack('<I', f.read(4))[0]
+    if riff_size + 8 > file_size:
+        info["truncated"] = True
+        info["problems"].append("RIFF 大小超出文件末尾，文件可能被截断")
+    avih = {}
+    strh = {}
+    total_frames_odml = None
+    movi = None
+    idx1 = None
+    for fourcc, list_type, payload, payload_size in _iter_chunks(f, 12, min(file_size, riff_size + 8)):
+        if fourcc == b'LIST' and list_type == b'hdrl':
+            total_frames_odml = _parse_avi_hdrl(f, payload, payload + payload_size, avih, strh)
+        elif fourcc == b'LIST' and list_type == b'movi':
+            movi = (payload, payload_size)
+        elif fourcc == b'idx1':
+            idx1 = (payload, payload_size)
+
+    if not avih:
+        info["problems"].append("缺少 avih 头")
+        return
+    if movi is None:
+        info["truncated"] = True
+        info["problems"].append("缺少 movi 数据块")
+    info["width"] = avih.get("width", 0)
+    info["height"] = avih.get("height", 0)
+    info["codec"] = strh.get("handler")
+    frames = total_frames_odml or strh.get("length") or avih.get("total_frames", 0)
+    if strh.get("scale") and strh.get("rate"):
+        info["fps"] = strh["rate"] / strh["scale"]
+    elif avih.get("usec_per_frame"):
+        info["fps"] = 1e6 / avih["usec_per_frame"]
+
+    if idx1 is not None and movi is not None and idx1[1] <= _MAX_META_BOX:
+        f.seek(idx1[0])
+        data = f.read(idx1[1])
+        keyframes = []
+        video_frames = 0
+        for i in range(len(data) // 16):
+            chunk_id, flags = struct.unpack('<4sI', data[i * 16:i * 16 + 8])
+            if chunk_id[2:4] in (b'dc', b'db'):
+                if flags & _AVIIF_KEYFRAME:
+                    keyframes.append(video_frames)
+                video_frames += 1
+        if video_frames and not total_frames_odml:
+            frames = video_frames
+        if keyframes and len(keyframes) < video_frames:
+            info["keyframes"] = keyframes
+            if info["fps"]:
+                info["keyframe_times"] = [k / info["fps"] for k in keyframes]
+    elif movi is not None and idx1 is None and not total_frames_odml:
+        info["problems"].append("缺少 idx1 索引（录制可能未正常结束）")
+
+    info["frame_count"] = frames
+    if info["fps"]:
+        info["duration"] = frames / info["fps"]
+
+
+def _parse_avi_hdrl(f, start, end, avih, strh):
+    total_frames_odml = None
+    for fourcc, list_type, payload, payload_size in _iter_chunks(f, start, end):
+        f.seek(payload)
+        if fourcc == b'avih' and payload_size >= 40:
+            fields = struct.unpack('<10I', f.read(40))
+            avih["usec_per_frame"] = fields[0]
+            avih["total_frames"] = fields[4]
+            avih["width"] = fields[8]
+            avih["height"] = fields[9]
+        elif fourcc == b'LIST' and list_type == b'strl' and not strh:
+            for sub, _, sub_payload, sub_size in _iter_chunks(f, payload, payload + payload_size):
+                if sub == b'strh' and sub_size >= 36:
+                    f.seek(sub_payload)
+                    data = f.read(36)
+                    if data[0:4] == b'vids':
+                        strh["handler"] = data[4:8].decode('ascii', errors='replace')
+                        strh["scale"], strh["rate"], _, strh["length"] = struct.unpack('<4I', data[20:36])
+        elif fourcc == b'LIST' and list_type == b'odml':
+            for sub, _, sub_payload, sub_size in _iter_chunks(f, payload, payload + payload_size):
+                if sub == b'dmlh' and sub_size >= 4:
+                    f.seek(sub_payload)
+                    total_frames_odml = struct.unpack('<I', f.read(4))[0]
+    return total_frames_odml
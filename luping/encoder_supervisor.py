@@ -0,0 +1,484 @@
+"""
+编码器看门狗：实时编码器崩溃或卡住时切换到新的分段继续录制
+
+ffmpeg 子进程可能中途退出（内存不足被杀、参数错误），原来写入线程只把异常存起来，之后的帧全部丢失。
+EncoderSupervisor 包装 luping.encoders 的编码后端，对写入线程提供同样的 write() / metrics() / stats() / close()：
+
+- 预先启动一个写下一个分段的备用编码器，当前编码器出错时直接换上，不用等新进程启动，
+  换上后再在后台准备下一个备用编码器；连续失败时退避重试，不会反复拉起进程
+- 看门狗线程每个帧间隔检查一次：编码进程已退出，或者某一帧写入阻塞超过 stall_timeout 且编码器
+  没有进度时，强制结束编码进程，阻塞的写入随即出错返回，由写入线程完成切换并重写这一帧
+- 切换期间采集线程照常把帧放进写入队列（内存 + 磁盘溢出），写入线程恢复后按顺序写出
+- 中断的分段截断到最后一个完整的 MP4 分片（实时录制写分片 MP4，见 container.trim_fragmented_mp4），
+  已送入编码器但没能写进完整分片的帧（编码延迟加一个分片，通常不到 1 秒）在新分段开头重新编码：
+  最近 replay_seconds 秒的帧一直保留引用（采集的每一帧都是新数组，不复制画面）；
+  更早、已经无法恢复的帧才用静止画面补齐，成品视频的帧序号与帧时间表保持一致；
+  缺口的帧范围和原因记录在 gaps 中，由录制器写入录制清单
+- 停止后 join_segments() 把各分段以流复制方式拼接为一个普通 MP4（不重新编码）
+
+分段文件：recording_*.mp4（第 0 段）、recording_*.seg001.mp4、recording_*.seg002.mp4 ...
+附加输出（如预览代理）与主输出同进同退，分段文件为 recording_*.proxy.mp4、recording_*.proxy.seg001.mp4 ...
+"""
+import os
+import threading
+import time
+from collections import deque
+from fractions import Fraction
+from pathlib import Path
+
+from luping.container import probe_container, trim_fragmented_mp4
+from luping.ffmpeg_tools import find_ffmpeg, run_ffmpeg
+
+try:
+    import av as _av
+    _av_available = True
+except ImportError:
+    _av = None
+    _av_available = False
+
+DEFAULT_STALL_TIMEOUT = 5.0  # 单帧写入阻塞超过 5 秒且编码器没有进度即判定为卡住
+MAX_RETRY_INTERVAL = 30.0  # 连续启动失败时的最长重试间隔（秒）
+DEFAULT_REPLAY_SECONDS = 1.0  # 保留最近多少秒的帧，编码器崩溃后在新分段重新编码
+
+
+def segment_path_for(output_path, index):
+    """第 index 段的文件路径：第 0 段就是 output_path，之后为 <名称>.seg001<后缀> ..."""
+    output_path = Path(output_path)
+    if index == 0:
+        return output_path
+    return output_path.with_name(f"{output_path.stem}.seg{index:03d}{output_path.suffix}")
+
+
+def _first_line(error):
+    text = str(error).strip()
+    return text.splitlines()[0] if text else type(error).__name__
+
+
+class EncoderSupervisor:
+    """带看门狗和备用编码器的实时编码器
+
+    write() / close() 由单个写入线程调用；metrics() 可以从其他线程调用。
+    """
+
+    def __init__(self, factory, output_path, fps=30.0, stall_timeout=DEFAULT_STALL_TIMEOUT, standby=True,
+                 outputs=(), replay_seconds=DEFAULT_REPLAY_SECONDS):
+        """
+        Args:
+            factory: factory(path, outputs) 启动并返回写入 path（附加输出写入 outputs = [(OutputProfile, 路径)]）
+                的 EncoderBackend，无法启动时抛出 RuntimeError
+            output_path: 第 0 段的输出文件（拼接后的成品也写到这里）
+            fps: 帧率，看门狗每个帧间隔检查一次
+            stall_timeout: 单帧写入阻塞超过该秒数且编码器没有进度时判定为卡住
+            standby: 预先启动备用编码器（切换时不用等待新编码器启动）
+            outputs: 附加输出 [(OutputProfile, 拼接后的成品路径)]
+            replay_seconds: 保留最近多少秒的帧（只是引用，1080p 下 1 秒约 180 MB），编码器崩溃时
+                已送入但没能保存的帧在这个范围内的重新编码，更早的用静止画面补齐；0 表示不保留
+        """
+        self.factory = factory
+        self.output_path = Path(output_path)
+        self.outputs = [(profile, Path(path)) for profile, path in outputs]
+        self.fps = float(fps)
+        self.stall_timeout = stall_timeout
+        self.standby = standby
+        self.encoder = None  # 当前编码器（close() 后保留最后一个，供 stats() 使用）
+        self.profile = None
+        self.frames = 0  # 交给 write() 的帧数（即帧时间表中的帧数）
+        self.segments = []  # 每段：index, file, outputs, backend, start_frame, frame_count, end
+        self.gaps = []  # 每个缺口：start_frame, frame_count, reason, filled
+        self.restarts = 0
+        self._live_keyframes = True
+        self._segment = None
+        self._next_index = 0
+        self._standby = None  # (分段序号, 已启动的编码器)
+        self._standby_thread = None
+        self._failures = 0  # 连续失败次数（分段正常写够 1 秒后清零）
+        self._retry_at = 0.0
+        self._failure = None  # 看门狗或写入发现的故障原因，下一次 write() 据此切换
+        self._write_started = None  # 正在进行的 write() 的开始时间（看门狗据此判断卡住）
+        self._last_frame = None
+        self._recent = deque(maxlen=max(0, int(round(replay_seconds * self.fps))))  # (帧序号, 画面)
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._watchdog = None
+
+    # 与 EncoderBackend 相同的只读属性，录制器无需区分
+    @property
+    def name(self):
+        return self.encoder.name if self.encoder is not None else None
+
+    @property
+    def live_keyframes(self):
+        """所有分段都在编码时插入了交互关键帧"""
+        return self._live_keyframes
+
+    @property
+    def fragmented(self):
+        return self.encoder is not None and self.encoder.fragmented
+
+    def start(self):
+        """启动第 0 段的编码器、看门狗和备用编码器
+
+        Raises:
+            RuntimeError: 编码器无法启动
+        """
+        encoder = self._start_encoder(0)
+        self._next_index = 1
+        self._begin_segment(0, encoder)
+        self.profile = dict(encoder.profile)
+        self._watchdog = threading.Thread(target=self._watch, name="encoder-watchdog", daemon=True)
+        self._watchdog.start()
+        self._prepare_standby()
+        return self
+
+    def write(self, img):
+        """写入一帧；编码器出错时切换到新分段重写这一帧，仍然失败时这一帧计入缺口"""
+        if self._recent.maxlen:
+            self._recent.append((self.frames, img))
+        for _attempt in range(2):
+            if self.encoder is None or self._failure is not None:
+                if not self._switch(self._failure or "编码器未运行", img):
+                    break
+            encoder = self.encoder
+            try:
+                self._write_started = time.monotonic()
+                encoder.write(img)
+            except Exception as e:
+                with self._lock:
+                    self._failure = self._failure or _first_line(e)
+                print(f"✗ 编码器出错（第 {encoder.first_frame + encoder.frames} 帧）: {e}")
+                continue
+            finally:
+                self._write_started = None
+            self._last_frame = img
+            if self._failures and encoder.frames >= self.fps:
+                self._failures = 0
+            break
+        self.frames += 1
+
+    def metrics(self):
+        """当前编码器的实时指标，另加当前分段序号、重启次数和缺口帧数"""
+        encoder = self.encoder
+        metrics = encoder.metrics() if encoder is not None else {"frames_in": 0, "error": self._failure}
+        segment = self._segment
+        metrics.update({
+            "segment": segment["index"] if segment else None,
+            "restarts": self.restarts,
+            "gap_frames": sum(g["frame_count"] for g in self.gaps),
+        })
+        return metrics
+
+    def stats(self):
+        """最后一个编码器的写入统计，另加分段数、重启次数和缺口帧数"""
+        stats = self.encoder.stats() if self.encoder is not None else {"frames": 0}
+        stats.update({
+            "segments": len(self.segments),
+            "restarts": self.restarts,
+            "gap_frames": sum(g["frame_count"] for g in self.gaps),
+        })
+        return stats
+
+    def close(self):
+        """关闭当前编码器，停止看门狗并丢弃备用编码器"""
+        self._closed.set()
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=2)
+        if self._standby_thread is not None:
+            self._standby_thread.join(timeout=10)
+        with self._lock:
+            standby, self._standby = self._standby, None
+        if standby is not None:
+            self._discard(standby[1])
+        encoder = self.encoder
+        if encoder is not None and self._segment is not None and self._segment["end"] is None:
+            if self._failure is None:
+                encoder.close()
+                self._segment["frame_count"] = encoder.frames
+                self._segment["end"] = "closed"
+            else:
+                self._retire(encoder, self._failure)
+        # 最后一段中断后再也没有编码器可用时，剩下的帧没有写入任何分段
+        saved = self._video_frames()
+        if self.frames > saved:
+            self.gaps.append({"start_frame": saved, "frame_count": self.frames - saved,
+                              "reason": self._failure or "编码器未运行", "filled": False})
+        return self.stats()
+
+    def segment_files(self, output_path=None):
+        """保存了帧的分段文件（按顺序）；output_path 为附加输出的成品路径时返回该输出的分段"""
+        output_path = self.output_path if output_path is None else Path(output_path)
+        return [segment_path_for(output_path, s["index"]) for s in self.segments if s["frame_count"] > 0]
+
+    def output_segments(self, output_path):
+        """附加输出保存了帧的分段文件及其应占的时长 [(路径, 秒)]：时长取主输出对应分段的帧数 / fps，
+        附加输出的某一段文件不存在时，它的时长并入前一段"""
+        entries = []
+        for segment in self.segments:
+            if segment["frame_count"] <= 0:
+                continue
+            path = segment_path_for(output_path, segment["index"])
+            duration = segment["frame_count"] / self.fps
+            if path.exists():
+                entries.append([path, duration])
+            elif entries:
+                entries[-1][1] += duration
+        return [tuple(entry) for entry in entries]
+
+    # -------------------- 内部实现 --------------------
+    def _start_encoder(self, index):
+        outputs = [(profile, segment_path_for(path, index)) for profile, path in self.outputs]
+        return self.factory(segment_path_for(self.output_path, index), outputs)
+
+    def _video_frames(self):
+        """已保存在各分段中的帧数（含补齐的帧）"""
+        return sum(self.encoder.frames if s["end"] is None else s["frame_count"] for s in self.segments)
+
+    def _begin_segment(self, index, encoder):
+        start = self._video_frames() if self.segments else 0
+        encoder.first_frame = start
+        self._segment = {"index": index, "file": encoder.output_path.name,
+                         "outputs": {profile.name: path.name for profile, path in encoder.outputs},
+                         "backend": encoder.name,
+                         "start_frame": start, "frame_count": 0, "end": None}
+        self.segments.append(self._segment)
+        self._live_keyframes = self._live_keyframes and encoder.live_keyframes
+        with self._lock:
+            self.encoder = encoder
+            self._failure = None
+
+    def _switch(self, reason, img):
+        """结束出错的编码器，换上备用编码器（或新启动一个），并补齐丢失的帧；返回是否有可用的编码器"""
+        old = self.encoder
+        if old is not None and self._segment["end"] is None:
+            self._retire(old, reason)
+            self._failures += 1
+            delay = min(MAX_RETRY_INTERVAL, 2.0 ** (self._failures - 1)) if self._failures > 1 else 0.0
+            self._retry_at = time.monotonic() + delay
+        with self._lock:
+            standby, self._standby = self._standby, None
+        if standby is not None and not standby[1].alive():
+            self._discard(standby[1])
+            standby = None
+        if standby is None:
+            if time.monotonic() < self._retry_at or self._closed.is_set():
+                return False
+            index = self._next_index
+            self._next_index += 1
+            try:
+                encoder = self._start_encoder(index)
+            except Exception as e:
+                self._failures += 1
+                self._retry_at = time.monotonic() + min(MAX_RETRY_INTERVAL, 2.0 ** (self._failures - 1))
+                print(f"✗ 无法启动新的编码器: {_first_line(e)}，{self._retry_at - time.monotonic():.0f} 秒后重试")
+                return False
+        else:
+            index, encoder = standby
+        self.restarts += 1
+        self._begin_segment(index, encoder)
+        start = encoder.first_frame
+        missing = self.frames - start
+        print(f"✓ 已切换到新分段 {encoder.output_path.name}（{encoder.name}），从第 {start} 帧继续")
+        if missing > 0:
+            # 还保留着的帧重新编码；更早的帧已经无法恢复，用能找到的最近画面补齐，保持帧序号与帧时间表一致
+            replay = [frame for index, frame in self._recent if start <= index < self.frames]
+            lost = missing - len(replay)
+            if lost > 0:
+                filler = replay[0] if replay else (self._last_frame if self._last_frame is not None else img)
+                self.gaps.append({"start_frame": start, "frame_count": lost, "reason": reason, "filled": True})
+                print(f"⚠️ 第 {start}-{start + lost - 1} 帧（{lost} 帧）没能保存，以静止画面补齐")
+            if replay:
+                self._segment["replayed"] = len(replay)
+                print(f"✓ 第 {start + lost}-{self.frames - 1} 帧（{len(replay)} 帧）在新分段重新编码")
+            try:
+                for _ in range(lost):
+                    encoder.write(filler)
+                for frame in replay:
+                    encoder.write(frame)
+            except Exception as e:
+                with self._lock:
+                    self._failure = _first_line(e)
+                print(f"✗ 新分段补齐缺口时出错: {e}")
+                return False
+        if self._failures <= 1:
+            self._prepare_standby()
+        return True
+
+    def _retire(self, encoder, reason):
+        """结束出错的编码器，确定分段中实际保存下来的帧数"""
+        clean = encoder.abort()
+        sent = encoder.frames
+        saved = sent if clean else self._saved_frames(encoder)
+        segment = self._segment
+        segment["frame_count"] = min(sent, saved)
+        segment["frames_sent"] = sent
+        segment["end"] = reason
+        print(f"⚠️ 分段 {segment['file']} 中断（{reason}），保存了 {segment['frame_count']}/{sent} 帧")
+        for _profile, path in encoder.outputs:
+            # 附加输出同样截掉写了一半的分片；它们的帧数不影响主输出的帧序号
+            try:
+                if path.exists():
+                    trim_fragmented_mp4(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _saved_frames(encoder):
+        """编码器异常结束后输出文件中可以完整解码的帧数"""
+        path = encoder.output_path
+        if not path.exists():
+            return 0
+        try:
+            # 分片 MP4：截掉只写了一半的分片和显示时间不连续的尾部
+            kept = trim_fragmented_mp4(path)
+            if kept is not None:
+                return kept
+            info = probe_container(path)
+            if info["format"] != "unknown":
+                return 0 if info["truncated"] else info["frame_count"]
+        except OSError:
+            return 0
+        # 其他容器（无损 MKV 中间文件）数一遍能读出的视频包
+        ffmpeg_path = find_ffmpeg()
+        if ffmpeg_path:
+            try:
+                result = run_ffmpeg(['-v', 'error', '-i', path, '-map', '0:v:0', '-c', 'copy', '-f', 'null', '-',
+                                     '-progress', 'pipe:1'], timeout=600, ffmpeg_path=ffmpeg_path)
+                counts = [line[6:] for line in result.stdout.splitlines() if line.startswith('frame=')]
+                if counts and counts[-1].strip().isdigit():
+                    return int(counts[-1])
+            except Exception:
+                pass
+        return encoder.metrics().get("frames_encoded") or 0
+
+    def _prepare_standby(self):
+        if not self.standby or self._closed.is_set():
+            return
+        if self._standby_thread is not None and self._standby_thread.is_alive():
+            return
+        index = self._next_index
+        self._next_index += 1
+        self._standby_thread = threading.Thread(target=self._start_standby, args=(index,),
+                                                name="encoder-standby", daemon=True)
+        self._standby_thread.start()
+
+    def _start_standby(self, index):
+        try:
+            encoder = self._start_encoder(index)
+        except Exception as e:
+            print(f"⚠️ 备用编码器启动失败（出错时将临时启动）: {_first_line(e)}")
+            return
+        with self._lock:
+            if not self._closed.is_set():
+                self._standby = (index, encoder)
+                return
+        self._discard(encoder)
+
+    @staticmethod
+    def _discard(encoder):
+        """丢弃没有用上的编码器和它的空输出文件"""
+        encoder.abort()
+        try:
+            encoder.output_path.unlink()
+        except OSError:
+            pass
+
+    def _watch(self):
+        """看门狗：发现编码进程退出或写入卡住时标记故障，卡住时强制结束编码进程"""
+        interval = max(0.01, min(0.5, 1.0 / self.fps))
+        while not self._closed.wait(interval):
+            encoder = self.encoder
+            if encoder is None or self._failure is not None:
+                continue
+            reason = None
+            if not encoder.alive():
+                reason = "编码进程已退出"
+            else:
+                started = self._write_started
+                if started is not None and time.monotonic() - started > self.stall_timeout:
+                    age = encoder.metrics().get("age")
+                    if age is None or age > self.stall_timeout:
+                        reason = f"编码器卡住（单帧写入超过 {self.stall_timeout:g} 秒没有进展）"
+            if reason is None:
+                continue
+            with self._lock:
+                if encoder is not self.encoder or self._failure is not None:
+                    continue  # 写入线程已经换了编码器
+                self._failure = reason
+            print(f"✗ 看门狗: {encoder.output_path.name} {reason}")
+            encoder.kill()
+
+
+def join_segments(paths, output_path, durations=None):
+    """把同样编码参数的分段以流复制方式拼接为普通 MP4 / MKV（原子替换 output_path），返回拼接后的文件
+
+    output_path 可以是其中一个分段（第 0 段）。有 ffmpeg 时用 concat 分离器，否则用 PyAV 重新封装。
+    durations 给出每段应占的时长（秒）时，下一段从前面各段时长之和处开始，而不是紧接上一段的最后一帧：
+    附加输出的分段比主输出少保存了尾部时，用主输出的分段时长对齐，缺少的部分停留在最后一帧。
+
+    Raises:
+        RuntimeError: 拼接失败或没有可用的工具
+    """
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.stem + ".join.tmp" + output_path.suffix)
+    ffmpeg_path = find_ffmpeg()
+    if ffmpeg_path:
+        list_path = output_path.with_name(output_path.stem + ".segments.txt")
+        lines = []
+        for i, path in enumerate(paths):
+            escaped = Path(path).absolute().as_posix().replace("'", "'\\''")
+            lines.append(f"file '{escaped}'\n")
+            if durations is not None and durations[i] is not None:
+                lines.append(f"duration {durations[i]:.6f}\n")
+        list_path.write_text("".join(lines), encoding='utf-8')
+        try:
+            result = run_ffmpeg(['-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path,
+                                 '-map', '0:v', '-c', 'copy', tmp_path], timeout=3600, ffmpeg_path=ffmpeg_path)
+        finally:
+            list_path.unlink(missing_ok=True)
+        if result.returncode != 0:
+            tmp_path.unlink(missing_ok=True)
+            raise RuntimeError(f"拼接分段失败: {result.stderr.strip()[-500:]}")
+    elif _av_available:
+        try:
+            _join_with_pyav(paths, tmp_path, durations)
+        except Exception as e:
+            tmp_path.unlink(missing_ok=True)
+            raise RuntimeError(f"拼接分段失败: {e}")
+    else:
+        raise RuntimeError("拼接分段需要 ffmpeg 或 PyAV")
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _join_with_pyav(paths, output_path, durations=None):
+    """用 PyAV 依次重新封装各分段的视频包，时间戳按前面分段的总时长（或 durations 给出的时长）后移"""
+    with _av.open(str(output_path), mode='w') as output:
+        out_stream = None
+        origin = None  # 第一段第一帧的时间（秒，编码器延迟产生的起始偏移）
+        offset = Fraction(0)  # 已拼接部分的时长（秒）
+        for i, path in enumerate(paths):
+            with _av.open(str(path)) as source:
+                stream = source.streams.video[0]
+                if out_stream is None:
+                    out_stream = output.add_stream_from_template(stream)
+                time_base = stream.time_base
+                first = end = shift = None
+                for packet in source.demux(stream):
+                    if packet.dts is None:
+                        continue  # 分离器结束时产出的空包
+                    if first is None:
+                        # 第一个包是关键帧，显示时间最早
+                        first = packet.pts if packet.pts is not None else packet.dts
+                        if origin is None:
+                            origin = first * time_base
+                        shift = int((origin + offset) / time_base) - first
+                        end = first
+                    if packet.pts is not None:
+                        end = max(end, packet.pts + (packet.duration or 0))
+                        packet.pts += shift
+                    packet.dts += shift
+                    packet.stream = out_stream
+                    output.mux(packet)
+                if durations is not None and durations[i] is not None:
+                    offset += Fraction(durations[i]).limit_denominator(1000000)
+                elif first is not None:
+                    offset += (end - first) * time_base
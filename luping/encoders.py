@@ -0,0 +1,741 @@
+"""
+实时编码后端
+
+PipeEncoderBackend   启动 ffmpeg 子进程，把原始 BGR 帧写入其 stdin（需要 ffmpeg 命令行程序）
+PyAVEncoderBackend   通过 PyAV（libav 的 Python 绑定）在进程内编码：numpy 帧直接交给编码器，
+                     不经过管道拷贝；每帧显式设置 PTS，交互关键帧在编码时实时插入，不需要事后重新编码。
+                     只依赖 av 包自带的 libav，没有 ffmpeg 命令行程序也能录制
+
+两个后端使用相同的编码参数（libx264 veryfast / yuv420p，无损模式为 Ut Video 或 FFV1），输出文件可以互换。
+create_encoder() 按优先级（已安装 PyAV 时优先进程内编码；无损模式优先管道）依次尝试，第一个成功启动的后端即为本次录制使用的后端：
+
+    encoder = create_encoder(path, 1920, 1080, fps=30.0, keyframes=scheduler)
+    encoder.write(img)
+    encoder.close()
+
+同一路采集帧可以同时编码为多个输出（例如全画质存档加 720p / 5 fps 的预览代理），每个附加输出由 OutputProfile
+描述自己的分辨率、帧率和画质。管道后端在一个 ffmpeg 进程里用 split 滤镜分流，帧只经管道写入一次；
+PyAV 后端把同一块帧内存交给各输出的编码器，缩小后的代理帧才另外生成：
+
+    outputs = [(PROXY_PROFILE, PROXY_PROFILE.path_for(path))]
+    encoder = create_encoder(path, 1920, 1080, fps=30.0, outputs=outputs)
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from fractions import Fraction
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from luping.ffmpeg_tools import find_ffmpeg, nice_command
+from luping.transcode_queue import lossless_encode_args
+
+try:
+    import fcntl as _fcntl
+except ImportError:
+    _fcntl = None
+
+try:
+    import av as _av
+    _av_available = True
+except ImportError:
+    _av = None
+    _av_available = False
+
+LIVE_ENCODER = {"codec": "libx264", "preset": "veryfast", "pix_fmt": "yuv420p"}
+BACKEND_ORDER = ("pyav", "pipe")
+# 无损模式优先管道：进程内只能用 FFV1（见 PyAVEncoderBackend），而管道后端的 Ut Video 编码快得多
+LOSSLESS_BACKEND_ORDER = ("pipe", "pyav")
+LATENCY_WINDOW = 1800  # 单帧耗时分布统计最近 1800 帧（30fps 下 1 分钟）
+STDERR_TAIL_LINES = 50  # 保留 ffmpeg stderr 的最后 50 行用于诊断
+# 分片 MP4：每个关键帧或每 1 秒开始一个 moof + mdat 分片，写完立即刷到磁盘（flush_packets），
+# 编码进程被强制结束时已写完的分片仍可播放
+FRAGMENT_MOVFLAGS = "+frag_keyframe+empty_moov+default_base_moof"
+FRAGMENT_DURATION_US = 250000
+# -progress 输出中转为数值的字段
+_PROGRESS_NUMBERS = {"frame": int, "fps": float, "dup_frames": int, "drop_frames": int, "total_size": int,
+                     "out_time_us": int}
+_F_SETPIPE_SZ = getattr(_fcntl, "F_SETPIPE_SZ", 1031)
+_F_GETPIPE_SZ = getattr(_fcntl, "F_GETPIPE_SZ", 1032)
+
+
+class OutputProfile:
+    """附加输出的编码参数：与主输出共用同一路采集帧，可以有自己的分辨率、帧率和画质"""
+
+    def __init__(self, name, height=None, fps=None, codec="libx264", preset="veryfast", crf=23,
+                 pix_fmt="yuv420p", bitrate=None):
+        """
+        Args:
+            name: 输出名称，也是文件名后缀（recording_*.<name>.mp4）
+            height: 输出高度，按比例缩放宽度；None 或不小于输入高度时保持原尺寸（不放大）
+            fps: 输出帧率，None 或不小于输入帧率时保持输入帧率
+            codec, preset, crf, pix_fmt: 编码参数
+            bitrate: 目标码率（如 "2500k"），设置后按码率（VBV 限制峰值）而不是 crf 编码
+        """
+        self.name = name
+        self.height = height
+        self.fps = fps
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.pix_fmt = pix_fmt
+        self.bitrate = bitrate
+
+    def rate_options(self):
+        """码率控制参数（libav 编码器选项）：设置了 bitrate 时为 b / maxrate / bufsize，否则为 crf"""
+        if not self.bitrate:
+            return {"crf": str(self.crf)}
+        bits = parse_bitrate(self.bitrate)
+        return {"b": str(bits), "maxrate": str(bits), "bufsize": str(bits * 2)}
+
+    def rate_args(self, stream=None):
+        """码率控制的 ffmpeg 命令行参数；stream 为输出流序号时只作用于该流（如 -b:v:1）"""
+        spec = "v" if stream is None else f"v:{stream}"
+        args = []
+        for key, value in self.rate_options().items():
+            args += [f'-{key}:{spec}', value]
+        return args
+
+    def size_for(self, width, height):
+        """输入 width x height 时的输出尺寸（宽高取偶数，满足 yuv420p 的要求）"""
+        if self.height and self.height < height:
+            width, height = width * self.height / height, self.height
+        width, height = int(round(width)), int(height)
+        return max(2, width - width % 2), max(2, height - height % 2)
+
+    def fps_for(self, fps):
+        """输入帧率为 fps 时的输出帧率"""
+        return min(float(self.fps), fps) if self.fps else fps
+
+    def path_for(self, video_path):
+        """与主输出 video_path 对应的文件：recording_*.mp4 -> recording_*.<name>.mp4"""
+        video_path = Path(video_path)
+        return video_path.with_name(f"{video_path.stem}.{self.name}.mp4")
+
+    def to_dict(self):
+        return {"name": self.name, "height": self.height, "fps": self.fps, "codec": self.codec,
+                "preset": self.preset, "crf": self.crf, "pix_fmt": self.pix_fmt, "bitrate": self.bitrate}
+
+
+# 快速回看用的预览代理：720p、5 fps，画质略低
+PROXY_PROFILE = OutputProfile("proxy", height=720, fps=5, crf=28)
+
+
+def parse_bitrate(value):
+    """码率字符串（"2500k"、"4M" 或整数）转为 bit/s"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def percentile(sorted_values, pct):
+    """最近秩法计算百分位（输入需已排序），编码器、插件和基准测试工具共用"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class EncoderBackend:
+    """实时编码后端接口
+
+    子类实现 _open / _encode / _finish；write() 由单个写入线程逐帧调用。
+    """
+
+    name = None
+    live_keyframes = False  # 是否在编码时按 KeyframeScheduler 的请求实时插入关键帧
+
+    def __init__(self, output_path, width, height, fps=30.0, lossless=False, keyframes=None, fragmented=False,
+                 outputs=()):
+        """
+        Args:
+            output_path: 输出文件（主输出，全分辨率、全帧率）
+            width, height: 帧尺寸（BGR24）
+            fps: 输入帧率（第 i 帧的时间戳为 i / fps）
+            lossless: 写无损中间文件
+            keyframes: KeyframeScheduler，支持实时关键帧的后端据此插入关键帧
+            fragmented: MP4 输出写成分片 MP4（见 FRAGMENT_MOVFLAGS），进程崩溃后已写完的部分仍可读取
+            outputs: 附加输出 [(OutputProfile, 文件路径)]，与主输出共用输入帧
+        """
+        self.output_path = Path(output_path)
+        self.width = int(width)
+        self.height = int(height)
+        self.fps = float(fps)
+        self.lossless = lossless
+        self.keyframes = keyframes
+        self.fragmented = fragmented and not lossless
+        self.outputs = [(profile, Path(path)) for profile, path in outputs]
+        self.first_frame = 0  # 本编码器的第一帧在整个录制中的帧序号（分段录制时由 EncoderSupervisor 设置）
+        self.frames = 0
+        self.profile = None  # 写入录制清单的编码参数
+        self.error = None  # 编码器报告的第一个错误
+        self.bytes_in = 0
+        self._write_seconds = 0.0
+        self._max_write = 0.0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    @classmethod
+    def available(cls):
+        """当前环境能否使用该后端"""
+        return False
+
+    def start(self):
+        """启动编码器
+
+        Raises:
+            RuntimeError: 无法启动
+        """
+        self._open()
+        return self
+
+    def write(self, img):
+        """编码一帧 BGR 图像"""
+        if img.dtype != np.uint8:
+            img = img.astype(np.uint8)
+        if not img.flags['C_CONTIGUOUS']:
+            img = np.ascontiguousarray(img)
+        start = time.perf_counter()
+        self._encode(img)
+        elapsed = time.perf_counter() - start
+        self._write_seconds += elapsed
+        self._max_write = max(self._max_write, elapsed)
+        self._latencies.append(elapsed)
+        self.bytes_in += img.nbytes
+        self.frames += 1
+
+    def _outputs_profile(self):
+        """附加输出写入录制清单的参数"""
+        entries = []
+        for profile, path in self.outputs:
+            width, height = profile.size_for(self.width, self.height)
+            entries.append({**profile.to_dict(), "width": width, "height": height,
+                            "fps": profile.fps_for(self.fps), "file": path.name})
+        return entries
+
+    def metrics(self):
+        """实时编码指标（录制过程中可随时调用）"""
+        return {"frames_in": self.frames, "error": self.error}
+
+    def stats(self):
+        """写入统计：帧数、输入字节数、吞吐量（GB/s，按 write() 耗时计算）和单帧耗时分布（毫秒）"""
+        values = sorted(self._latencies)
+        return {
+            "frames": self.frames,
+            "bytes": self.bytes_in,
+            "throughput_gbps": round(self.bytes_in / self._write_seconds / 1e9, 3) if self._write_seconds else None,
+            "write_p50_ms": round(percentile(values, 50) * 1000, 3),
+            "write_p99_ms": round(percentile(values, 99) * 1000, 3),
+            "write_max_ms": round(self._max_write * 1000, 3),
+        }
+
+    def close(self):
+        """写完剩余数据并关闭输出"""
+        self._finish()
+
+    def alive(self):
+        """编码器是否仍在运行（可以从其他线程调用）"""
+        return True
+
+    def kill(self):
+        """强制结束编码器，让阻塞中的 write() 出错返回（可以从其他线程调用）"""
+
+    def abort(self):
+        """编码器已出错或被结束后释放资源，返回已送入的帧是否都完整写出"""
+        try:
+            self._finish()
+            return True
+        except Exception:
+            return False
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _encode(self, img):
+        raise NotImplementedError
+
+    def _finish(self):
+        raise NotImplementedError
+
+
+class PipeEncoderBackend(EncoderBackend):
+    """ffmpeg 子进程，原始帧通过 stdin 管道传入
+
+    Linux 默认管道只有 64 KiB，一帧 8-33 MB 的画面要被拆成数百次写入和上下文切换。
+    启动后用 F_SETPIPE_SZ 把管道扩大到一帧大小（受 /proc/sys/fs/pipe-max-size 限制），
+    写入时不经过 Python 的缓冲层，直接对帧内存的 memoryview 循环 os.write，处理部分写入，不复制帧数据。
+
+    ffmpeg 以 -progress 把进度写到单独的管道（POSIX 上是额外传入的 fd，Windows 上是 stdout），
+    读取线程实时解析编码帧数、编码 fps、速度、码率和重复 / 丢弃帧数，metrics() 随时可取；
+    另一个线程读取 stderr，保留最后几十行，出现错误时立即打印，写入失败时附在异常信息里。
+    """
+
+    name = "ffmpeg_pipe"
+    nice = 0  # 子进程的 nice 值（> 0 时以较低优先级运行，让出 CPU 给采集和主编码）
+
+    def __init__(self, *args, ffmpeg_path=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ffmpeg_path = ffmpeg_path
+        self.proc = None
+        self.stdin = None
+        self.pipe_size = None
+        self._fd = None
+        self._syscalls = 0
+        self._partial_writes = 0
+        self.progress = {}  # 最近一次 -progress 报告
+        self.stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        self._readers = []
+
+    @classmethod
+    def available(cls):
+        return find_ffmpeg() is not None
+
+    def _command(self, ffmpeg_path):
+        """ffmpeg 命令行（不含 -progress 等公共参数），同时设置 self.profile"""
+        if self.lossless:
+            codec_args = lossless_encode_args(ffmpeg_path)
+        else:
+            codec_args = ['-c:v', LIVE_ENCODER["codec"], '-pix_fmt', LIVE_ENCODER["pix_fmt"],
+                          '-preset', LIVE_ENCODER["preset"]]
+        gop = None
+        if self.keyframes is not None and not self.lossless:
+            # 管道无法在编码中途接收关键帧请求：缩短 GOP 到强制关键帧的最小间隔，
+            # 跳转到任一交互位置最多从前 min_interval 秒的关键帧开始解码
+            gop = max(1, int(round(self.fps * self.keyframes.min_interval)))
+            codec_args += ['-g', str(gop)]
+        cmd = [
+            ffmpeg_path,
+            '-y',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-s', f'{self.width}x{self.height}',
+            '-r', f'{self.fps:g}',  # 输入帧率
+            '-i', '-',
+        ]
+        fragment_args = []
+        if self.fragmented:
+            fragment_args = ['-movflags', FRAGMENT_MOVFLAGS, '-frag_duration', str(FRAGMENT_DURATION_US),
+                             '-flush_packets', '1']
+        if self.outputs:
+            # split 只增加帧的引用计数，不复制画面；代理输出先降帧率再缩放，只缩放保留下来的帧
+            labels = "".join(f"[s{i}]" for i in range(len(self.outputs)))
+            graph = [f"[0:v]split={len(self.outputs) + 1}[main]{labels}"]
+            for i, (profile, _path) in enumerate(self.outputs):
+                filters = []
+                fps = profile.fps_for(self.fps)
+                if fps < self.fps:
+                    filters.append(f"fps={fps:g}")
+                width, height = profile.size_for(self.width, self.height)
+                if (width, height) != (self.width, self.height):
+                    filters.append(f"scale={width}:{height}:flags=area")
+                graph.append(f"[s{i}]{','.join(filters) or 'null'}[o{i}]")
+            cmd += ['-filter_complex', ";".join(graph), '-map', '[main]']
+        cmd += codec_args + [
+            '-r', f'{self.fps:g}',  # 输出帧率，确保与输入一致
+        ] + fragment_args + [str(self.output_path.absolute())]
+        for i, (profile, path) in enumerate(self.outputs):
+            cmd += ['-map', f'[o{i}]', '-c:v', profile.codec, '-pix_fmt', profile.pix_fmt,
+                    '-preset', profile.preset] + profile.rate_args()
+            if path.suffix.lower() == '.mp4':
+                cmd += fragment_args
+            cmd.append(str(path.absolute()))
+        if self.lossless:
+            self.profile = {"backend": self.name, "codec": codec_args[1], "lossless": True, "input_fps": self.fps}
+        else:
+            self.profile = {"backend": self.name, **LIVE_ENCODER, "input_fps": self.fps}
+            if gop is not None:
+                self.profile["gop"] = gop
+        if self.outputs:
+            self.profile["outputs"] = self._outputs_profile()
+        return cmd
+
+    def _open(self):
+        ffmpeg_path = self.ffmpeg_path or find_ffmpeg()
+        if not ffmpeg_path:
+            raise RuntimeError("未找到 ffmpeg 可执行文件")
+        cmd = self._command(ffmpeg_path)
+        # stdin 用 PIPE 接收帧数据（不缓冲，直接写 fd）；stderr 只输出警告和错误，由读取线程持续读走避免阻塞
+        kwargs = {'stdin': subprocess.PIPE, 'stdout': subprocess.DEVNULL, 'stderr': subprocess.PIPE, 'bufsize': 0}
+        progress_read = progress_write = None
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+            if self.nice > 0:
+                kwargs['creationflags'] |= subprocess.BELOW_NORMAL_PRIORITY_CLASS
+            kwargs['stdout'] = subprocess.PIPE
+            progress_target = 'pipe:1'
+        else:
+            progress_read, progress_write = os.pipe()
+            kwargs['pass_fds'] = (progress_write,)
+            progress_target = f'pipe:{progress_write}'
+        cmd[1:1] = ['-hide_banner', '-nostats', '-loglevel', 'warning', '-progress', progress_target]
+        # 不用 preexec_fn 降优先级：采集、写入和监听线程都在运行，fork 后执行 Python 代码可能死锁
+        cmd = nice_command(cmd, self.nice)
+        print(f"启动 FFmpeg: {' '.join(cmd)}")
+        try:
+            self.proc = subprocess.Popen(cmd, **kwargs)
+        except OSError as e:
+            if progress_read is not None:
+                os.close(progress_read)
+            raise RuntimeError(f"无法启动 FFmpeg 进程: {e}")
+        finally:
+            if progress_write is not None:
+                os.close(progress_write)
+        progress_stream = self.proc.stdout if progress_read is None else open(progress_read, 'rb')
+        self._start_reader(self._read_progress, progress_stream, "ffmpeg-progress")
+        self._start_reader(self._read_stderr, self.proc.stderr, "ffmpeg-stderr")
+        self.stdin = self.proc.stdin
+        self._fd = self.stdin.fileno()
+        self.pipe_size = self._grow_pipe(self._fd, self.width * self.height * 3)
+
+    @staticmethod
+    def _grow_pipe(fd, want):
+        """尽量把管道扩大到 want 字节，返回实际大小（不支持时返回 None）"""
+        if _fcntl is None or not sys.platform.startswith('linux'):
+            return None
+        try:
+            with open('/proc/sys/fs/pipe-max-size') as f:
+                size = min(want, int(f.read()))
+        except (OSError, ValueError):
+            size = want
+        while size > 65536:
+            try:
+                return _fcntl.fcntl(fd, _F_SETPIPE_SZ, size)
+            except OSError:
+                size //= 2  # 超出当前用户的管道内存配额时逐步减小
+        try:
+            return _fcntl.fcntl(fd, _F_GETPIPE_SZ)
+        except OSError:
+            return None
+
+    def _start_reader(self, target, stream, name):
+        thread = threading.Thread(target=target, args=(stream,), name=name, daemon=True)
+        thread.start()
+        self._readers.append(thread)
+
+    def _read_progress(self, stream):
+        """解析 -progress 输出：key=value 行，每组以 progress=continue / end 结束"""
+        block = {}
+        with stream:
+            for raw in stream:
+                key, _, value = raw.decode('utf-8', 'replace').strip().partition('=')
+                value = value.strip()
+                if key in _PROGRESS_NUMBERS:
+                    try:
+                        value = _PROGRESS_NUMBERS[key](value)
+                    except ValueError:
+                        value = None
+                elif key == "speed":
+                    value = float(value[:-1]) if value.endswith('x') and value[:-1].strip() else None
+                block[key] = value
+                if key == "progress":
+                    block["updated"] = time.monotonic()
+                    self.progress = block
+                    block = {}
+
+    def _read_stderr(self, stream):
+        with stream:
+            for raw in stream:
+                line = raw.decode('utf-8', 'replace').rstrip()
+                if not line:
+                    continue
+                self.stderr_tail.append(line)
+                if self.error is None and 'error' in line.lower():
+                    self.error = line
+                    print(f"✗ FFmpeg 报错: {line}")
+
+    def _diagnostics(self):
+        return "\n".join(self.stderr_tail) or "（stderr 无输出）"
+
+    def _encode(self, img):
+        if self._fd is None:
+            raise RuntimeError("FFmpeg stdin 未打开")
+        # 直接写帧内存（BGR24），os.write 可能只写入一部分，循环写完剩余部分
+        view = memoryview(img).cast('B')
+        try:
+            while view:
+                written = os.write(self._fd, view)
+                self._syscalls += 1
+                if written < len(view):
+                    self._partial_writes += 1
+                view = view[written:]
+        except OSError as e:
+            # 管道断开说明 ffmpeg 已退出，把它最后的输出带上
+            try:
+                code = self.proc.wait(timeout=2) if self.proc else None
+            except subprocess.TimeoutExpired:
+                code = None
+            raise RuntimeError(f"写入 FFmpeg 失败（退出码 {code}）: {e}\n{self._diagnostics()}") from e
+
+    def alive(self):
+        proc = self.proc
+        return proc is not None and proc.poll() is None
+
+    def kill(self):
+        proc = self.proc
+        if proc is not None and proc.poll() is None:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+    def abort(self):
+        """强制结束 ffmpeg 并关闭管道（输出文件的结尾可能不完整，返回 False）"""
+        self.kill()
+        if self.stdin:
+            try:
+                self.stdin.close()
+            except Exception:
+                pass
+            self.stdin = None
+            self._fd = None
+        if self.proc:
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+            for thread in self._readers:
+                thread.join(timeout=2)
+            self._readers = []
+            self.proc = None
+        return False
+
+    def metrics(self):
+        """实时编码指标：已送入帧数、ffmpeg 已编码帧数、编码 fps、速度、码率、重复 / 丢弃帧数和积压帧数"""
+        progress = self.progress
+        metrics = super().metrics()
+        metrics.update({
+            "frames_encoded": progress.get("frame"),
+            "encode_fps": progress.get("fps"),
+            "speed": progress.get("speed"),
+            "bitrate": progress.get("bitrate"),
+            "total_size": progress.get("total_size"),
+            "dup_frames": progress.get("dup_frames"),
+            "drop_frames": progress.get("drop_frames"),
+            "age": round(time.monotonic() - progress["updated"], 2) if progress else None,
+            "running": self.proc is not None and self.proc.poll() is None,
+        })
+        if progress.get("frame") is not None:
+            metrics["backlog"] = self.frames - progress["frame"]
+        return metrics
+
+    def stats(self):
+        stats = super().stats()
+        progress = self.progress
+        stats.update({
+            "pipe_size": self.pipe_size,
+            "write_calls": self._syscalls,
+            "partial_writes": self._partial_writes,
+            "frames_encoded": progress.get("frame"),
+            "dup_frames": progress.get("dup_frames"),
+            "drop_frames": progress.get("drop_frames"),
+            "bitrate": progress.get("bitrate"),
+        })
+        if self.error:
+            stats["error"] = self.error
+        return stats
+
+    def _finish(self):
+        """关闭 stdin 并等待进程完成"""
+        if self.stdin:
+            try:
+                self.stdin.close()
+            except Exception:
+                pass
+            self.stdin = None
+            self._fd = None
+        if self.proc:
+            try:
+                # 等待进程退出
+                self.proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                print("⚠️ FFmpeg 进程超时，强制终止...")
+                try:
+                    self.proc.kill()
+                    self.proc.wait(timeout=5)
+                except Exception:
+                    pass
+            except Exception as e:
+                print(f"⚠️ 关闭 FFmpeg 时出错: {e}")
+            finally:
+                for thread in self._readers:
+                    thread.join(timeout=5)
+                self._readers = []
+                if self.proc.returncode:
+                    print(f"✗ FFmpeg 异常退出（退出码 {self.proc.returncode}），最后的输出:\n{self._diagnostics()}")
+                self.proc = None
+
+
+class PyAVEncoderBackend(EncoderBackend):
+    """通过 PyAV 在进程内编码（需要安装 av 包）
+
+    附加输出各自打开一个容器和编码器：与主输出帧率相同、尺寸相同的输出直接复用主输出的 VideoFrame，
+    否则只为保留下来的帧生成缩小后的画面。
+    """
+
+    name = "pyav"
+    live_keyframes = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.container = None
+        self.stream = None
+        self._extra = []  # 附加输出：{"container", "stream", "size", "fps", "count"}
+
+    @classmethod
+    def available(cls):
+        return _av_available
+
+    def _container_options(self, path):
+        if self.fragmented and Path(path).suffix.lower() == '.mp4':
+            return {"movflags": FRAGMENT_MOVFLAGS, "frag_duration": str(FRAGMENT_DURATION_US),
+                    "flush_packets": "1"}
+        return {}
+
+    def _open_stream(self, path, codec, options, pix_fmt, width, height, rate):
+        """打开容器并添加一路视频流，返回 (container, stream)；参数不被接受时抛出异常"""
+        container = _av.open(str(path), mode='w', options=self._container_options(path))
+        try:
+            stream = container.add_stream(codec, rate=rate, options=options)
+            stream.width = width
+            stream.height = height
+            stream.pix_fmt = pix_fmt
+            stream.time_base = 1 / rate
+            stream.codec_context.time_base = 1 / rate
+            # 与 ffmpeg 命令行默认一致：按 CPU 核数开启帧 / 片并行
+            stream.codec_context.thread_count = 0
+            stream.codec_context.thread_type = "AUTO"
+            stream.codec_context.open()  # 立即打开，参数不被接受时在录制开始前就能回退
+        except Exception:
+            container.close()
+            raise
+        return container, stream
+
+    def _open(self):
+        if not _av_available:
+            raise RuntimeError("未安装 PyAV（pip install av）")
+        rate = Fraction(self.fps).limit_denominator(1001)
+        if self.lossless:
+            # 与管道后端一致优先 Ut Video；部分 libav 构建的 Matroska 封装不接受 Ut Video，此时用 FFV1
+            candidates = [("utvideo", {}, "gbrp"), ("ffv1", {"level": "3", "g": "1", "slices": "4"}, "bgr0")]
+        else:
+            candidates = [(LIVE_ENCODER["codec"], {"preset": LIVE_ENCODER["preset"]}, LIVE_ENCODER["pix_fmt"])]
+        errors = []
+        for codec, options, pix_fmt in candidates:
+            try:
+                self.container, self.stream = self._open_stream(self.output_path, codec, options, pix_fmt,
+                                                                self.width, self.height, rate)
+                break
+            except Exception as e:
+                errors.append(f"{codec}: {e}")
+        else:
+            raise RuntimeError("无法创建 PyAV 编码器（" + "；".join(errors) + "）")
+        try:
+            for profile, path in self.outputs:
+                fps = profile.fps_for(self.fps)
+                width, height = profile.size_for(self.width, self.height)
+                options = {"preset": profile.preset, **profile.rate_options()}
+                container, stream = self._open_stream(path, profile.codec, options, profile.pix_fmt, width, height,
+                                                      Fraction(fps).limit_denominator(1001))
+                self._extra.append({"container": container, "stream": stream, "size": (width, height),
+                                    "fps": fps, "count": 0})
+        except Exception as e:
+            self._close_all()
+            raise RuntimeError(f"无法创建附加输出的编码器: {e}")
+        self._key_type = getattr(getattr(_av.video.frame, "PictureType", None), "I", "I")
+        self.profile = {"backend": self.name, "codec": codec, "pix_fmt": pix_fmt, "input_fps": self.fps,
+                        "live_keyframes": True}
+        if self.lossless:
+            self.profile["lossless"] = True
+        else:
+            self.profile["preset"] = LIVE_ENCODER["preset"]
+        if self.outputs:
+            self.profile["outputs"] = self._outputs_profile()
+
+    def _encode(self, img):
+        frame = _av.VideoFrame.from_ndarray(img, format='bgr24')
+        frame.pts = self.frames  # 时间基为 1/fps，第 i 帧显示在 i / fps 处
+        if self.keyframes is not None and self.keyframes.take_due(self.first_frame + self.frames):
+            frame.pict_type = self._key_type
+        for packet in self.stream.encode(frame):
+            self.container.mux(packet)
+        for out in self._extra:
+            # 第 i 个输入帧落在输出的第 floor(i * 输出帧率 / 输入帧率) 帧上，每个输出帧取落入它的第一个输入帧
+            if int(self.frames * out["fps"] / self.fps + 1e-9) < out["count"]:
+                continue
+            if out["size"] == (self.width, self.height):
+                small = frame  # 编码器在 encode() 时已引用帧数据，改 pts 不影响主输出
+            else:
+                small = _av.VideoFrame.from_ndarray(cv2.resize(img, out["size"], interpolation=cv2.INTER_AREA),
+                                                    format='bgr24')
+            small.pts = out["count"]
+            for packet in out["stream"].encode(small):
+                out["container"].mux(packet)
+            out["count"] += 1
+
+    def alive(self):
+        return self.container is not None
+
+    def _close_all(self):
+        for out in self._extra:
+            out["container"].close()
+        self._extra = []
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+    def _finish(self):
+        if self.container is None:
+            return
+        try:
+            for packet in self.stream.encode():
+                self.container.mux(packet)
+            for out in self._extra:
+                for packet in out["stream"].encode():
+                    out["container"].mux(packet)
+        finally:
+            self._close_all()
+
+
+BACKENDS = {"pyav": PyAVEncoderBackend, "pipe": PipeEncoderBackend}
+
+
+def available_backends():
+    """当前环境可用的后端名称（按优先级）"""
+    return [name for name in BACKEND_ORDER if BACKENDS[name].available()]
+
+
+def create_encoder(output_path, width, height, fps=30.0, lossless=False, keyframes=None, backend="auto",
+                   fragmented=False, outputs=()):
+    """按优先级启动实时编码后端，返回已启动的 EncoderBackend
+
+    Args:
+        backend: "auto"（PyAV 优先，失败时回退到 ffmpeg 管道；无损模式反之）、"pyav" 或 "pipe"
+        fragmented: MP4 输出写成分片 MP4
+        outputs: 附加输出 [(OutputProfile, 文件路径)]
+
+    Raises:
+        RuntimeError: 所有候选后端都无法启动
+    """
+    if backend != "auto":
+        names = (backend,)
+    else:
+        names = LOSSLESS_BACKEND_ORDER if lossless else BACKEND_ORDER
+    errors = []
+    for name in names:
+        cls = BACKENDS[name]
+        if not cls.available():
+            errors.append(f"{name}: 不可用")
+            continue
+        try:
+            return cls(output_path, width, height, fps=fps, lossless=lossless, keyframes=keyframes,
+                       fragmented=fragmented, outputs=outputs).start()
+        except RuntimeError as e:
+            print(f"⚠️ {name} 编码后端启动失败: {e}")
+            errors.append(f"{name}: {e}")
+    raise RuntimeError("没有可用的编码后端（" + "；".join(errors) + "）")
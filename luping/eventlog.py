@@ -0,0 +1,364 @@
+"""
+事件日志索引读取器
+
+events_*.json 可能达到数 GB，json.load 整个文件再线性扫描既慢又占内存。
+EventLogReader 用 mmap 打开文件，建立稀疏块索引（每块记录起始偏移、首个时间戳和事件类型掩码），
+并把索引缓存到 events_*.json.idx。查询时二分定位到块，只解码命中的记录：
+
+    with EventLogReader("recordings/events_20250101_120000.json") as log:
+        clicks = list(log.events_of_type("mouse_click", 10.0, 20.0))
+        event = log.nearest_event(12.5)
+
+索引大小与块数成正比（默认每 64 KiB 一块），与事件总数无关，内存占用有上界。
+"""
+import json
+import mmap
+import os
+import re
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+
+# _save_events 使用 json.dump(indent=2) 写出，每条记录以 "\n  {" 开始、以 "\n  }" 结束
+_INDENT2_START = b'\n  {'
+_INDENT2_END = b'\n  }'
+
+_TIMESTAMP_RE = re.compile(rb'"timestamp":\s*(-?[0-9][0-9.eE+-]*)')
+# 通用格式的分词：字符串整体跳过，只关心括号层级
+_TOKEN_RE = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]]')
+
+# 已知事件类型（用于块类型掩码，其他类型查询时不做块过滤）
+EVENT_TYPES = ("key_press", "key_release", "mouse_move", "mouse_click", "mouse_scroll")
+_TYPE_PATTERNS = [(1 << i, re.compile(rb'"type":\s*"' + name.encode() + rb'"'))
+                  for i, name in enumerate(EVENT_TYPES)]
+
+_INDEX_MAGIC = b'LPEI'
+_INDEX_VERSION = 1
+_INDEX_HEADER = struct.Struct('<4sIQqBQQ')  # magic, version, size, mtime_ns, layout, blocks, records
+
+_LAYOUT_INDENT2 = 0
+_LAYOUT_GENERIC = 1
+
+
+def events_path_for(video_path):
+    """录像文件对应的事件文件路径（recording_<时间戳>.* -> events_<时间戳>.json）"""
+    video_path = Path(video_path)
+    stem = video_path.stem
+    if stem.startswith("recording_"):
+        stem = stem[len("recording_"):]
+    return video_path.with_name(f"events_{stem}.json")
+
+
+def index_path_for(events_path):
+    """事件文件对应的索引缓存路径"""
+    events_path = Path(events_path)
+    return events_path.with_name(events_path.name + ".idx")
+
+
+class EventLogReader:
+    """基于 mmap 和稀疏块索引的事件日志读取器"""
+
+    def __init__(self, path, block_bytes=64 * 1024, block_records=512, use_cache=True):
+        """
+        Args:
+            path: events_*.json 路径
+            block_bytes: 标准格式下每个索引块覆盖的字节数
+            block_records: 其他 JSON 格式下每个索引块包含的记录数
+            use_cache: 是否读写 .idx 索引缓存
+        """
+        self.path = Path(path)
+        self.block_bytes = max(4096, int(block_bytes))
+        self.block_records = max(1, int(block_records))
+        self._file = open(self.path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._size = stat.st_size
+        self._mtime_ns = stat.st_mtime_ns
+        self._mm = None
+        if self._size > 0:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._layout = self._detect_layout()
+        self._offsets = array('Q')
+        self._first_ts = array('d')
+        self._masks = array('I')
+        self._count = 0
+        if not (use_cache and self._load_index()):
+            self._build_index()
+            if use_cache:
+                self._save_index()
+
+    # -------------------- 生命周期 --------------------
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for start, end in self._iter_records(self._offsets[0] if self._offsets else None):
+            yield self._decode(start, end)
+
+    # -------------------- 查询 --------------------
+    def events_between(self, t0, t1):
+        """按时间顺序返回 t0 <= timestamp <= t1 的事件"""
+        for start, end, ts in self._scan_from(self._block_for(t0)):
+            if ts > t1:
+                break
+            if ts >= t0:
+                yield self._decode(start, end)
+
+    def events_of_type(self, event_type, t0=None, t1=None):
+        """按时间顺序返回指定类型的事件（可选时间范围）"""
+        bit = self._type_bit(event_type)
+        lo = float('-inf') if t0 is None else t0
+        hi = float('inf') if t1 is None else t1
+        needle = f'"{event_type}"'.encode('utf-8')
+        block = self._block_for(lo)
+        while block < len(self._offsets):
+            if bit and not (self._masks[block] & bit):
+                block += 1
+                continue
+            if self._first_ts[block] > hi:
+                break
+            for start, end, ts in self._scan_block(block):
+                if ts > hi:
+                    return
+                if ts >= lo and needle in self._mm[start:end]:
+                    event = self._decode(start, end)
+                    if event.get("type") == event_type:
+                        yield event
+            block += 1
+
+    def nearest_event(self, t, event_type=None):
+        """返回时间戳最接近 t 的事件（可限定类型），没有事件时返回 None"""
+        before = self._last_at_or_before(t, event_type)
+        after = self._first_after(t, event_type)
+        if before is None:
+            return self._decode(*after[:2]) if after else None
+        if after is None or (t - before[2]) <= (after[2] - t):
+            return self._decode(*before[:2])
+        return self._decode(*after[:2])
+
+    # -------------------- 内部：定位与扫描 --------------------
+    def _type_bit(self, event_type):
+        try:
+            return 1 << EVENT_TYPES.index(event_type)
+        except ValueError:
+            return 0
+
+    def _block_for(self, t):
+        """第一个可能包含 timestamp >= t 的块"""
+        return max(0, bisect_left(self._first_ts, t) - 1)
+
+    def _block_end(self, block):
+        return self._offsets[block + 1] if block + 1 < len(self._offsets) else self._size
+
+    def _scan_from(self, block):
+        """从某个块开始向后扫描，产出 (start, end, timestamp)"""
+        if block >= len(self._offsets):
+            return
+        for start, end in self._iter_records(self._offsets[block]):
+            yield start, end, self._timestamp(start, end)
+
+    def _scan_block(self, block):
+        end_offset = self._block_end(block)
+        for item in self._scan_from(block):
+            if item[0] >= end_offset:
+                break
+            yield item
+
+    def _matches(self, start, end, event_type):
+        if event_type is None:
+            return True
+        if f'"{event_type}"'.encode('utf-8') not in self._mm[start:end]:
+            return False
+        return self._decode(start, end).get("type") == event_type
+
+    def _last_at_or_before(self, t, event_type):
+        bit = self._type_bit(event_type) if event_type else 0
+        block = max(0, bisect_right(self._first_ts, t) - 1)
+        while block >= 0 and self._offsets:
+            if self._first_ts[block] <= t and (not bit or self._masks[block] & bit):
+                found = None
+                for start, end, ts in self._scan_block(block):
+                    if ts > t:
+                        break
+                    if self._matches(start, end, event_type):
+                        found = (start, end, ts)
+                if found:
+                    return found
+            block -= 1
+        return None
+
+    def _first_after(self, t, event_type):
+        bit = self._type_bit(event_type) if event_type else 0
+        block = max(0, bisect_right(self._first_ts, t) - 1)
+        while block < len(self._offsets):
+            if not bit or self._masks[block] & bit:
+                for start, end, ts in self._scan_block(block):
+                    if ts > t and self._matches(start, end, event_type):
+                        return start, end, ts
+            block += 1
+        return None
+
+    def _timestamp(self, start, end):
+        match = _TIMESTAMP_RE.search(self._mm, start, end)
+        return float(match.group(1)) if match else 0.0
+
+    def _decode(self, start, end):
+        return json.loads(self._mm[start:end].decode('utf-8'))
+
+    # -------------------- 内部：记录边界 --------------------
+    def _detect_layout(self):
+        if self._mm is None:
+            return _LAYOUT_GENERIC
+        head = self._mm[:64].lstrip()
+        if head.startswith(b'[\n  {') or head.startswith(b'[\r\n  {'):
+            return _LAYOUT_INDENT2
+        return _LAYOUT_GENERIC
+
+    def _iter_records(self, offset):
+        """从 offset（某条记录的起始位置）开始，依次产出每条记录的 (start, end)"""
+        if offset is None or self._mm is None:
+            return
+        if self._layout == _LAYOUT_INDENT2:
+            mm = self._mm
+            start = offset
+            while start >= 0:
+                end = mm.find(_INDENT2_END, start)
+                if end < 0:
+                    return
+                end += len(_INDENT2_END)
+                yield start, end
+                start = mm.find(_INDENT2_START, end)
+                if start >= 0:
+                    start += len(_INDENT2_START) - 1
+        else:
+            depth = 0
+            start = None
+            for match in _TOKEN_RE.finditer(self._mm, offset):
+                token = match.group()
+                if token == b'{':
+                    if depth == 0:
+                        start = match.start()
+                    depth += 1
+                elif token == b'}':
+                    depth -= 1
+                    if depth == 0:
+                        yield start, match.end()
+                elif token == b']' and depth == 0:
+                    return
+
+    def _first_record(self):
+        if self._mm is None:
+            return None
+        if self._layout == _LAYOUT_INDENT2:
+            pos = self._mm.find(_INDENT2_START)
+            return pos + len(_INDENT2_START) - 1 if pos >= 0 else None
+        pos = self._mm.find(b'[')
+        if pos < 0:
+            return None
+        for start, _ in self._iter_records(pos + 1):
+            return start
+        return None
+
+    # -------------------- 内部：索引 --------------------
+    def _build_index(self):
+        first = self._first_record()
+        if first is None:
+            return
+        if self._layout == _LAYOUT_INDENT2:
+            self._build_indent2_index(first)
+        else:
+            self._build_generic_index(first)
+
+    def _build_indent2_index(self, first):
+        """按字节跳跃建块：每块只需一次 find，不必逐条解析"""
+        mm = self._mm
+        offsets = [first]
+        while True:
+            pos = mm.find(_INDENT2_START, offsets[-1] + self.block_bytes)
+            if pos < 0:
+                break
+            offsets.append(pos + len(_INDENT2_START) - 1)
+        for i, offset in enumerate(offsets):
+            end_offset = offsets[i + 1] if i + 1 < len(offsets) else self._size
+            chunk = mm[offset:end_offset]
+            self._offsets.append(offset)
+            self._first_ts.append(self._timestamp(offset, end_offset))
+            self._masks.append(self._type_mask(chunk))
+            self._count += chunk.count(_INDENT2_START) + 1
+
+    def _build_generic_index(self, first):
+        block_start = None
+        in_block = 0
+        for start, end in self._iter_records(first):
+            if in_block == 0:
+                if block_start is not None:
+                    self._masks.append(self._type_mask(self._mm[block_start:start]))
+                block_start = start
+                self._offsets.append(start)
+                self._first_ts.append(self._timestamp(start, end))
+            in_block = (in_block + 1) % self.block_records
+            self._count += 1
+        if block_start is not None:
+            self._masks.append(self._type_mask(self._mm[block_start:self._size]))
+
+    @staticmethod
+    def _type_mask(chunk):
+        mask = 0
+        for bit, pattern in _TYPE_PATTERNS:
+            if pattern.search(chunk):
+                mask |= bit
+        return mask
+
+    def _load_index(self):
+        index_path = index_path_for(self.path)
+        try:
+            with open(index_path, 'rb') as f:
+                header = f.read(_INDEX_HEADER.size)
+                if len(header) != _INDEX_HEADER.size:
+                    return False
+                magic, version, size, mtime_ns, layout, blocks, records = _INDEX_HEADER.unpack(header)
+                if (magic != _INDEX_MAGIC or version != _INDEX_VERSION or size != self._size
+                        or mtime_ns != self._mtime_ns or layout != self._layout):
+                    return False
+                offsets, first_ts, masks = array('Q'), array('d'), array('I')
+                offsets.fromfile(f, blocks)
+                first_ts.fromfile(f, blocks)
+                masks.fromfile(f, blocks)
+        except (OSError, EOFError, struct.error):
+            return False
+        self._offsets, self._first_ts, self._masks = offsets, first_ts, masks
+        self._count = records
+        return True
+
+    def _save_index(self):
+        index_path = index_path_for(self.path)
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION, self._size, self._mtime_ns,
+                                           self._layout, len(self._offsets), self._count))
+                self._offsets.tofile(f)
+                self._first_ts.tofile(f)
+                self._masks.tofile(f)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            # 目录只读时不缓存索引，不影响查询
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
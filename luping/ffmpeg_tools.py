@@ -0,0 +1,139 @@
+"""
+FFmpeg 可执行文件查找与调用辅助
+"""
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+
+def find_ffmpeg():
+    """查找 ffmpeg 可执行文件，支持打包后的应用"""
+    # 1. 尝试在 PATH 中查找（包括系统 PATH 和用户 PATH）
+    try:
+        # 先尝试直接查找（如果PATH已经包含）
+        ffmpeg_path = shutil.which('ffmpeg')
+        if ffmpeg_path:
+            return ffmpeg_path
+        
+        # 如果找不到，尝试从注册表获取系统 PATH（Windows）
+        if sys.platform == 'win32':
+            try:
+                import winreg
+                # 获取系统PATH
+                with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SYSTEM\CurrentControlSet\Control\Session Manager\Environment") as key:
+                    system_path = winreg.QueryValueEx(key, "Path")[0]
+                # 获取用户PATH
+                try:
+                    with winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Environment") as key:
+                        user_path = winreg.QueryValueEx(key, "Path")[0]
+                except:
+                    user_path = ""
+                
+                # 合并PATH并查找
+                combined_path = system_path + os.pathsep + user_path + os.pathsep + os.environ.get('PATH', '')
+                old_path = os.environ.get('PATH', '')
+                os.environ['PATH'] = combined_path
+                ffmpeg_path = shutil.which('ffmpeg')
+                os.environ['PATH'] = old_path  # 恢复
+                if ffmpeg_path:
+                    return ffmpeg_path
+            except Exception:
+                pass
+    except Exception:
+        pass
+    
+    # 2. 尝试在常见安装位置查找（Windows）
+    if sys.platform == 'win32':
+        common_paths = []
+        # WinGet 安装路径（支持通配符）
+        localappdata = os.environ.get('LOCALAPPDATA', '')
+        if localappdata:
+            winget_base = Path(localappdata) / 'Microsoft' / 'WinGet' / 'Packages'
+            if winget_base.exists():
+                # 查找所有 Gyan.FFmpeg 相关目录
+                for pkg_dir in winget_base.glob('Gyan.FFmpeg*'):
+                    # 查找 ffmpeg-*-full_build 目录
+                    for build_dir in pkg_dir.glob('ffmpeg-*-full_build'):
+                        ffmpeg_exe = build_dir / 'bin' / 'ffmpeg.exe'
+                        if ffmpeg_exe.exists():
+                            common_paths.append(ffmpeg_exe)
+                    # 也检查直接在 pkg_dir 下的 bin 目录
+                    ffmpeg_exe = pkg_dir / 'bin' / 'ffmpeg.exe'
+                    if ffmpeg_exe.exists():
+                        common_paths.append(ffmpeg_exe)
+        
+        # 标准安装路径
+        program_files = os.environ.get('ProgramFiles', '')
+        program_files_x86 = os.environ.get('ProgramFiles(x86)', '')
+        if program_files:
+            common_paths.append(Path(program_files) / 'ffmpeg' / 'bin' / 'ffmpeg.exe')
+        if program_files_x86:
+            common_paths.append(Path(program_files_x86) / 'ffmpeg' / 'bin' / 'ffmpeg.exe')
+        
+        # 检查所有路径
+        for ffmpeg_path in common_paths:
+            try:
+                if ffmpeg_path.exists():
+                    return str(ffmpeg_path)
+            except Exception:
+                continue
+    
+    # 3. 尝试在应用目录中查找（打包后的应用）
+    try:
+        if getattr(sys, 'frozen', False):
+            # 打包后的应用
+            if hasattr(sys, '_MEIPASS'):
+                app_dir = Path(sys._MEIPASS)
+            else:
+                app_dir = Path(sys.executable).parent
+            
+            # 检查应用目录
+            ffmpeg_exe = app_dir / 'ffmpeg.exe'
+            if ffmpeg_exe.exists():
+                return str(ffmpeg_exe)
+            
+            # 检查应用目录的父目录（onedir模式）
+            parent_dir = Path(sys.executable).parent
+            ffmpeg_exe = parent_dir / 'ffmpeg.exe'
+            if ffmpeg_exe.exists():
+                return str(ffmpeg_exe)
+    except Exception:
+        pass
+    
+    return None
+
+
+def subprocess_kwargs(**kwargs):
+    """subprocess 参数：在 Windows 上隐藏控制台窗口"""
+    if sys.platform == 'win32':
+        kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+    return kwargs
+
+
+def nice_command(cmd, niceness):
+    """在命令前加上 nice -n <niceness>，让子进程（包括它之后创建的线程）以较低优先级运行
+
+    不用 preexec_fn=os.nice：录制时进程里有多个线程，CPython 文档说明此时 preexec_fn 可能死锁。
+    Windows 或找不到 nice 时原样返回（Windows 用 creationflags 设置优先级）。
+    """
+    if niceness <= 0 or sys.platform == 'win32':
+        return list(cmd)
+    nice_path = shutil.which('nice')
+    if not nice_path:
+        return list(cmd)
+    return [nice_path, '-n', str(int(niceness))] + list(cmd)
+
+
+def run_ffmpeg(args, timeout=None, ffmpeg_path=None):
+    """运行 ffmpeg（args 不含可执行文件本身），返回 CompletedProcess
+
+    Raises:
+        RuntimeError: 找不到 ffmpeg
+    """
+    ffmpeg_path = ffmpeg_path or find_ffmpeg()
+    if not ffmpeg_path:
+        raise RuntimeError("未找到 ffmpeg 可执行文件")
+    cmd = [ffmpeg_path] + [str(a) for a in args]
+    return subprocess.run(cmd, **subprocess_kwargs(capture_output=True, text=True, timeout=timeout))
@@ -0,0 +1,186 @@
+"""
+图像序列备用方案的打包存储（recording_*.mjpeg + recording_*.mjpeg.idx）
+
+没有可用编码器时，原来的备用方案在单个写入线程里逐帧 cv2.imwrite 成数千个 frame_%06d.jpg，
+高分辨率下达不到 30fps，大量小文件也拖慢文件系统。PackedFrameWriter 把 JPEG 编码放到线程池
+（cv2.imencode 执行时释放 GIL，可以多核并行），按帧序号顺序把编码结果追加到一个打包文件：
+
+    recording_*.mjpeg       JPEG 帧首尾相接（即 MJPEG 基本流，ffmpeg 可直接以 -f mjpeg 读取）
+    recording_*.mjpeg.idx   头部 + 每帧一条 (偏移, 字节数) 定长记录，可随机读取任意一帧
+
+索引在对应帧写入打包文件之后追加，进程崩溃时索引最多落后于打包文件，读取时以两者都完整的帧为准。
+停止录制后为打包文件创建转码任务（与无损录制共用 luping.transcode_queue），有 ffmpeg 时后台合成为 MP4，
+暂时没有 ffmpeg 时任务保留，之后启动录制器或运行 python -m luping.transcode_queue 时继续。
+"""
+import os
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+PACK_SUFFIX = ".mjpeg"
+INDEX_SUFFIX = ".idx"
+_MAGIC = b'LPMJ'
+_VERSION = 1
+_HEADER = struct.Struct('<4sI')  # magic, version
+_RECORD_DTYPE = np.dtype([('offset', '<u8'), ('size', '<u4')])
+
+DEFAULT_QUALITY = 80
+
+
+def packed_path_for(video_path):
+    """录像对应的打包帧文件路径（recording_*.mjpeg）"""
+    video_path = Path(video_path)
+    return video_path.with_name(video_path.stem + PACK_SUFFIX)
+
+
+def index_path_for(pack_path):
+    """打包帧文件对应的索引路径（recording_*.mjpeg.idx）"""
+    pack_path = Path(pack_path)
+    return pack_path.with_name(pack_path.name + INDEX_SUFFIX)
+
+
+def default_workers():
+    """编码线程数：留一个核给采集线程，最多 4 个"""
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def load_pack_index(pack_path):
+    """读取打包帧索引，返回 (偏移数组, 字节数数组)；只包含在打包文件中完整的帧
+
+    Raises:
+        ValueError: 索引文件格式不对
+    """
+    pack_path = Path(pack_path)
+    index_path = index_path_for(pack_path)
+    with open(index_path, 'rb') as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(f"打包帧索引不完整: {index_path}")
+        magic, version = _HEADER.unpack(header)
+        if magic != _MAGIC or version > _VERSION:
+            raise ValueError(f"不是打包帧索引文件: {index_path}")
+        data = f.read()
+    records = np.frombuffer(data[:len(data) // _RECORD_DTYPE.itemsize * _RECORD_DTYPE.itemsize],
+                            dtype=_RECORD_DTYPE)
+    pack_size = pack_path.stat().st_size if pack_path.exists() else 0
+    complete = int(np.searchsorted(records['offset'] + records['size'], pack_size, side='right'))
+    records = records[:complete]
+    return records['offset'].astype(np.int64), records['size'].astype(np.int64)
+
+
+class PackedFrameWriter:
+    """在线程池中编码 JPEG，按帧顺序追加到打包文件
+
+    submit() 由单个写入线程调用；正在编码的帧达到上限时阻塞，等最早的一帧写出后再返回，
+    编码跟不上时由上游的写入队列（内存 + 磁盘溢出）吸收积压。
+    """
+
+    def __init__(self, path, quality=DEFAULT_QUALITY, workers=None):
+        """
+        Args:
+            path: 打包帧文件路径（索引写到同名 .idx）
+            quality: JPEG 质量（0-100）
+            workers: 编码线程数（默认 default_workers()）
+        """
+        self.path = Path(path)
+        self.index_path = index_path_for(self.path)
+        self.quality = int(quality)
+        self.workers = workers or default_workers()
+        self.frames = 0
+        self.bytes = 0
+        self._encode_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._pending = deque()
+        self._max_pending = self.workers * 2
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="jpeg-encode")
+        self._file = open(self.path, 'wb')
+        self._index = open(self.index_path, 'wb')
+        self._index.write(_HEADER.pack(_MAGIC, _VERSION))
+
+    def submit(self, img):
+        """提交一帧 BGR 图像（图像在编码完成前不能被修改）"""
+        self._pending.append(self._pool.submit(self._encode, img))
+        while self._pending and (self._pending[0].done() or len(self._pending) >= self._max_pending):
+            self._append(self._pending.popleft().result())
+
+    def close(self):
+        """写出全部已提交的帧并关闭文件，返回 stats()"""
+        if self._file is None:
+            return self.stats()
+        try:
+            while self._pending:
+                self._append(self._pending.popleft().result())
+        finally:
+            self._pool.shutdown(wait=True)
+            self._file.close()
+            self._index.close()
+            self._file = None
+        return self.stats()
+
+    def stats(self):
+        """帧数、总字节数、平均每帧 KB、单帧平均编码耗时（毫秒）和整体写入帧率"""
+        elapsed = time.perf_counter() - self._started
+        return {
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "workers": self.workers,
+            "avg_kb": round(self.bytes / self.frames / 1024, 1) if self.frames else 0,
+            "encode_ms": round(self._encode_seconds / self.frames * 1000, 2) if self.frames else 0,
+            "fps": round(self.frames / elapsed, 1) if elapsed > 0 else 0,
+        }
+
+    def _encode(self, img):
+        start = time.perf_counter()
+        ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise RuntimeError("JPEG 编码失败")
+        with self._stats_lock:
+            self._encode_seconds += time.perf_counter() - start
+        return buf
+
+    def _append(self, buf):
+        self._file.write(buf)
+        self._index.write(struct.pack('<QI', self.bytes, buf.nbytes))
+        self.bytes += buf.nbytes
+        self.frames += 1
+
+
+class PackedFrameReader:
+    """随机读取打包帧文件中的帧（不需要 ffmpeg）"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.offsets, self.sizes = load_pack_index(self.path)
+        self._file = open(self.path, 'rb')
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def jpeg(self, index):
+        """第 index 帧的 JPEG 数据"""
+        with self._lock:
+            self._file.seek(int(self.offsets[index]))
+            return self._file.read(int(self.sizes[index]))
+
+    def frame(self, index):
+        """第 index 帧（BGR numpy 数组）"""
+        return cv2.imdecode(np.frombuffer(self.jpeg(index), np.uint8), cv2.IMREAD_COLOR)
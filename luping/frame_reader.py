@@ -0,0 +1,216 @@
+"""
+按时间 / 帧序号提取录像画面
+
+每次取帧都设置 CAP_PROP_POS_FRAMES 到目标帧，OpenCV 都要回到前一个关键帧重新解码，取相邻的几帧也一样慢，
+定位到非关键帧时还可能差一两帧。FrameReader 先取得关键帧索引（录制清单中有就直接用，否则解析容器，只需几毫秒），
+目标帧在当前解码位置之后、且中间没有新的关键帧时不重新定位，直接往后解码；
+只有跨过关键帧或往回跳时才定位，而且只定位到目标之前的关键帧，再逐帧往后解码到目标，位置是精确的。
+
+解码出的帧放进按字节数限制的 LRU 缓存，反复查看同一位置不需要重新解码。
+批量提取时先按帧序号排序，一遍顺序解码取出全部帧：
+
+    with FrameReader("recordings/recording_20250101_120000.mp4") as reader:
+        frame = reader.frame_at(1234.5)
+        frames = reader.extract_times([10.0, 12.5, 600.0])
+
+用法:
+    python -m luping.frame_reader recording.mp4 --time 12.5 --time 1:30 -o frames/
+"""
+import argparse
+import sys
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from pathlib import Path
+
+import cv2
+
+from luping.container import probe_container
+from luping.manifest import manifest_for
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def load_seek_index(video_path):
+    """帧率、帧数和关键帧序号（升序；None 表示每一帧都是关键帧）
+
+    录制清单与视频一致、且记录了关键帧序号时直接用清单，否则解析容器。
+    """
+    manifest = manifest_for(video_path)
+    video = (manifest or {}).get("video") or {}
+    if video.get("fps") and video.get("frame_count") and video.get("keyframe_count") is not None \
+            and video.get("keyframes"):
+        return {"fps": video["fps"], "frame_count": video["frame_count"], "keyframes": video["keyframes"]}
+    info = probe_container(video_path)
+    return {"fps": info.get("fps") or 30.0, "frame_count": info.get("frame_count") or 0,
+            "keyframes": info.get("keyframes")}
+
+
+class FrameReader:
+    """带关键帧索引和解码帧 LRU 缓存的取帧器（线程安全）"""
+
+    def __init__(self, video_path, cache_bytes=DEFAULT_CACHE_BYTES):
+        """
+        Args:
+            video_path: 录像文件
+            cache_bytes: 解码帧缓存的字节数上限（0 表示不缓存）
+        """
+        self.video_path = Path(video_path)
+        index = load_seek_index(self.video_path)
+        self.fps = index["fps"]
+        self.frame_count = index["frame_count"]
+        self.keyframes = index["keyframes"]
+        self.cache_bytes = cache_bytes
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self._cap = None
+        self._position = None  # 下一次 grab() 将得到的帧序号
+        self.stats = {"seeks": 0, "decoded": 0, "cache_hits": 0}
+
+    def close(self):
+        with self._lock:
+            if self._cap is not None:
+                self._cap.release()
+                self._cap = None
+            self._cache.clear()
+            self._cached_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self.frame_count
+
+    def index_of(self, t):
+        """视频时间 t（秒）所在的帧序号（不检查是否超出视频范围）"""
+        return max(0, int(t * self.fps + 1e-6))
+
+    def keyframe_before(self, index):
+        """index 之前（含）最近的关键帧序号"""
+        if self.keyframes is None:
+            return index
+        i = bisect_right(self.keyframes, index) - 1
+        return self.keyframes[i] if i >= 0 else 0
+
+    def frame(self, index):
+        """第 index 帧（BGR numpy 数组）；超出范围或解码失败时返回 None"""
+        with self._lock:
+            cached = self._cache_get(index)
+            if cached is not None:
+                return cached
+            return self._decode_to(index)
+
+    def frame_at(self, t):
+        """视频时间 t（秒）处的帧"""
+        return self.frame(self.index_of(t))
+
+    def iter_frames(self, indices):
+        """按帧序号升序一遍顺序解码，逐个产出 (index, frame)；重复的序号只产出一次"""
+        for index in sorted(set(indices)):
+            yield index, self.frame(index)
+
+    def extract(self, indices):
+        """批量取帧，返回与 indices 顺序对应的列表"""
+        frames = dict(self.iter_frames(indices))
+        return [frames[index] for index in indices]
+
+    def extract_times(self, times):
+        """批量按视频时间取帧，返回与 times 顺序对应的列表"""
+        return self.extract([self.index_of(t) for t in times])
+
+    def _open(self):
+        if self._cap is None:
+            self._cap = cv2.VideoCapture(str(self.video_path))
+            if not self._cap.isOpened():
+                self._cap = None
+                raise RuntimeError(f"无法打开视频: {self.video_path}")
+            self._position = 0
+        return self._cap
+
+    def _decode_to(self, index):
+        if index < 0 or (self.frame_count and index >= self.frame_count):
+            return None
+        cap = self._open()
+        keyframe = self.keyframe_before(index)
+        # 目标在当前位置之前，或中间隔着关键帧（定位更快）时才重新定位。
+        # 只定位到关键帧（不需要解码其他帧就能落在准确位置），再由下面的 grab() 顺序解码到目标帧
+        if self._position is None or index < self._position or keyframe > self._position:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+            self.stats["seeks"] += 1
+            # 以 OpenCV 实际落到的位置为准
+            self._position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+            if self._position > index:
+                self._position = None
+                return None
+        while self._position < index:
+            if not cap.grab():
+                self._position = None
+                return None
+            self._position += 1
+            self.stats["decoded"] += 1
+        ret, frame = cap.read()
+        if not ret:
+            self._position = None
+            return None
+        self._position += 1
+        self.stats["decoded"] += 1
+        self._cache_put(index, frame)
+        return frame
+
+    def _cache_get(self, index):
+        frame = self._cache.get(index)
+        if frame is not None:
+            self._cache.move_to_end(index)
+            self.stats["cache_hits"] += 1
+        return frame
+
+    def _cache_put(self, index, frame):
+        if frame.nbytes > self.cache_bytes:
+            return
+        self._cache[index] = frame
+        self._cached_bytes += frame.nbytes
+        while self._cached_bytes > self.cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted.nbytes
+
+
+def main():
+    from luping.clips import parse_time
+
+    parser = argparse.ArgumentParser(description="按视频时间提取录像画面")
+    parser.add_argument("video", help="录像文件")
+    parser.add_argument("--time", dest="times", action="append", default=[],
+                        help="视频时间，如 12.5 或 1:30（可重复）")
+    parser.add_argument("-o", "--output-dir", default=".", help="输出目录（默认当前目录）")
+    parser.add_argument("--format", choices=("png", "jpg"), default="png", help="图片格式（默认 png）")
+    args = parser.parse_args()
+    if not args.times:
+        print("✗ 请用 --time 指定要提取的时间")
+        sys.exit(1)
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    failed = 0
+    try:
+        with FrameReader(args.video, cache_bytes=0) as reader:
+            times = [parse_time(text) for text in args.times]
+            for t, frame in zip(times, reader.extract_times(times)):
+                if frame is None:
+                    failed += 1
+                    print(f"✗ {t:.3f}s: 超出视频范围或解码失败")
+                    continue
+                path = output_dir / f"{Path(args.video).stem}_{t:.3f}.{args.format}"
+                cv2.imwrite(str(path), frame)
+                print(f"✓ {t:.3f}s -> {path}")
+    except Exception as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+空闲时间压缩导出
+
+录像中常有大段既没有键盘鼠标输入、画面也没有变化的时间。这里结合事件日志和逐帧画面差异找出空闲段，
+导出一个压缩后的视频：每段空闲只保留开头 min_idle 秒，其余部分剪掉（或按 speed 倍速抽帧保留），
+同时写出编辑表（*.edits.json），把输出视频的时间映射回原录像的时间。
+
+整个过程只解码、编码一遍：逐帧读取、判断、写入 ffmpeg 管道，不需要预读，内存中只保留当前帧
+和上一输出帧的缩略图。
+
+用法:
+    python -m luping.idle_export recording.mp4                # 空闲超过 3 秒的部分剪掉
+    python -m luping.idle_export recording.mp4 --speed 8      # 空闲部分 8 倍速
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+
+import cv2
+
+from luping.activity import ActivityIndex, activity_path_for
+from luping.container import probe_container
+from luping.encoders import LIVE_ENCODER
+from luping.eventlog import EventLogReader, events_path_for
+from luping.ffmpeg_tools import find_ffmpeg, subprocess_kwargs
+from luping.timeline import FrameTimeline, event_video_time, timeline_path_for
+
+DEFAULT_MIN_IDLE = 3.0       # 空闲超过该秒数后才开始剪掉 / 加速
+DEFAULT_EVENT_PAD = 0.5      # 输入事件前后各该秒数内视为活动
+DEFAULT_DIFF_THRESHOLD = 1.0  # 缩略图灰度平均绝对差（0-255）超过该值视为画面变化
+_THUMB_SCALE = 8             # 画面差异在 1/8 缩略图上计算
+
+
+def export_path_for(video_path):
+    """默认输出路径：<录像名>_compact.mp4"""
+    video_path = Path(video_path)
+    return video_path.with_name(video_path.stem + "_compact.mp4")
+
+
+def edit_list_path_for(output_path):
+    """输出视频对应的编辑表路径（与输出同名，后缀 .edits.json）"""
+    output_path = Path(output_path)
+    return output_path.with_name(output_path.stem + ".edits.json")
+
+
+def load_event_times(events_path, video_fps=None):
+    """所有输入事件的视频时间（升序 array）"""
+    times = array('d')
+    if events_path is None or not Path(events_path).exists():
+        return times
+    with EventLogReader(events_path) as log:
+        for event in log:
+            times.append(event_video_time(event, video_fps))
+    return array('d', sorted(times))
+
+
+class IdleDetector:
+    """逐帧判断是否空闲：附近没有输入事件，且画面与上一输出帧几乎相同
+
+    有录制时生成的活动索引时直接用其中的逐帧变化分数：自上一输出帧以来的分数之和
+    不超过阈值即视为没有变化（平均绝对差满足三角不等式，累加值是实际差异的上界），不再计算缩略图。
+    """
+
+    def __init__(self, event_times, fps, event_pad=DEFAULT_EVENT_PAD, diff_threshold=DEFAULT_DIFF_THRESHOLD,
+                 scores=None):
+        self.event_times = event_times
+        self.fps = fps
+        self.event_pad = event_pad
+        self.diff_threshold = diff_threshold
+        self.scores = scores
+        self._reference = None
+        self._last_thumb = None
+        self._drift = None
+
+    def has_input(self, t):
+        """t 前后 event_pad 秒内是否有输入事件"""
+        i = bisect_left(self.event_times, t - self.event_pad)
+        return i < len(self.event_times) and self.event_times[i] <= t + self.event_pad
+
+    def is_idle(self, index, frame):
+        """第 index 帧是否空闲；与上一输出帧（而不是上一帧）比较，缓慢变化累积起来也能发现"""
+        if self.scores is not None:
+            if self._drift is not None:
+                self._drift += float(self.scores[index])
+            if self._drift is None or self.has_input(index / self.fps):
+                return False
+            return self._drift <= self.diff_threshold
+        h, w = frame.shape[:2]
+        thumb = cv2.cvtColor(cv2.resize(frame, (max(1, w // _THUMB_SCALE), max(1, h // _THUMB_SCALE)),
+                                        interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        self._last_thumb = thumb
+        if self._reference is None or self.has_input(index / self.fps):
+            return False
+        return float(cv2.absdiff(thumb, self._reference).mean()) <= self.diff_threshold
+
+    def note_output(self):
+        """当前帧已写入输出，作为之后比较的参照"""
+        self._reference = self._last_thumb
+        self._drift = 0.0
+
+
+class EditList:
+    """输出帧到原录像帧的映射，按分段存储：(输出起始帧, 原起始帧, 帧数, 步长)"""
+
+    def __init__(self):
+        self.segments = []
+        self.frames = 0
+
+    def add(self, source_index, step=1):
+        """追加一个输出帧，step 为该帧代表的原始帧数（倍速段 > 1）"""
+        if self.segments:
+            out_start, src_start, count, seg_step = self.segments[-1]
+            if seg_step == step and src_start + count * step == source_index:
+                self.segments[-1] = (out_start, src_start, count + 1, step)
+                self.frames += 1
+                return
+        self.segments.append((self.frames, source_index, 1, step))
+        self.frames += 1
+
+    def to_dict(self, fps):
+        segments = []
+        for i, (out_start, src_start, count, step) in enumerate(self.segments):
+            src_end = src_start + count * step
+            if i + 1 < len(self.segments):
+                # 倍速段的最后一帧可能代表不足 step 帧（空闲在中途结束）
+                src_end = min(src_end, self.segments[i + 1][1])
+            segments.append({
+                "output_start": round(out_start / fps, 4),
+                "output_end": round((out_start + count) / fps, 4),
+                "source_start": round(src_start / fps, 4),
+                "source_end": round(src_end / fps, 4),
+                "speed": step,
+            })
+        return {"fps": fps, "output_frames": self.frames, "segments": segments}
+
+
+def source_time(edit_list, t):
+    """按编辑表（to_dict 的结果或读取的 *.edits.json）把输出视频时间换算为原录像时间"""
+    segments = edit_list["segments"]
+    if not segments:
+        return t
+    i = max(0, bisect_right([seg["output_start"] for seg in segments], t) - 1)
+    seg = segments[i]
+    return min(seg["source_start"] + max(0.0, t - seg["output_start"]) * seg["speed"], seg["source_end"])
+
+
+def _start_encoder(ffmpeg_path, output_path, width, height, fps):
+    # 与录制时相同的编码参数（luping.encoders.LIVE_ENCODER）
+    cmd = [
+        ffmpeg_path, '-y', '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', f'{fps:g}', '-i', '-',
+        '-c:v', LIVE_ENCODER["codec"], '-pix_fmt', LIVE_ENCODER["pix_fmt"], '-preset', LIVE_ENCODER["preset"],
+        '-movflags', '+faststart', str(output_path),
+    ]
+    return subprocess.Popen(cmd, **subprocess_kwargs(stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                                     stderr=subprocess.PIPE))
+
+
+def compact_video(video_path, output_path=None, min_idle=DEFAULT_MIN_IDLE, speed=None,
+                  event_pad=DEFAULT_EVENT_PAD, diff_threshold=DEFAULT_DIFF_THRESHOLD, events_path=None):
+    """导出压缩空闲时间后的视频和编辑表，返回统计信息
+
+    Args:
+        min_idle: 每段空闲保留开头的秒数，超出部分剪掉或加速
+        speed: None 表示剪掉空闲部分；整数 N 表示空闲部分每 N 帧保留一帧
+
+    Raises:
+        RuntimeError: 找不到 ffmpeg、无法读取视频或编码失败
+    """
+    video_path = Path(video_path)
+    output_path = Path(output_path) if output_path else export_path_for(video_path)
+    ffmpeg_path = find_ffmpeg()
+    if not ffmpeg_path:
+        raise RuntimeError("未找到 ffmpeg，无法导出")
+    info = probe_container(video_path)
+    fps = info.get("fps") or 30.0
+
+    video_fps = None
+    timeline_path = timeline_path_for(video_path)
+    if timeline_path.exists():
+        video_fps = FrameTimeline.load(timeline_path).video_fps
+    events_path = Path(events_path) if events_path else events_path_for(video_path)
+    scores = None
+    activity_path = activity_path_for(video_path)
+    if activity_path.exists():
+        try:
+            index = ActivityIndex.load(activity_path)
+            # 录制后重新编码过帧率（插帧）时帧序号对不上，只能回退到逐帧计算缩略图
+            if len(index) == info.get("frame_count"):
+                scores = index.scores
+        except ValueError:
+            pass
+    detector = IdleDetector(load_event_times(events_path, video_fps), fps, event_pad, diff_threshold, scores)
+
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise RuntimeError(f"无法打开视频: {video_path}")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    proc = _start_encoder(ffmpeg_path, output_path, width, height, fps)
+
+    min_idle_frames = max(0, round(min_idle * fps))
+    step = max(1, int(speed)) if speed else None
+    edits = EditList()
+    idle_run = 0
+    idle_spans = 0
+    index = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if detector.is_idle(index, frame):
+                idle_run += 1
+            else:
+                idle_run = 0
+            if idle_run == min_idle_frames + 1:
+                idle_spans += 1
+            if idle_run <= min_idle_frames:
+                frame_step = 1
+            elif step and (idle_run - min_idle_frames - 1) % step == 0:
+                frame_step = step
+            else:
+                frame_step = None
+            if frame_step:
+                proc.stdin.write(frame.tobytes())
+                edits.add(index, frame_step)
+                detector.note_output()
+            index += 1
+    except BrokenPipeError:
+        pass
+    finally:
+        cap.release()
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        stderr = proc.stderr.read().decode('utf-8', errors='replace')
+        proc.wait()
+    if proc.returncode != 0:
+        raise RuntimeError(f"编码失败: {stderr.strip()[-500:]}")
+
+    edit_list = {
+        "source": video_path.name,
+        "output": output_path.name,
+        "params": {"min_idle": min_idle, "speed": step, "event_pad": event_pad, "diff_threshold": diff_threshold},
+        "source_frames": index,
+        "idle_spans": idle_spans,
+        **edits.to_dict(fps),
+    }
+    edit_path = edit_list_path_for(output_path)
+    tmp_path = edit_path.with_name(edit_path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(edit_list, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, edit_path)
+    return {"output": output_path, "edit_list": edit_path, "source_duration": index / fps,
+            "output_duration": edits.frames / fps, "idle_spans": idle_spans}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出剪掉（或加速）空闲时间的录像")
+    parser.add_argument("video", help="录像文件")
+    parser.add_argument("-o", "--output", default=None, help="输出文件（默认 <录像名>_compact.mp4）")
+    parser.add_argument("--min-idle", type=float, default=DEFAULT_MIN_IDLE,
+                        help=f"每段空闲保留的秒数（默认 {DEFAULT_MIN_IDLE}）")
+    parser.add_argument("--speed", type=int, default=None, help="空闲部分按该倍速保留，而不是剪掉")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_DIFF_THRESHOLD,
+                        help=f"画面变化阈值，缩略图灰度平均差（默认 {DEFAULT_DIFF_THRESHOLD}）")
+    parser.add_argument("--event-pad", type=float, default=DEFAULT_EVENT_PAD,
+                        help=f"输入事件前后视为活动的秒数（默认 {DEFAULT_EVENT_PAD}）")
+    parser.add_argument("--events", default=None, help="事件文件（默认按录像文件名推断）")
+    args = parser.parse_args()
+
+    try:
+        result = compact_video(args.video, args.output, args.min_idle, args.speed,
+                               args.event_pad, args.threshold, args.events)
+    except Exception as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    print(f"✓ {result['source_duration']:.1f}s -> {result['output_duration']:.1f}s"
+          f"（压缩 {result['idle_spans']} 段空闲）: {result['output']}")
+    print(f"  编辑表: {result['edit_list']}")
+
+
+if __name__ == "__main__":
+    main()
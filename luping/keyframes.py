@@ -0,0 +1,79 @@
+"""
+交互关键帧调度
+
+回看录像时通常直接跳到点击和按键处。默认 GOP 下每次跳转都要从前一个关键帧解码数秒画面，
+这里在鼠标点击和每段连续输入的第一次按键处请求关键帧，跳转到交互位置时几乎无需额外解码。
+
+为控制码率开销，两个强制关键帧之间至少间隔 min_interval 秒，连续输入只在开头请求一次。
+"""
+import math
+import threading
+
+
+class KeyframeScheduler:
+    """记录需要强制关键帧的帧序号"""
+
+    def __init__(self, min_interval=1.0, burst_gap=1.0):
+        """
+        Args:
+            min_interval: 两个强制关键帧之间的最小间隔（秒）
+            burst_gap: 按键间隔超过该值时视为新一段输入（秒）
+        """
+        self.min_interval = float(min_interval)
+        self.burst_gap = float(burst_gap)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._frames = []
+            self._last_request_time = None
+            self._last_key_time = None
+            self._next_due = 0  # 实时编码后端已处理到的请求位置
+
+    def note_click(self, t, frame_index):
+        """鼠标按下：在当前帧请求关键帧"""
+        self._request(t, frame_index)
+
+    def note_key(self, t, frame_index):
+        """按键按下：只有一段连续输入的第一次按键才请求关键帧"""
+        with self._lock:
+            new_burst = self._last_key_time is None or t - self._last_key_time > self.burst_gap
+            self._last_key_time = t
+        if new_burst:
+            self._request(t, frame_index)
+
+    def _request(self, t, frame_index):
+        if frame_index is None or frame_index < 0:
+            frame_index = 0
+        with self._lock:
+            if self._last_request_time is not None and t - self._last_request_time < self.min_interval:
+                return
+            self._last_request_time = t
+            if not self._frames or frame_index > self._frames[-1]:
+                self._frames.append(frame_index)
+
+    def frames(self):
+        """已请求关键帧的帧序号（升序）"""
+        with self._lock:
+            return list(self._frames)
+
+    def take_due(self, frame_index):
+        """供实时编码后端在编码每一帧前调用：该帧是否应编码为关键帧
+
+        请求的帧已经编码过时（写入线程领先于事件），在随后的第一帧补上关键帧。
+        """
+        with self._lock:
+            due = False
+            while self._next_due < len(self._frames) and self._frames[self._next_due] <= frame_index:
+                self._next_due += 1
+                due = True
+            return due
+
+    def force_key_frames_arg(self, video_fps):
+        """转换为 ffmpeg -force_key_frames 的时间列表参数（帧序号 / video_fps），没有请求时返回 None"""
+        frames = self.frames()
+        if not frames or not video_fps:
+            return None
+        # ffmpeg 在第一个时间 >= 给定值的帧上插入关键帧，向下取整到毫秒避免落到下一帧
+        return ",".join(f"{math.floor(index / video_fps * 1000) / 1000:.3f}" for index in frames)
@@ -0,0 +1,238 @@
+"""
+录制时输出滚动 HLS 直播
+
+LiveStreamer 把采集到的画面实时编码为 HLS：目录下的 index.m3u8 是主播放列表，每个码率档位一个子目录
+（<档位>/stream.m3u8 和 <档位>/seg_00001.ts ...），只保留最近 window 个分段，旧分段随写随删。
+用任何静态文件服务器共享这个目录即可在别的机器上观看：
+
+    python -m http.server 8000 --directory recordings/live
+    # 播放 http://<本机地址>:8000/index.m3u8
+
+直播不能拖慢采集和录制：
+- 采集线程只调用 submit()，把最新一帧的引用放进单帧槽位后立即返回，不复制、不等待
+- 独立的发送线程把槽位里的帧写给 ffmpeg；编码跟不上时槽位里的旧帧被新帧替换，只丢直播的帧
+- ffmpeg 以较低优先级运行，按帧到达的时钟时间打时间戳，再由 fps 滤镜整理为恒定帧率，
+  丢帧时画面停留在上一帧，时间轴不会变快
+- 每个档位的关键帧对齐分段边界，播放器可以在档位之间无缝切换
+
+    streamer = LiveStreamer("recordings/live", 1920, 1080, fps=30.0, renditions=LIVE_RENDITIONS)
+    streamer.start()
+    streamer.submit(img)  # 采集线程每帧调用
+    streamer.close()      # 播放列表写入 #EXT-X-ENDLIST
+"""
+import threading
+from pathlib import Path
+
+from luping.encoders import OutputProfile, PipeEncoderBackend, parse_bitrate
+
+DEFAULT_SEGMENT_SECONDS = 2.0
+DEFAULT_WINDOW = 6  # 播放列表保留最近 6 个分段（默认 12 秒）
+MASTER_PLAYLIST = "index.m3u8"
+# 单档位：不超过 1080p，4 Mbit/s
+DEFAULT_RENDITIONS = (OutputProfile("high", height=1080, bitrate="4000k"),)
+# 多档位示例：1080p / 720p / 360p，播放器按带宽自动选择
+LIVE_RENDITIONS = (
+    OutputProfile("1080p", height=1080, bitrate="4000k"),
+    OutputProfile("720p", height=720, bitrate="2000k"),
+    OutputProfile("360p", height=360, fps=15, bitrate="600k"),
+)
+# 档位没有设置码率时按每像素 0.1 bit 估算（主播放列表必须给出 BANDWIDTH）
+_BITS_PER_PIXEL = 0.1
+
+
+class HLSEncoderBackend(PipeEncoderBackend):
+    """ffmpeg 子进程：一路原始帧经 split 滤镜分成各档位，由 hls 封装器写滚动分段和播放列表"""
+
+    name = "ffmpeg_hls"
+    nice = 10
+
+    def __init__(self, directory, width, height, fps=30.0, renditions=DEFAULT_RENDITIONS,
+                 segment_seconds=DEFAULT_SEGMENT_SECONDS, window=DEFAULT_WINDOW, keep_segments=False, **kwargs):
+        """
+        Args:
+            directory: 输出目录（主播放列表为 directory/index.m3u8）
+            width, height: 输入帧尺寸（BGR24）
+            fps: 采集帧率（档位帧率的上限）
+            renditions: 码率档位（OutputProfile），名称即子目录名
+            segment_seconds: 分段时长（秒）
+            window: 播放列表保留的分段数
+            keep_segments: 保留滑出播放列表的旧分段（默认删除）
+        """
+        self.directory = Path(directory)
+        super().__init__(self.directory / MASTER_PLAYLIST, width, height, fps=fps, **kwargs)
+        self.renditions = list(renditions)
+        if not self.renditions:
+            raise ValueError("至少需要一个码率档位")
+        names = [r.name for r in self.renditions]
+        if len(set(names)) != len(names):
+            raise ValueError(f"档位名称重复: {names}")
+        self.segment_seconds = float(segment_seconds)
+        self.window = int(window)
+        self.keep_segments = keep_segments
+
+    def _rendition_bitrate(self, rendition):
+        """档位的码率（bit/s）：没有设置时按画面大小和帧率估算"""
+        if rendition.bitrate:
+            return parse_bitrate(rendition.bitrate)
+        width, height = rendition.size_for(self.width, self.height)
+        return int(width * height * rendition.fps_for(self.fps) * _BITS_PER_PIXEL)
+
+    def _command(self, ffmpeg_path):
+        graph = []
+        count = len(self.renditions)
+        if count > 1:
+            graph.append("[0:v]split=" + str(count) + "".join(f"[s{i}]" for i in range(count)))
+        maps = []
+        codec_args = []
+        stream_map = []
+        for i, rendition in enumerate(self.renditions):
+            width, height = rendition.size_for(self.width, self.height)
+            # 输入按到达时间打时间戳，fps 滤镜把它整理为恒定帧率（丢掉的帧以上一帧补上）
+            filters = [f"fps={rendition.fps_for(self.fps):g}"]
+            if (width, height) != (self.width, self.height):
+                filters.append(f"scale={width}:{height}:flags=area")
+            source = f"[s{i}]" if count > 1 else "[0:v]"
+            graph.append(f"{source}{','.join(filters)}[v{i}]")
+            maps += ['-map', f'[v{i}]']
+            bits = self._rendition_bitrate(rendition)
+            codec_args += [f'-c:v:{i}', rendition.codec, f'-preset:v:{i}', rendition.preset,
+                           f'-pix_fmt:v:{i}', rendition.pix_fmt,
+                           f'-b:v:{i}', str(bits), f'-maxrate:v:{i}', str(bits), f'-bufsize:v:{i}', str(bits * 2)]
+            stream_map.append(f"v:{i},name:{rendition.name}")
+        flags = "independent_segments+temp_file+program_date_time"
+        if not self.keep_segments:
+            flags += "+delete_segments"
+        cmd = [
+            ffmpeg_path,
+            '-y',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-s', f'{self.width}x{self.height}',
+            '-use_wallclock_as_timestamps', '1',
+            '-i', '-',
+            '-filter_complex', ";".join(graph),
+        ] + maps + codec_args + [
+            '-tune', 'zerolatency',
+            # 每个分段以关键帧开始，各档位的分段边界一致
+            '-force_key_frames', f'expr:gte(t,n_forced*{self.segment_seconds:g})',
+            '-f', 'hls',
+            '-hls_time', f'{self.segment_seconds:g}',
+            '-hls_list_size', str(self.window),
+            '-hls_flags', flags,
+            '-hls_segment_filename', str((self.directory / "%v" / "seg_%05d.ts").absolute()),
+            '-master_pl_name', MASTER_PLAYLIST,
+            '-var_stream_map', " ".join(stream_map),
+            str((self.directory / "%v" / "stream.m3u8").absolute()),
+        ]
+        self.profile = {"backend": self.name, "directory": str(self.directory), "playlist": MASTER_PLAYLIST,
+                        "segment_seconds": self.segment_seconds, "window": self.window,
+                        "renditions": [self._rendition_profile(r) for r in self.renditions]}
+        return cmd
+
+    def _rendition_profile(self, rendition):
+        width, height = rendition.size_for(self.width, self.height)
+        return {**rendition.to_dict(), "width": width, "height": height, "fps": rendition.fps_for(self.fps),
+                "bitrate": self._rendition_bitrate(rendition), "playlist": f"{rendition.name}/stream.m3u8"}
+
+    def _open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._remove_stale_files()
+        super()._open()
+
+    def _remove_stale_files(self):
+        """删除上一次直播留下的播放列表和分段，避免播放器读到旧内容"""
+        (self.directory / MASTER_PLAYLIST).unlink(missing_ok=True)
+        for rendition in self.renditions:
+            folder = self.directory / rendition.name
+            if not folder.is_dir():
+                continue
+            for path in list(folder.glob("seg_*.ts")) + list(folder.glob("stream.m3u8*")):
+                path.unlink(missing_ok=True)
+
+
+class LiveStreamer:
+    """把采集线程交来的最新一帧异步写给 HLS 编码器；编码跟不上时只丢直播的帧"""
+
+    def __init__(self, directory, width, height, fps=30.0, renditions=None,
+                 segment_seconds=DEFAULT_SEGMENT_SECONDS, window=DEFAULT_WINDOW, keep_segments=False):
+        self.backend = HLSEncoderBackend(directory, width, height, fps=fps,
+                                         renditions=renditions or DEFAULT_RENDITIONS,
+                                         segment_seconds=segment_seconds, window=window,
+                                         keep_segments=keep_segments)
+        self.directory = self.backend.directory
+        self.submitted = 0
+        self.dropped = 0  # 发送线程还没取走就被新帧替换的帧数
+        self.error = None
+        self._pending = None
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = None
+
+    @property
+    def playlist_path(self):
+        return self.directory / MASTER_PLAYLIST
+
+    def start(self):
+        """启动 ffmpeg 和发送线程
+
+        Raises:
+            RuntimeError: ffmpeg 无法启动
+        """
+        self.backend.start()
+        self._thread = threading.Thread(target=self._run, name="live-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, img):
+        """交给直播一帧（只保存引用，立即返回；调用方之后不能再修改这块内存）"""
+        with self._cond:
+            if self._closing or self.error is not None:
+                return
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = img
+            self.submitted += 1
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closing:
+                    self._cond.wait()
+                img, self._pending = self._pending, None
+                if img is None:
+                    return
+            try:
+                self.backend.write(img)
+            except Exception as e:
+                with self._cond:
+                    self.error = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+                    self._pending = None
+                print(f"✗ 直播编码出错，停止直播（录制不受影响）: {e}")
+                return
+
+    def metrics(self):
+        """直播的实时指标：交来的帧数、发送给编码器的帧数、被替换丢弃的帧数和编码器进度"""
+        metrics = self.backend.metrics()
+        metrics.update({"submitted": self.submitted, "dropped": self.dropped, "error": self.error})
+        return metrics
+
+    def close(self):
+        """发完槽位里的最后一帧，关闭 ffmpeg（播放列表写入 #EXT-X-ENDLIST），返回统计"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+        try:
+            self.backend.close()
+        except Exception as e:
+            self.error = self.error or str(e)
+        return self.stats()
+
+    def stats(self):
+        stats = self.backend.stats()
+        stats.update({"submitted": self.submitted, "dropped": self.dropped})
+        if self.error:
+            stats["error"] = self.error
+        return {**self.backend.profile, "stats": stats} if self.backend.profile else {"stats": stats}
@@ -0,0 +1,150 @@
+"""
+录制清单（recording_*.manifest.json）
+
+停止录制后把几何信息、编码参数、帧数/丢帧数、会话时钟起点、分段列表和文件校验和
+原子写到视频旁边。校验、修复和归档工具读取清单即可拿到这些信息，不需要重新打开视频：
+只要文件大小和修改时间与清单记录一致，就可以直接信任清单中的容器信息。
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+_CHUNK_SIZE = 1024 * 1024
+
+
+def manifest_path_for(video_path):
+    """视频文件对应的清单路径（与视频同名，后缀 .manifest.json）"""
+    video_path = Path(video_path)
+    return video_path.with_name(video_path.stem + ".manifest.json")
+
+
+def file_checksum(path):
+    """文件的 sha256（分块读取，内存占用恒定）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_entry(path, checksum=True):
+    """清单中的文件条目：名称、大小、修改时间和可选的 sha256；文件不存在时返回 None"""
+    if path is None or not Path(path).exists():
+        return None
+    path = Path(path)
+    stat = path.stat()
+    entry = {"name": path.name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if checksum:
+        entry["sha256"] = file_checksum(path)
+    return entry
+
+
+def container_summary(info):
+    """probe_container 结果中需要写入清单的部分"""
+    keyframes = info.get("keyframes")
+    return {
+        "format": info["format"],
+        "codec": info["codec"],
+        "duration": round(info["duration"], 3),
+        "frame_count": info["frame_count"],
+        "fps": round(info["fps"], 3),
+        "width": info["width"],
+        "height": info["height"],
+        "keyframe_count": len(keyframes) if keyframes is not None else None,
+        "keyframes": list(keyframes) if keyframes is not None else None,
+        "keyframe_times": [round(t, 4) for t in info.get("keyframe_times") or []] or None,
+        "truncated": info["truncated"],
+    }
+
+
+def save_manifest(path, data):
+    """原子写入清单"""
+    path = Path(path)
+    data = {"version": MANIFEST_VERSION, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **data}
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_manifest(path):
+    """读取清单，不存在或无法解析时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version", 0) > MANIFEST_VERSION:
+        return None
+    return data
+
+
+def manifest_for(video_path):
+    """读取视频对应的清单，且仅当视频大小和修改时间与清单一致时返回（快速路径）"""
+    video_path = Path(video_path)
+    manifest = load_manifest(manifest_path_for(video_path))
+    if manifest is None:
+        return None
+    entry = (manifest.get("files") or {}).get("video")
+    if not entry or entry.get("name") != video_path.name:
+        return None
+    try:
+        stat = video_path.stat()
+    except OSError:
+        return None
+    if entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+        return None
+    return manifest
+
+
+def _file_entries(manifest):
+    """清单中的各文件条目 (角色, 条目)，包括 files.outputs 下的附加输出"""
+    for role, entry in (manifest.get("files") or {}).items():
+        if role == "outputs" and isinstance(entry, dict):
+            for name, output in entry.items():
+                if output:
+                    yield f"outputs.{name}", output
+        elif entry:
+            yield role, entry
+
+
+def verify_checksums(video_path, manifest):
+    """按清单重新计算各文件的 sha256，返回不一致的问题列表"""
+    problems = []
+    directory = Path(video_path).parent
+    for role, entry in _file_entries(manifest):
+        if "sha256" not in entry:
+            continue
+        path = directory / entry["name"]
+        if not path.exists():
+            problems.append(f"{role} 文件缺失: {entry['name']}")
+        elif file_checksum(path) != entry["sha256"]:
+            problems.append(f"{role} 文件校验和不一致: {entry['name']}")
+    return problems
+
+
+def record_checksums(video_path, manifest):
+    """给清单中还没有 sha256 的文件补上校验和（原地修改 manifest），返回补上的个数
+
+    录制时默认不计算校验和（避免停止录制时读一遍大文件），第一次批量校验时补上，之后的校验据此比对。
+    只给大小和修改时间仍与清单一致的文件补，录制后被改动过的文件不能当作原始内容记下来。
+    """
+    directory = Path(video_path).parent
+    added = 0
+    for _, entry in _file_entries(manifest):
+        if "sha256" in entry or "size" not in entry:
+            continue
+        path = directory / entry["name"]
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        if stat.st_size != entry["size"] or stat.st_mtime_ns != entry.get("mtime_ns"):
+            continue
+        entry["sha256"] = file_checksum(path)
+        added += 1
+    return added
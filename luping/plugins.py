@@ -0,0 +1,284 @@
+"""
+逐帧插件：在录制流水线里运行自己的逐帧代码（检测、打码、统计），不需要改 _record_screen
+
+两类插件：
+
+变换（transform）  func(img, frame_index, capture_time) -> 新图像或 None（None 表示已原地修改 img）
+    在采集线程里按注册顺序串联执行，发生在帧进入写入队列之前，编码器、磁盘溢出文件、直播和帧广播
+    看到的都是变换后的画面（打码必须在画面落盘之前完成）。返回的图像必须与输入尺寸和类型相同。
+    变换直接占用采集时间，应当足够快；可以用 every=N 每 N 帧执行一次。
+
+消费者（consumer）  func(img, frame_index, capture_time)，返回值忽略
+    每个消费者一个工作线程和一个有界队列，拿到的是变换后画面的只读视图（不复制）。入队策略：
+    - "drop"   （默认）队列满时丢掉这一帧，永远不阻塞采集
+    - "block"  队列满时采集线程等待消费者，保证每一帧都送到（会拖慢录制，只用于必须逐帧处理的场景）
+    - "sample" 每 every 帧送一帧，队列满时同样丢弃
+
+每个插件都统计调用次数、耗时分布（p50/p99/最大，毫秒）、被丢弃 / 跳过的帧数和出错次数，
+plugins.stats() 随时可取，停止录制后写入录制清单的 plugins 字段。插件抛出的异常只计数并打印第一次，
+不影响录制（变换出错时这一帧保持出错前的状态继续写入）。
+
+    recorder.plugins.add_transform(mask_faces, name="faces")
+    recorder.plugins.add_consumer(detector, policy="sample", every=10)
+    recorder.plugins.add_consumer(metrics, policy="drop", queue_size=4)
+    recorder.plugins.remove("faces")
+
+插件对象有 close() 方法时，停止录制后调用一次。录制过程中也可以注册和移除插件。
+"""
+import threading
+import time
+from collections import deque
+from queue import Empty, Full, Queue
+
+import numpy as np
+
+from luping.encoders import percentile
+
+DROP = "drop"
+BLOCK = "block"
+SAMPLE = "sample"
+POLICIES = (DROP, BLOCK, SAMPLE)
+DEFAULT_QUEUE_SIZE = 2
+LATENCY_WINDOW = 1800  # 耗时分布统计最近 1800 次调用（30fps 下 1 分钟）
+
+
+class _Plugin:
+    """一个已注册的插件及其统计"""
+
+    def __init__(self, name, func, kind, policy, every, queue_size):
+        self.name = name
+        self.func = func
+        self.kind = kind
+        self.policy = policy
+        self.every = every
+        self.closed = False
+        self.queue = Queue(maxsize=queue_size) if kind == "consumer" else None
+        self.thread = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.offered = 0  # 交给插件的帧数（含跳过和丢弃的）
+        self.calls = 0
+        self.skipped = 0  # 按 every 跳过的帧数
+        self.dropped = 0  # 队列满而丢弃的帧数
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.queue_max = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def due(self):
+        """这一帧是否轮到该插件（按 every 抽样）"""
+        self.offered += 1
+        if self.every > 1 and (self.offered - 1) % self.every:
+            self.skipped += 1
+            return False
+        return True
+
+    def call(self, img, frame_index, capture_time):
+        start = time.perf_counter()
+        try:
+            return self.func(img, frame_index, capture_time)
+        except Exception as e:
+            self.errors += 1
+            if self.errors == 1:
+                print(f"✗ 插件 {self.name} 出错（之后的错误不再打印）: {e}")
+            return None
+        finally:
+            elapsed = time.perf_counter() - start
+            self.calls += 1
+            self.seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+            self._latencies.append(elapsed)
+
+    def run(self):
+        """消费者工作线程"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self.call(*item)
+
+    def stats(self):
+        values = sorted(self._latencies)
+        stats = {
+            "name": self.name,
+            "kind": self.kind,
+            "frames": self.offered,
+            "calls": self.calls,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "mean_ms": round(self.seconds / self.calls * 1000, 3) if self.calls else None,
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(self.max_seconds * 1000, 3),
+        }
+        if self.every > 1:
+            stats["every"] = self.every
+        if self.kind == "consumer":
+            stats.update({"policy": self.policy, "dropped": self.dropped, "queue_max": self.queue_max,
+                          "queued": self.queue.qsize()})
+        return stats
+
+
+class PluginHost:
+    """插件注册表：采集线程调用 transform() / consume()，录制器在开始 / 停止录制时调用 start() / stop()"""
+
+    def __init__(self):
+        # 注册表整体替换而不是原地修改，采集线程遍历时不用加锁
+        self._transforms = ()
+        self._consumers = ()
+        self._lock = threading.Lock()
+        self._running = False
+
+    def __bool__(self):
+        return bool(self._transforms or self._consumers)
+
+    def add_transform(self, func, name=None, every=1):
+        """注册一个变换，按注册顺序串联在编码之前执行，返回插件名称"""
+        plugin = self._make(func, name, "transform", BLOCK if every <= 1 else SAMPLE, every, 0)
+        with self._lock:
+            self._transforms = self._transforms + (plugin,)
+        return plugin.name
+
+    def add_consumer(self, func, name=None, policy=DROP, every=1, queue_size=DEFAULT_QUEUE_SIZE):
+        """注册一个消费者（独立工作线程），返回插件名称
+
+        Args:
+            policy: "drop"（队列满时丢帧，不阻塞采集）、"block"（队列满时等待）或 "sample"（每 every 帧一帧）
+            every: 抽样间隔（"sample" 策略必须大于 1，其他策略也可以用来降低频率）
+            queue_size: 队列长度
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"未知的入队策略: {policy}（可选 {', '.join(POLICIES)}）")
+        if policy == SAMPLE and every <= 1:
+            raise ValueError("sample 策略需要 every > 1")
+        plugin = self._make(func, name, "consumer", policy, every, max(1, int(queue_size)))
+        with self._lock:
+            self._consumers = self._consumers + (plugin,)
+            if self._running:
+                self._start_worker(plugin)
+        return plugin.name
+
+    def remove(self, name):
+        """移除插件（消费者处理完队列里的帧后结束），返回是否找到"""
+        with self._lock:
+            transforms = tuple(p for p in self._transforms if p.name != name)
+            consumers = tuple(p for p in self._consumers if p.name != name)
+            removed = [p for p in self._transforms + self._consumers if p.name == name]
+            self._transforms, self._consumers = transforms, consumers
+        for plugin in removed:
+            self._finish(plugin)
+        return bool(removed)
+
+    def _make(self, func, name, kind, policy, every, queue_size):
+        name = name or getattr(func, "name", None) or getattr(func, "__name__", None) or type(func).__name__
+        with self._lock:
+            existing = {p.name for p in self._transforms + self._consumers}
+        if name in existing:
+            raise ValueError(f"插件名称重复: {name}")
+        return _Plugin(name, func, kind, policy, max(1, int(every)), queue_size)
+
+    # -------------------- 录制器调用 --------------------
+    def start(self):
+        """开始录制：清零统计，启动各消费者的工作线程"""
+        with self._lock:
+            self._running = True
+            for plugin in self._transforms:
+                plugin.reset_stats()
+            for plugin in self._consumers:
+                plugin.reset_stats()
+                self._start_worker(plugin)
+
+    def _start_worker(self, plugin):
+        if plugin.thread is None or not plugin.thread.is_alive():
+            plugin.closed = False
+            plugin.thread = threading.Thread(target=plugin.run, name=f"plugin-{plugin.name}", daemon=True)
+            plugin.thread.start()
+
+    def transform(self, img, frame_index, capture_time):
+        """依次执行各变换，返回最终图像（采集线程调用）"""
+        for plugin in self._transforms:
+            if not plugin.due():
+                continue
+            result = plugin.call(img, frame_index, capture_time)
+            if result is None:
+                continue
+            if result.shape != img.shape or result.dtype != img.dtype:
+                # 编码器的帧尺寸在开始录制时已经确定
+                plugin.errors += 1
+                if plugin.errors == 1:
+                    print(f"✗ 插件 {plugin.name} 返回的图像 {result.shape}/{result.dtype} 与输入 "
+                          f"{img.shape}/{img.dtype} 不一致，已忽略")
+                continue
+            img = np.ascontiguousarray(result)
+        return img
+
+    def consume(self, img, frame_index, capture_time):
+        """把一帧的只读视图交给各消费者（采集线程调用）"""
+        consumers = self._consumers
+        if not consumers:
+            return
+        view = img.view()
+        view.flags.writeable = False
+        item = (view, frame_index, capture_time)
+        for plugin in consumers:
+            if not plugin.due():
+                continue
+            if plugin.policy == BLOCK:
+                # 分段等待：插件在等待期间被移除时不会把采集线程永久卡住
+                while not plugin.closed:
+                    try:
+                        plugin.queue.put(item, timeout=0.1)
+                        break
+                    except Full:
+                        pass
+            else:
+                try:
+                    plugin.queue.put_nowait(item)
+                except Full:
+                    plugin.dropped += 1
+                    continue
+            plugin.queue_max = max(plugin.queue_max, plugin.queue.qsize())
+
+    def stop(self, timeout=10.0):
+        """停止录制：等各消费者处理完队列中的帧，调用插件的 close()，返回统计"""
+        with self._lock:
+            self._running = False
+            plugins = self._transforms + self._consumers
+        for plugin in plugins:
+            self._finish(plugin, timeout)
+        return self.stats()
+
+    def _finish(self, plugin, timeout=10.0):
+        if plugin.thread is not None:
+            plugin.closed = True
+            deadline = time.monotonic() + timeout
+            try:
+                plugin.queue.put(None, timeout=timeout)
+            except Full:
+                pass
+            plugin.thread.join(timeout=max(0.0, deadline - time.monotonic()))
+            if plugin.thread.is_alive():
+                print(f"⚠️ 插件 {plugin.name} 在 {timeout:.0f} 秒内没有处理完队列，放弃等待")
+                # 丢掉还没处理的帧，让工作线程尽快看到结束信号
+                try:
+                    while True:
+                        plugin.queue.get_nowait()
+                except Empty:
+                    pass
+                try:
+                    plugin.queue.put_nowait(None)
+                except Full:
+                    pass
+            plugin.thread = None
+        close = getattr(plugin.func, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                print(f"⚠️ 关闭插件 {plugin.name} 时出错: {e}")
+
+    def stats(self):
+        """各插件的统计（按注册顺序，变换在前）"""
+        return [plugin.stats() for plugin in self._transforms + self._consumers]
@@ -2,6 +2,7 @@
 录屏软件 - 记录屏幕、键盘和鼠标操作
 """
 import json
+import os
 import time
 import threading
 from datetime import datetime
@@ -12,9 +13,25 @@ import mss
 import numpy as np
 import platform
 import subprocess
-import shutil
 import sys
 
+from luping.activity import ActivityIndexWriter, activity_path_for
+from luping.container import probe_container, sampled_decode_check, verify_container
+from luping.encoder_supervisor import EncoderSupervisor, join_segments
+from luping.encoders import create_encoder
+from luping.ffmpeg_tools import find_ffmpeg, run_ffmpeg
+from luping.frame_pack import DEFAULT_QUALITY, PackedFrameWriter, packed_path_for
+from luping.keyframes import KeyframeScheduler
+from luping.live_stream import DEFAULT_SEGMENT_SECONDS, DEFAULT_WINDOW, LiveStreamer
+from luping.manifest import container_summary, file_entry, manifest_path_for, save_manifest
+from luping.masking import FILL, PrivacyMask
+from luping.plugins import PluginHost
+from luping.shm_broadcast import DEFAULT_SLOTS, FramePublisher
+from luping.spill import DEFAULT_RAM_FRAMES, DEFAULT_SPILL_BYTES, SpillQueue
+from luping.timeline import FrameTimeline, SessionClock, timeline_path_for
+from luping.trajectory import TrajectoryCompressor
+from luping.transcode_queue import TranscodeQueue, create_job, intermediate_path_for, pending_jobs
+
 # 尝试导入 dxcam（Windows GPU加速屏幕捕获）
 _dxcam = None
 _dxcam_available = False
@@ -83,7 +100,15 @@ def _get_mouse():
 class ScreenRecorder:
     """屏幕录制器"""
     
-    def __init__(self, output_dir="recordings", scale_factor=1.0, target_fps=30.0):
+    def __init__(self, output_dir="recordings", scale_factor=1.0, target_fps=30.0,
+                 mouse_move_tolerance=3.0, mouse_move_max_gap=0.5,
+                 embed_event_subtitles=False, interaction_keyframes=False, verify_decode=False,
+                 manifest_checksums=False, activity_index=True, lossless_capture=False,
+                 spill_to_disk=True, spill_max_bytes=DEFAULT_SPILL_BYTES, spill_compress=False,
+                 encoder_backend="auto", encoder_watchdog=True, extra_outputs=(),
+                 live_hls_dir=None, live_hls_segment_seconds=DEFAULT_SEGMENT_SECONDS, live_hls_window=DEFAULT_WINDOW,
+                 live_hls_renditions=None, frame_broadcast=None, frame_broadcast_slots=DEFAULT_SLOTS,
+                 privacy_regions=None, privacy_mode=FILL):
         """
         初始化录屏器
         
@@ -91,27 +116,103 @@ class ScreenRecorder:
             output_dir: 输出目录
             scale_factor: 分辨率缩放因子 (0.5 = 半分辨率, 1.0 = 原始分辨率)
             target_fps: 目标帧率 (默认30帧)
+            mouse_move_tolerance: 鼠标轨迹压缩容差（像素），轨迹偏离直线超过该值才记录拐点
+            mouse_move_max_gap: 持续移动时两个鼠标移动事件之间的最大间隔（秒）
+            embed_event_subtitles: 停止录制后把按键/点击作为字幕轨封装进视频（流复制，不重新编码）
+            interaction_keyframes: 在鼠标点击和每段输入开始处强制关键帧，便于快速跳转到交互位置。
+                PyAV 后端在编码时插入；ffmpeg 管道改为把 GOP 缩短到 1 秒，精确的交互关键帧和 OpenCV 后端一样
+                只在已经要重新编码时（帧率修正、转码）插入，不为此单独重新编码
+            verify_decode: 停止录制后除容器结构检查外，再抽样解码几帧（较慢）
+            manifest_checksums: 停止录制时就在录制清单中记录各文件的 sha256（需要把文件完整读一遍；
+                默认不计算，由 batch_verify --checksums 第一次运行时补上）
+            activity_index: 录制时计算逐帧画面变化，写入活动索引（recording_*.activity）
+            lossless_capture: 录制时只写无损中间文件（编码开销极低，高分辨率下不丢帧），
+                停止后由后台队列在机器空闲时转码为 H.264
+            spill_to_disk: 写入跟不上时，超出内存缓冲（90 帧）的帧暂存到本地磁盘的环形文件而不是丢弃
+            spill_max_bytes: 溢出文件容量（字节）
+            spill_compress: 用 LZ4 压缩溢出的帧（需要安装 lz4）
+            encoder_backend: 实时编码后端，"auto"（已安装 PyAV 时进程内编码，否则 ffmpeg 管道）、"pyav" 或 "pipe"
+            encoder_watchdog: 编码器崩溃或卡住时自动切换到新分段继续录制（见 luping.encoder_supervisor）
+            extra_outputs: 附加输出的 OutputProfile 列表（如 PROXY_PROFILE），与主输出共用同一路采集帧，
+                写到 recording_*.<名称>.mp4
+            live_hls_dir: 录制时把画面实时写成滚动 HLS 的目录（见 luping.live_stream），None 表示不直播
+            live_hls_segment_seconds: HLS 分段时长（秒）
+            live_hls_window: 播放列表保留的分段数
+            live_hls_renditions: HLS 码率档位（OutputProfile 列表，如 LIVE_RENDITIONS），默认单档位 1080p
+            frame_broadcast: 共享内存名称（如 "luping_frames"），录制时把每一帧发布到该共享内存，
+                本机其他进程用 luping.shm_broadcast.FrameSubscriber 读取；None 表示不发布
+            frame_broadcast_slots: 共享内存环形缓冲区的槽位数
+            privacy_regions: 隐私打码区域 [(x, y, 宽, 高), ...]（帧像素坐标，见 luping.masking），
+                在画面交给任何输出之前打码；传入空列表表示只启用、录制中再用 privacy_mask.set_regions() 设置
+            privacy_mode: 打码方式，"fill"（纯色）、"pixelate"（马赛克）或 "blur"（模糊）
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         
         self.scale_factor = max(0.25, min(1.0, scale_factor))  # 限制在 0.25-1.0 之间
         self.target_fps = max(15.0, min(60.0, target_fps))  # 限制在 15-60 之间
+        self.embed_event_subtitles = embed_event_subtitles
+        self.interaction_keyframes = interaction_keyframes
+        self.verify_decode = verify_decode
+        self.manifest_checksums = manifest_checksums
+        self.activity_index = activity_index
+        self.lossless_capture = lossless_capture
+        self.spill_to_disk = spill_to_disk
+        self.spill_max_bytes = spill_max_bytes
+        self.spill_compress = spill_compress
+        self.encoder_backend = encoder_backend
+        self.encoder_watchdog = encoder_watchdog
+        self.extra_outputs = list(extra_outputs)
+        self.live_hls_dir = Path(live_hls_dir) if live_hls_dir is not None else None
+        self.live_hls_segment_seconds = live_hls_segment_seconds
+        self.live_hls_window = live_hls_window
+        self.live_hls_renditions = live_hls_renditions
+        self.live_stream = None  # 录制中的 LiveStreamer
+        self.live_stream_profile = None  # 直播参数和统计（写入录制清单）
+        self.frame_broadcast = frame_broadcast
+        self.frame_broadcast_slots = frame_broadcast_slots
+        self.frame_publisher = None  # 录制中的 FramePublisher
+        self.frame_broadcast_stats = None
+        # 逐帧插件（变换和消费者，见 luping.plugins），注册在多次录制之间保留
+        self.plugins = PluginHost()
+        self.plugin_stats = None
+        # 隐私打码作为第一个变换，用户注册的插件看到的也是打码后的画面
+        self.privacy_mask = None
+        if privacy_regions is not None:
+            self.privacy_mask = PrivacyMask(privacy_regions, mode=privacy_mode)
+            self.plugins.add_transform(self.privacy_mask)
         
         self.is_recording = False
         self.recording_thread = None
         self.video_writer = None
-        self.use_image_sequence = False  # 备用方案：保存为图像序列
-        self.frame_dir = None
+        self.use_image_sequence = False  # 备用方案：保存为图像序列（多线程编码 JPEG，写入打包帧文件）
+        self._packed_writer = None
         self.frame_count = 0
-        # FFmpeg 管道写入器相关
+        # FFmpeg 编码后端相关（ffmpeg 管道或 PyAV 进程内编码，见 luping.encoders）
         self.use_ffmpeg_pipe = False
-        self.ffmpeg_proc = None
-        self.ffmpeg_stdin = None
+        self.encoder = None
+        self.encoder_segments = None  # 看门狗记录的分段和缺口（写入录制清单）
+        self.encoder_gaps = []
+        self.output_files = {}  # 附加输出名称 -> 文件路径
         # 调试/诊断字段
         self._frames_written = 0
         self._writer_opened = False
         self._ffmpeg_stderr = None
+        # 录制清单相关
+        self.encoder_profile = None  # 本次录制使用的编码参数
+        self._post_processing = []  # 停止录制后对视频做过的处理
+        self.manifest_path = None
+        # 活动索引相关
+        self.activity_path = None
+        self._activity_writer = None
+        # 无损录制模式相关
+        self.intermediate_path = None
+        self.transcode_job_path = None
+        self.transcode_queue = None
+        self._resume_transcodes()
+        # 写入队列磁盘溢出相关
+        self.spill_metrics = None
+        self._draining = False  # 停止采集后写入线程仍在写出积压的帧
         
         # 延迟初始化 mss，避免在导入时就初始化
         self.sct = None
@@ -158,8 +259,22 @@ class ScreenRecorder:
         self.keyboard_listener = None
         self.mouse_listener = None
         
-        # 录制开始时间
+        # 交互关键帧请求（点击、每段输入的第一次按键）
+        self.keyframes = KeyframeScheduler()
+        
+        # 鼠标轨迹压缩器（替代固定间隔采样）
+        self._mouse_trajectory = TrajectoryCompressor(
+            tolerance=mouse_move_tolerance,
+            max_gap=mouse_move_max_gap,
+        )
+        
+        # 录制开始时间（墙钟，供界面计时显示）
         self.start_time = None
+        # 会话时钟：事件时间戳和帧捕获时间共用同一个单调时钟
+        self.clock = SessionClock()
+        # 帧序号 -> 捕获时间 表
+        self.timeline = None
+        self.timeline_path = None
         
     def start_recording(self):
         """开始录制"""
@@ -181,12 +296,28 @@ class ScreenRecorder:
                 raise RuntimeError(f"无法初始化屏幕捕获: {e}")
             
         self.is_recording = True
-        self.start_time = time.time()
+        self.start_time = self.clock.start()
+        self._mouse_trajectory.reset()
+        self.keyframes.reset()
         
         # 创建输出文件名（优先使用 MP4 格式）
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.video_path = self.output_dir / f"recording_{timestamp}.mp4"
         self.events_path = self.output_dir / f"events_{timestamp}.json"
+        self.timeline_path = timeline_path_for(self.video_path)
+        self.manifest_path = None
+        self.encoder = None
+        self.encoder_profile = None
+        self.encoder_segments = None
+        self.encoder_gaps = []
+        self.output_files = {}
+        self._post_processing = []
+        self.spill_metrics = None
+        self.intermediate_path = None
+        self.transcode_job_path = None
+        if self.transcode_queue is not None:
+            # 录制期间不开始新的转码分段，把 CPU 留给采集
+            self.transcode_queue.pause()
         
         # 确保输出目录存在且可写
         try:
@@ -206,12 +337,27 @@ class ScreenRecorder:
         
         # 优先尝试 FFmpeg 管道（速度最快，能保证帧率）
         print("尝试使用 FFmpeg 管道写入（高性能模式）...")
-        ffmpeg_ok = self._try_start_ffmpeg(self.video_path)
+        if self.lossless_capture:
+            self.intermediate_path = intermediate_path_for(self.video_path)
+            ffmpeg_ok = self._try_start_ffmpeg(self.intermediate_path, lossless=True)
+            if not ffmpeg_ok:
+                self.intermediate_path = None
+        else:
+            ffmpeg_ok = self._try_start_ffmpeg(self.video_path)
         if ffmpeg_ok:
             self.use_ffmpeg_pipe = True
-            print(f"✓ 使用 FFmpeg 管道写入: {self.video_path}")
+            print(f"✓ 使用 {self.encoder.name} 编码后端写入: {self.intermediate_path or self.video_path}")
+            video_fps = 30.0  # 管道输入帧率固定为 30
+            if self.interaction_keyframes and not self.lossless_capture and not self.encoder.live_keyframes:
+                gop = self.encoder_profile.get("gop")
+                print(f"⚠️ {self.encoder.name} 后端不能在编码时按交互插入关键帧，改为每 {gop} 帧一个关键帧；"
+                      f"精确的交互关键帧只在停止后需要修正帧率时插入（安装 PyAV 可在编码时插入）")
         else:
             print("FFmpeg 不可用，回退到 OpenCV 编码器...")
+            if self.extra_outputs:
+                print("⚠️ OpenCV 编码器和图像序列不支持附加输出，本次录制只生成主输出")
+            if self.interaction_keyframes:
+                print("⚠️ OpenCV 编码器不支持交互关键帧，只在停止后需要修正帧率时插入")
             # 尝试多个编码器，按优先级顺序
             codecs_to_try = [
                 ('MJPG', 'MJPG', '.avi'),  # Motion JPEG，AVI 格式（兼容性好）
@@ -253,6 +399,8 @@ class ScreenRecorder:
                         print(f"  VideoWriter.isOpened() = True")
                         print(f"✓ 使用 {codec_name} 编码器初始化视频写入器成功")
                         self.video_path = video_path_actual
+                        self.encoder_profile = {"backend": "opencv", "codec": codec_name, "fourcc": fourcc_code,
+                                                "fps": self.target_fps}
                         self._writer_opened = True
                         break
                     else:
@@ -275,14 +423,54 @@ class ScreenRecorder:
                     continue
             
             if self.video_writer is None or not self.video_writer.isOpened():
-                # 回退到图像序列方案
+                # 回退到图像序列方案：多线程编码 JPEG，追加到打包帧文件，之后由后台转码队列合成视频
                 print("⚠️ 所有编码器不可用，回退到图像序列保存")
                 self.video_writer = None
                 self.use_image_sequence = True
-                self.frame_dir = self.video_path.parent / f"{self.video_path.stem}_frames"
-                self.frame_dir.mkdir(parents=True, exist_ok=True)
+                self.intermediate_path = packed_path_for(self.video_path)
+                self._packed_writer = PackedFrameWriter(self.intermediate_path, quality=DEFAULT_QUALITY)
                 self.frame_count = 0
-                print(f"✓ 图像序列将保存到: {self.frame_dir}")
+                print(f"✓ 图像序列将打包保存到: {self.intermediate_path} ({self._packed_writer.workers} 个编码线程)")
+                self.encoder_profile = {"backend": "image_sequence", "codec": "jpeg", "quality": DEFAULT_QUALITY,
+                                        "container": "packed_mjpeg", "workers": self._packed_writer.workers}
+            video_fps = self.target_fps
+        
+        self.timeline = FrameTimeline(video_fps=video_fps)
+        self.timeline.epoch = self.clock.epoch
+        
+        # 逐帧活动索引：写入线程中计算，与帧时间表逐帧对应
+        self.activity_path = None
+        self._activity_writer = None
+        if self.activity_index:
+            try:
+                self.activity_path = activity_path_for(self.video_path)
+                self._activity_writer = ActivityIndexWriter(self.activity_path)
+            except Exception as e:
+                print(f"⚠️ 无法创建活动索引: {e}")
+                self.activity_path = None
+        
+        # 滚动 HLS 直播：独立的 ffmpeg 进程，失败不影响录制
+        self.live_stream = None
+        self.live_stream_profile = None
+        if self.live_hls_dir is not None:
+            self._start_live_stream()
+        
+        # 共享内存帧广播
+        self.frame_publisher = None
+        self.frame_broadcast_stats = None
+        if self.frame_broadcast:
+            try:
+                self.frame_publisher = FramePublisher(self.frame_broadcast, self.width, self.height,
+                                                      slots=self.frame_broadcast_slots)
+                print(f"✓ 帧广播已开始: 共享内存 {self.frame_broadcast}（{self.frame_broadcast_slots} 个槽位）")
+            except Exception as e:
+                print(f"⚠️ 无法创建帧广播（录制不受影响）: {e}")
+        
+        # 逐帧插件：启动各消费者的工作线程
+        self.plugin_stats = None
+        if self.plugins:
+            self.plugins.start()
+            print(f"✓ 逐帧插件: {', '.join(s['name'] for s in self.plugins.stats())}")
         
         # 延迟加载并启动键盘和鼠标监听
         # 在 macOS 上，pynput 的某些操作可能导致崩溃，所以完全可选
@@ -405,26 +593,55 @@ class ScreenRecorder:
             self.keyboard_listener.stop()
         if self.mouse_listener:
             self.mouse_listener.stop()
+        # 补上鼠标轨迹的最后一个点
+        self._flush_mouse_trajectory()
         
         # 等待录制线程结束
         if self.recording_thread:
             self.recording_thread.join(timeout=2)
+            # 积压的帧（含溢出到磁盘的）写完前不要关闭写入器；只要写入还在推进就继续等
+            while self.recording_thread.is_alive() and self._draining:
+                self.recording_thread.join(timeout=1)
+        self._stop_live_stream()
+        if self.frame_publisher is not None:
+            self.frame_broadcast_stats = self.frame_publisher.stats()
+            self.frame_publisher.close()
+            self.frame_publisher = None
+        if self.plugins:
+            self.plugin_stats = self.plugins.stop()
         
         # 释放视频写入器或处理图像序列
         if self.use_image_sequence:
             print("正在完成图像序列保存...")
             try:
-                if self.frame_dir and self.frame_dir.exists():
-                    frame_count = len(list(self.frame_dir.glob("frame_*.jpg")))
-                    print(f"✓ 图像序列已保存: {self.frame_dir}")
-                    print(f"  共 {frame_count} 帧图像")
-                    print(f"  提示: 可以使用 FFmpeg 转换为视频:")
-                    output_video = self.video_path.parent / (self.video_path.stem + '_from_frames.mp4')
-                    print(f"  ffmpeg -r 30 -i \"{self.frame_dir}/frame_%06d.jpg\" -c:v libx264 -pix_fmt yuv420p \"{output_video}\"")
+                stats = self._packed_writer.close()
+                print(f"✓ 图像序列已打包保存: {self.intermediate_path}")
+                print(f"  共 {stats['frames']} 帧，平均 {stats['avg_kb']} KB/帧，"
+                      f"单帧编码 {stats['encode_ms']} ms（{stats['workers']} 个编码线程）")
+                # 帧率修正留到合成视频时重写时间戳
+                actual_duration = getattr(self, '_actual_recording_duration', 0)
+                if actual_duration > 0 and stats['frames'] > 0:
+                    actual_fps = stats['frames'] / actual_duration
+                    if abs(actual_fps - self.target_fps) > 2.0:
+                        print(f"检测到帧率不匹配: 实际FPS={actual_fps:.2f}，合成视频时修正")
+                        self.timeline.video_fps = actual_fps
             except Exception as e:
                 print(f"⚠️ 处理图像序列时发生错误: {e}")
                 import traceback
                 traceback.print_exc()
+            self._packed_writer = None
+        elif self.use_ffmpeg_pipe and self.intermediate_path is not None:
+            print("正在关闭 FFmpeg 管道并等待进程完成...")
+            self._stop_ffmpeg()
+            print(f"✓ 无损中间文件已写入: {self.intermediate_path}")
+            # 帧率修正留到转码拼接时重写时间戳，这里只更新帧时间表
+            actual_duration = getattr(self, '_actual_recording_duration', 0)
+            if actual_duration > 0 and self._frames_written > 0:
+                actual_fps = self._frames_written / actual_duration
+                if abs(actual_fps - 30.0) > 2.0:
+                    print(f"检测到帧率不匹配: 实际FPS={actual_fps:.2f}，转码时修正")
+                    self.timeline.video_fps = actual_fps
+                    self._retime_extra_outputs(actual_fps)
         elif self.use_ffmpeg_pipe:
             # 关闭 FFmpeg 管道
             print("正在关闭 FFmpeg 管道并等待进程完成...")
@@ -448,7 +665,6 @@ class ScreenRecorder:
                                 # 创建临时文件
                                 temp_path = self.video_path.with_suffix('.temp.mp4')
                                 # 重命名原文件
-                                import os
                                 os.rename(str(self.video_path), str(temp_path))
                                 # 用实际帧率作为输入，输出30fps（通过插帧补足）
                                 # 使用 minterpolate 滤镜进行运动插值，或简单复制帧
@@ -460,8 +676,12 @@ class ScreenRecorder:
                                     '-c:v', 'libx264',
                                     '-pix_fmt', 'yuv420p',
                                     '-preset', 'veryfast',
-                                    str(self.video_path)
                                 ]
+                                # 重新编码时顺便在交互位置强制关键帧
+                                force_arg = self.keyframes.force_key_frames_arg(actual_fps)
+                                if self.interaction_keyframes and force_arg:
+                                    cmd += ['-force_key_frames', force_arg]
+                                cmd.append(str(self.video_path))
                                 print(f"运行: {' '.join(cmd)}")
                                 kwargs = {'capture_output': True, 'text': True, 'timeout': 300}
                                 if sys.platform == 'win32':
@@ -469,6 +689,10 @@ class ScreenRecorder:
                                 proc = subprocess.run(cmd, **kwargs)
                                 if proc.returncode == 0:
                                     print(f"✓ 视频修正成功（已插帧到30fps）")
+                                    self._post_processing.append("fps_fix")
+                                    # 帧序号 i 现在显示在 i / actual_fps 处
+                                    self.timeline.video_fps = actual_fps
+                                    self._retime_extra_outputs(actual_fps)
                                     # 删除临时文件
                                     try:
                                         os.unlink(str(temp_path))
@@ -543,8 +767,11 @@ class ScreenRecorder:
                                     '-r', str(actual_fps),  # 设置输出帧率
                                     '-vsync', 'cfr',  # 恒定帧率模式
                                     '-t', str(actual_duration),  # 限制输出时长为实际录制时长
-                                    str(output_fixed)
                                 ]
+                                force_arg = self.keyframes.force_key_frames_arg(actual_fps)
+                                if self.interaction_keyframes and force_arg:
+                                    cmd += ['-force_key_frames', force_arg]
+                                cmd.append(str(output_fixed))
                                 print(f"运行: {' '.join(cmd)}")
                                 # 在Windows上隐藏控制台窗口
                                 kwargs = {'capture_output': True, 'text': True, 'timeout': 300}
@@ -604,6 +831,8 @@ class ScreenRecorder:
                                     # 替换视频路径为修正后文件
                                     old_path = self.video_path
                                     self.video_path = output_fixed
+                                    self.timeline.video_fps = actual_fps
+                                    self._post_processing.append("fps_fix")
                                     # 删除旧文件
                                     try:
                                         old_path.unlink()
@@ -627,7 +856,11 @@ class ScreenRecorder:
                                         output_fixed.unlink()
                                     except:
                                         pass
-                                cmd = [ff, '-y', '-i', str(self.video_path), '-c:v', 'libx264', '-pix_fmt', 'yuv420p', str(output_fixed)]
+                                cmd = [ff, '-y', '-i', str(self.video_path), '-c:v', 'libx264', '-pix_fmt', 'yuv420p']
+                                force_arg = self.keyframes.force_key_frames_arg(self.timeline.video_fps)
+                                if self.interaction_keyframes and force_arg:
+                                    cmd += ['-force_key_frames', force_arg]
+                                cmd.append(str(output_fixed))
                                 print(f"运行: {' '.join(cmd)}")
                                 # 在Windows上隐藏控制台窗口
                                 kwargs = {'capture_output': True, 'text': True}
@@ -636,6 +869,7 @@ class ScreenRecorder:
                                 proc = subprocess.run(cmd, **kwargs)
                                 if proc.returncode == 0 and output_fixed.exists():
                                     print(f"✓ 转码成功: {output_fixed}")
+                                    self._post_processing.append("transcode")
                                     # 替换视频路径为转码后文件
                                     self.video_path = output_fixed
                                     # 再次验证
@@ -671,9 +905,22 @@ class ScreenRecorder:
                 traceback.print_exc()
 
         
-        # 保存事件到JSON文件
+        # 保存帧时间表，再保存事件（事件需要据此标注帧序号）
+        self._save_timeline()
         self._save_events()
         
+        if self.embed_event_subtitles and not self.use_image_sequence and self.intermediate_path is None:
+            self._embed_event_subtitles()
+        
+        # 最后写清单：此时视频和附属文件都已定稿
+        self._save_manifest()
+        
+        # 无损录制 / 图像序列备用方案：清单写好后再排队转码，转码完成时补全清单
+        if self.intermediate_path is not None:
+            self._queue_transcode()
+        if self.transcode_queue is not None:
+            self.transcode_queue.resume()
+        
         return True
     
     def _record_screen(self):
@@ -714,11 +961,10 @@ class ScreenRecorder:
         
         print(f"开始录制屏幕: 分辨率 {self.width}x{self.height}, FPS {target_fps}")
         
-        # 使用帧缓冲队列实现异步写入，提高帧率
-        from queue import Queue
-        import threading
-        
-        frame_queue = Queue(maxsize=90)  # 缓冲最多90帧（3秒）
+        # 使用帧缓冲队列实现异步写入，提高帧率；内存缓冲满后溢出到磁盘
+        frame_queue = SpillQueue(ram_frames=DEFAULT_RAM_FRAMES,
+                                 spill_bytes=self.spill_max_bytes if self.spill_to_disk else 0,
+                                 compress=self.spill_compress)
         write_error = [None]
         
         def write_frames():
@@ -730,33 +976,42 @@ class ScreenRecorder:
                 img, fc = item
                 try:
                     if self.use_image_sequence:
-                        frame_filename = self.frame_dir / f"frame_{fc:06d}.jpg"
-                        cv2.imwrite(str(frame_filename), img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+                        self._packed_writer.submit(img)
                     elif self.use_ffmpeg_pipe:
                         self._write_frame_ffmpeg(img)
                     elif self.video_writer and self.video_writer.isOpened():
                         self.video_writer.write(img)
                 except Exception as e:
+                    if write_error[0] is None:
+                        print(f"✗ 写入帧失败（之后的同类错误不再打印）: {e}")
                     write_error[0] = e
-                frame_queue.task_done()
+                if self._activity_writer is not None:
+                    try:
+                        self._activity_writer.update(img)
+                    except Exception as e:
+                        print(f"⚠️ 计算活动索引失败，后续帧不再计算: {e}")
+                        self._activity_writer.close()
+                        self._activity_writer = None
         
         # 启动写入线程
         write_thread = threading.Thread(target=write_frames, daemon=True)
         write_thread.start()
         
-        # 记录录制开始时间
-        recording_start_time = time.time()
+        # 记录录制开始时间（会话时钟，与事件时间戳一致）
+        clock = self.clock
+        timeline = self.timeline
+        recording_start_time = clock.now()
         next_frame_time = recording_start_time
         
         while self.is_recording:
             try:
-                current_time = time.time()
+                current_time = clock.now()
                 
                 # 如果还没到下一帧的时间，等待
                 wait_time = next_frame_time - current_time
                 if wait_time > 0:
                     time.sleep(wait_time)
-                    current_time = time.time()
+                    current_time = clock.now()
                 
                 # 捕获屏幕
                 if use_dxcam and camera:
@@ -769,24 +1024,50 @@ class ScreenRecorder:
                     # 转换颜色空间（BGRA to BGR）
                     img = img[:, :, :3]
                 
+                capture_time = clock.now()
+                
                 # 确保图像是连续的内存布局（FFmpeg需要）
                 if not img.flags['C_CONTIGUOUS']:
                     img = np.ascontiguousarray(img)
                 
+                # 逐帧变换（如区域打码）在帧交给任何输出之前执行
+                plugins = self.plugins
+                if plugins:
+                    img = plugins.transform(img, frame_count, capture_time)
+                
+                # 直播只保存这一帧的引用，立即返回
+                live_stream = self.live_stream
+                if live_stream is not None:
+                    live_stream.submit(img)
+                
                 # 异步写入
+                queued = False
                 try:
                     frame_queue.put_nowait((img, frame_count))
+                    timeline.append(capture_time)
                     frame_count += 1
+                    queued = True
                     if self.use_image_sequence:
                         self.frame_count = frame_count
                 except:
-                    # 队列满了，跳过这一帧
-                    pass
+                    # 队列满了，跳过这一帧（记录丢帧时间）
+                    timeline.note_dropped(capture_time)
+                
+                # 共享内存帧广播：帧序号与帧时间表一致
+                if queued and self.frame_publisher is not None:
+                    self._publish_frame(img, frame_count - 1, capture_time)
+                if queued and plugins:
+                    plugins.consume(img, frame_count - 1, capture_time)
                 
                 if frame_count % 300 == 0:
-                    elapsed_time = time.time() - recording_start_time
+                    elapsed_time = clock.now() - recording_start_time
                     actual_fps = frame_count / elapsed_time if elapsed_time > 0 else 0
                     print(f"已录制 {frame_count} 帧 (实际时长: {elapsed_time:.1f} 秒, 实际FPS: {actual_fps:.2f})")
+                    metrics = self.encoder_metrics()
+                    if metrics and metrics.get("frames_encoded") is not None:
+                        print(f"  编码器: 已编码 {metrics['frames_encoded']} 帧, {metrics['encode_fps']} fps, "
+                              f"速度 {metrics['speed']}x, 码率 {metrics['bitrate']}, 积压 {metrics.get('backlog')} 帧, "
+                              f"写入队列 {frame_queue.qsize()} 帧")
                 
                 # 更新下一帧时间
                 if current_time > next_frame_time + frame_interval:
@@ -799,9 +1080,35 @@ class ScreenRecorder:
                 traceback.print_exc()
                 break
         
-        # 等待所有帧写入完成
+        # 等待所有帧写入完成：积压较多时可能超过 10 秒，只要队列还在减少就继续等
         frame_queue.put(None)  # 发送结束信号
-        write_thread.join(timeout=10)
+        self._draining = True
+        remaining = frame_queue.qsize()
+        if frame_queue.spill_depth():
+            print(f"正在写出积压的 {remaining} 帧（其中 {frame_queue.spill_depth()} 帧在磁盘溢出文件中）...")
+        while True:
+            write_thread.join(timeout=10)
+            if not write_thread.is_alive():
+                break
+            left = frame_queue.qsize()
+            if left >= remaining:
+                print(f"⚠️ 写入线程 10 秒内没有进展，放弃剩余的 {left} 帧")
+                break
+            remaining = left
+        self._draining = False
+        if write_error[0] is not None:
+            print(f"⚠️ 部分帧没有写入，最后一次错误: {write_error[0]}")
+        self.spill_metrics = frame_queue.metrics()
+        frame_queue.close()
+        if self.spill_metrics["spilled_frames"]:
+            m = self.spill_metrics
+            print(f"✓ 写入跟不上时 {m['spilled_frames']} 帧暂存到磁盘 "
+                  f"(最大积压 {m['max_spill_depth']} 帧 / {m['max_spill_bytes'] / 1e6:.0f} MB, "
+                  f"写 {m['spill_write_mb_per_s']} MB/s, 读 {m['spill_read_mb_per_s']} MB/s)")
+        if self._activity_writer is not None:
+            self._activity_writer.close()
+            print(f"✓ 活动索引保存成功: {self.activity_path} ({self._activity_writer.frames} 帧)")
+            self._activity_writer = None
         
         # 关闭 dxcam
         if use_dxcam and camera:
@@ -812,7 +1119,7 @@ class ScreenRecorder:
                 pass
         
         # 计算实际录制时长
-        recording_end_time = time.time()
+        recording_end_time = clock.now()
         actual_duration = recording_end_time - recording_start_time
         expected_duration = frame_count / target_fps
         
@@ -823,6 +1130,8 @@ class ScreenRecorder:
         print(f"实际录制时长: {actual_duration:.2f} 秒")
         print(f"理论视频时长: {expected_duration:.2f} 秒 (基于 {frame_count} 帧 @ {target_fps} fps)")
         print(f"实际FPS: {actual_fps:.2f} (基于 {frame_count} 帧 / {actual_duration:.2f} 秒)")
+        if timeline.dropped_times:
+            print(f"⚠️ 写入队列已满，丢弃了 {len(timeline.dropped_times)} 帧")
         if abs(actual_duration - expected_duration) > 0.5:
             print(f"⚠️ 警告: 实际时长与理论时长差异较大 ({abs(actual_duration - expected_duration):.2f} 秒)")
             print(f"   将使用实际FPS ({actual_fps:.2f}) 来调整视频")
@@ -836,7 +1145,11 @@ class ScreenRecorder:
             pass
     
     def _verify_video_file(self):
-        """验证视频文件是否正确生成"""
+        """验证视频文件是否正确生成
+
+        直接解析容器结构（MP4 box / AVI chunk）检查时长、帧数和完整性，不解码视频；
+        verify_decode=True 时再抽样解码几帧。
+        """
         print("\n" + "=" * 60)
         print("开始验证视频文件...")
         print("=" * 60)
@@ -860,90 +1173,38 @@ class ScreenRecorder:
         if file_size < 1024:
             print("⚠️ 警告: 视频文件非常小（< 1KB），可能不完整")
         
-        # 3. 检查文件头（Magic Number）
-        try:
-            with open(self.video_path, 'rb') as f:
-                header = f.read(12)
-                print(f"✓ 文件头（前12字节）: {header.hex()}")
-                
-                # MP4 文件应该以 ftyp box 开头
-                if self.video_path.suffix == '.mp4':
-                    if header[:4] == b'\x00\x00\x00' or header[4:8] == b'ftyp':
-                        print("✓ MP4 文件头格式正确")
-                    else:
-                        print("⚠️ 警告: MP4 文件头格式可能不正确")
-                        print(f"   前4字节: {header[:4]}")
-                        print(f"   4-8字节: {header[4:8]}")
-                
-                # AVI 文件应该以 RIFF 开头
-                elif self.video_path.suffix == '.avi':
-                    if header[:4] == b'RIFF':
-                        print("✓ AVI 文件头格式正确")
-                    else:
-                        print("⚠️ 警告: AVI 文件头格式可能不正确")
-                        print(f"   前4字节: {header[:4]}")
-        except Exception as e:
-            print(f"⚠️ 读取文件头时出错: {e}")
-        
-        # 4. 尝试用 OpenCV 读取视频文件
-        print("\n尝试用 OpenCV 读取视频文件...")
+        # 3. 解析容器结构
+        print("\n解析视频容器结构...")
         try:
-            cap = cv2.VideoCapture(str(self.video_path))
-            if not cap.isOpened():
-                print("❌ 错误: OpenCV 无法打开视频文件")
-                return False
-            
-            # 获取视频属性
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
-            fourcc_str = "".join([chr((fourcc >> 8 * i) & 0xFF) for i in range(4)])
-            
-            # 计算视频时长
-            video_duration = frame_count / fps if fps > 0 else 0
-            
-            print(f"✓ OpenCV 可以打开视频文件")
-            print(f"  帧率 (FPS): {fps}")
-            print(f"  总帧数: {frame_count}")
-            print(f"  视频时长: {video_duration:.2f} 秒 (基于 {frame_count} 帧 @ {fps} fps)")
-            print(f"  分辨率: {width}x{height}")
-            print(f"  编码器 (FourCC): {fourcc_str} ({fourcc})")
-            
-            # 如果记录了实际录制时长，进行比较
-            if hasattr(self, '_actual_recording_duration'):
-                actual_duration = self._actual_recording_duration
-                diff = abs(video_duration - actual_duration)
-                print(f"  实际录制时长: {actual_duration:.2f} 秒")
-                print(f"  时长差异: {diff:.2f} 秒")
-                if diff > 1.0:
-                    print(f"  ⚠️ 警告: 视频时长与实际录制时长差异较大！")
-                    print(f"     可能原因: 帧率设置不正确或帧写入不完整")
+            info = probe_container(self.video_path)
+            expected_duration = getattr(self, '_actual_recording_duration', None)
+            ok, problems = verify_container(info, expected_duration=expected_duration)
             
-            if frame_count == 0:
-                print("❌ 错误: 视频文件没有帧数据")
-                cap.release()
+            print(f"  格式: {info['format']}  编码: {info['codec']}")
+            print(f"  帧率 (FPS): {info['fps']:.2f}")
+            print(f"  总帧数: {info['frame_count']}")
+            print(f"  视频时长: {info['duration']:.2f} 秒")
+            print(f"  分辨率: {info['width']}x{info['height']}")
+            if info['keyframes'] is not None:
+                print(f"  关键帧: {len(info['keyframes'])} 个")
+            if expected_duration is not None:
+                print(f"  实际录制时长: {expected_duration:.2f} 秒")
+                print(f"  时长差异: {abs(info['duration'] - expected_duration):.2f} 秒")
+            for problem in problems:
+                print(f"  ⚠️ {problem}")
+            if not ok:
+                print("❌ 错误: 视频容器结构无效")
                 return False
             
-            # 尝试读取第一帧
-            ret, frame = cap.read()
-            if ret:
-                print(f"✓ 可以读取第一帧，尺寸: {frame.shape}")
-            else:
-                print("❌ 错误: 无法读取视频帧")
-                cap.release()
-                return False
-            
-            # 尝试读取最后一帧
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count - 1)
-            ret, frame = cap.read()
-            if ret:
-                print(f"✓ 可以读取最后一帧")
-            else:
-                print("⚠️ 警告: 无法读取最后一帧，视频可能不完整")
+            # 4. 可选：抽样解码
+            if self.verify_decode:
+                print("\n抽样解码检查...")
+                decoded, message = sampled_decode_check(self.video_path)
+                if not decoded:
+                    print(f"❌ 错误: {message}")
+                    return False
+                print(f"✓ {message}")
             
-            cap.release()
             print("\n✓ 视频文件验证通过，文件应该是有效的")
             return True
             
@@ -952,184 +1213,169 @@ class ScreenRecorder:
             import traceback
             traceback.print_exc()
             return False
-        
-        print("=" * 60 + "\n")
 
     # -------------------- FFmpeg 管道相关方法 --------------------
     def _find_ffmpeg(self):
         """查找 ffmpeg 可执行文件，支持打包后的应用"""
-        # 1. 尝试在 PATH 中查找（包括系统 PATH 和用户 PATH）
+        return find_ffmpeg()
+    
+    def _try_start_ffmpeg(self, output_path: Path, lossless=False) -> bool:
+        """按优先级启动实时编码后端（PyAV 进程内编码或 ffmpeg 管道），返回是否成功
+
+        lossless=True 时写无损中间文件（Ut Video / FFV1），不做帧间压缩，编码开销极低。
+        启用看门狗时实时编码写分片 MP4，编码器中途崩溃也能保留已写完的部分并切换到新分段。
+        附加输出（extra_outputs）由同一个编码后端从同一路帧生成。
+        """
+        def start_encoder(path, outputs):
+            return create_encoder(path, self.width, self.height, fps=30.0, lossless=lossless,
+                                  keyframes=self.keyframes if self.interaction_keyframes else None,
+                                  backend=self.encoder_backend, fragmented=self.encoder_watchdog,
+                                  outputs=outputs)
+
+        outputs = [(profile, profile.path_for(self.video_path)) for profile in self.extra_outputs]
         try:
-            import os
-            # 先尝试直接查找（如果PATH已经包含）
-            ffmpeg_path = shutil.which('ffmpeg')
-            if ffmpeg_path:
-                return ffmpeg_path
-            
-            # 如果找不到，尝试从注册表获取系统 PATH（Windows）
-            if sys.platform == 'win32':
-                try:
-                    import winreg
-                    # 获取系统PATH
-                    with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SYSTEM\CurrentControlSet\Control\Session Manager\Environment") as key:
-                        system_path = winreg.QueryValueEx(key, "Path")[0]
-                    # 获取用户PATH
-                    try:
-                        with winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Environment") as key:
-                            user_path = winreg.QueryValueEx(key, "Path")[0]
-                    except:
-                        user_path = ""
-                    
-                    # 合并PATH并查找
-                    combined_path = system_path + os.pathsep + user_path + os.pathsep + os.environ.get('PATH', '')
-                    old_path = os.environ.get('PATH', '')
-                    os.environ['PATH'] = combined_path
-                    ffmpeg_path = shutil.which('ffmpeg')
-                    os.environ['PATH'] = old_path  # 恢复
-                    if ffmpeg_path:
-                        return ffmpeg_path
-                except Exception:
-                    pass
-        except Exception:
-            pass
-        
-        # 2. 尝试在常见安装位置查找（Windows）
-        if sys.platform == 'win32':
-            common_paths = []
-            # WinGet 安装路径（支持通配符）
-            localappdata = os.environ.get('LOCALAPPDATA', '')
-            if localappdata:
-                winget_base = Path(localappdata) / 'Microsoft' / 'WinGet' / 'Packages'
-                if winget_base.exists():
-                    # 查找所有 Gyan.FFmpeg 相关目录
-                    for pkg_dir in winget_base.glob('Gyan.FFmpeg*'):
-                        # 查找 ffmpeg-*-full_build 目录
-                        for build_dir in pkg_dir.glob('ffmpeg-*-full_build'):
-                            ffmpeg_exe = build_dir / 'bin' / 'ffmpeg.exe'
-                            if ffmpeg_exe.exists():
-                                common_paths.append(ffmpeg_exe)
-                        # 也检查直接在 pkg_dir 下的 bin 目录
-                        ffmpeg_exe = pkg_dir / 'bin' / 'ffmpeg.exe'
-                        if ffmpeg_exe.exists():
-                            common_paths.append(ffmpeg_exe)
-            
-            # 标准安装路径
-            program_files = os.environ.get('ProgramFiles', '')
-            program_files_x86 = os.environ.get('ProgramFiles(x86)', '')
-            if program_files:
-                common_paths.append(Path(program_files) / 'ffmpeg' / 'bin' / 'ffmpeg.exe')
-            if program_files_x86:
-                common_paths.append(Path(program_files_x86) / 'ffmpeg' / 'bin' / 'ffmpeg.exe')
-            
-            # 检查所有路径
-            for ffmpeg_path in common_paths:
-                try:
-                    if ffmpeg_path.exists():
-                        return str(ffmpeg_path)
-                except Exception:
-                    continue
-        
-        # 3. 尝试在应用目录中查找（打包后的应用）
+            if self.encoder_watchdog:
+                self.encoder = EncoderSupervisor(start_encoder, output_path, fps=30.0, outputs=outputs).start()
+            else:
+                self.encoder = start_encoder(output_path, outputs)
+        except Exception as e:
+            print(f"✗ {e}")
+            self.encoder = None
+            return False
+        self.encoder_profile = dict(self.encoder.profile)
+        self.output_files = {profile.name: path for profile, path in outputs}
+        return True
+
+    def _publish_frame(self, img, frame_index, capture_time):
+        """把一帧写入共享内存帧广播；出错时停止广播，不影响录制"""
         try:
-            if getattr(sys, 'frozen', False):
-                # 打包后的应用
-                if hasattr(sys, '_MEIPASS'):
-                    app_dir = Path(sys._MEIPASS)
-                else:
-                    app_dir = Path(sys.executable).parent
-                
-                # 检查应用目录
-                ffmpeg_exe = app_dir / 'ffmpeg.exe'
-                if ffmpeg_exe.exists():
-                    return str(ffmpeg_exe)
-                
-                # 检查应用目录的父目录（onedir模式）
-                parent_dir = Path(sys.executable).parent
-                ffmpeg_exe = parent_dir / 'ffmpeg.exe'
-                if ffmpeg_exe.exists():
-                    return str(ffmpeg_exe)
-        except Exception:
-            pass
-        
-        return None
-    
-    def _try_start_ffmpeg(self, output_path: Path) -> bool:
-        """尝试使用系统 ffmpeg 启动管道写入进程，返回是否成功"""
+            self.frame_publisher.publish(img, frame_index, capture_time)
+        except Exception as e:
+            print(f"⚠️ 帧广播出错，停止广播: {e}")
+            self.frame_broadcast_stats = self.frame_publisher.stats()
+            self.frame_publisher.close()
+            self.frame_publisher = None
+
+    def _start_live_stream(self):
+        """启动滚动 HLS 直播（需要 ffmpeg 命令行程序）"""
         try:
-            ffmpeg_path = self._find_ffmpeg()
-            if not ffmpeg_path:
-                print("✗ 未找到 ffmpeg 可执行文件")
-                return False
+            self.live_stream = LiveStreamer(self.live_hls_dir, self.width, self.height, fps=self.target_fps,
+                                            renditions=self.live_hls_renditions,
+                                            segment_seconds=self.live_hls_segment_seconds,
+                                            window=self.live_hls_window).start()
+            print(f"✓ 直播已开始: {self.live_stream.playlist_path}")
+        except Exception as e:
+            print(f"⚠️ 无法启动直播（录制不受影响）: {e}")
+            self.live_stream = None
 
-            width = int(self.width)
-            height = int(self.height)
-            output_str = str(output_path.absolute())
+    def _stop_live_stream(self):
+        """结束直播，播放列表写入 #EXT-X-ENDLIST"""
+        live_stream, self.live_stream = self.live_stream, None
+        if live_stream is None:
+            return
+        self.live_stream_profile = live_stream.close()
+        stats = self.live_stream_profile["stats"]
+        print(f"✓ 直播已结束: 发送 {stats['frames']} 帧，丢弃 {stats['dropped']} 帧（编码跟不上时只丢直播的帧）")
 
-            cmd = [
-                ffmpeg_path,
-                '-y',
-                '-f', 'rawvideo',
-                '-pix_fmt', 'bgr24',
-                '-s', f'{width}x{height}',
-                '-r', '30',  # 输入帧率
-                '-i', '-',
-                '-c:v', 'libx264',
-                '-pix_fmt', 'yuv420p',
-                '-preset', 'veryfast',
-                '-r', '30',  # 输出帧率，确保与输入一致
-                output_str
-            ]
+    def live_stream_metrics(self):
+        """录制中直播的实时指标，没有直播时返回 None"""
+        live_stream = self.live_stream
+        return live_stream.metrics() if live_stream is not None else None
 
-            print(f"启动 FFmpeg: {' '.join(cmd)}")
-            # stdin 用 PIPE 接收帧数据，stdout/stderr 丢弃避免缓冲区阻塞
-            kwargs = {'stdin': subprocess.PIPE, 'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
-            if sys.platform == 'win32':
-                kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
-            proc = subprocess.Popen(cmd, **kwargs)
-            self.ffmpeg_proc = proc
-            self.ffmpeg_stdin = proc.stdin
-            return True
-        except Exception as e:
-            print(f"✗ 无法启动 FFmpeg 进程: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
+    def encoder_metrics(self):
+        """录制中编码后端的实时指标（编码 fps、速度、码率、积压等），没有编码后端时返回 None"""
+        encoder = self.encoder
+        return encoder.metrics() if encoder is not None else None
 
     def _write_frame_ffmpeg(self, img: np.ndarray):
-        """将单帧 BGR 图像写入 FFmpeg stdin。"""
-        if self.ffmpeg_stdin is None:
-            raise RuntimeError("FFmpeg stdin 未打开")
-        # 确保图像为 BGR24，连续内存
-        if img.dtype != np.uint8:
-            img = img.astype(np.uint8)
-        if not img.flags['C_CONTIGUOUS']:
-            img = np.ascontiguousarray(img)
-        # 写入原始字节（BGR24）
-        self.ffmpeg_stdin.write(img.tobytes())
+        """将单帧 BGR 图像交给编码后端"""
+        if self.encoder is None:
+            raise RuntimeError("编码后端未启动")
+        self.encoder.write(img)
 
     def _stop_ffmpeg(self):
-        """关闭 FFmpeg stdin 并等待进程完成"""
-        if self.ffmpeg_stdin:
-            try:
-                self.ffmpeg_stdin.close()
-            except Exception:
-                pass
-            self.ffmpeg_stdin = None
-        if self.ffmpeg_proc:
+        """结束编码并关闭输出文件"""
+        if self.encoder is not None:
+            self.encoder.close()
+            stats = self.encoder.stats()
+            if self.encoder_profile is not None:
+                self.encoder_profile["stats"] = stats
+            if isinstance(self.encoder, EncoderSupervisor):
+                self._join_encoder_segments()
+            if stats["frames"]:
+                pipe = f", 管道 {stats['pipe_size'] // 1024} KiB" if stats.get("pipe_size") else ""
+                print(f"✓ 编码写入: {stats['throughput_gbps']} GB/s, 单帧 p50 {stats['write_p50_ms']} ms / "
+                      f"p99 {stats['write_p99_ms']} ms / 最大 {stats['write_max_ms']} ms{pipe}")
+    
+    def _join_encoder_segments(self):
+        """把看门狗切换出的各分段（以及分片 MP4）以流复制方式拼接为一个普通文件"""
+        supervisor = self.encoder
+        self.encoder_segments = [dict(s) for s in supervisor.segments]
+        self.encoder_gaps = [dict(g) for g in supervisor.gaps]
+        files = supervisor.segment_files()
+        for segment in supervisor.segments:
+            if segment["frame_count"] == 0 and segment["index"] > 0:
+                # 没有保存下任何帧的分段
+                for name in [segment["file"], *segment["outputs"].values()]:
+                    supervisor.output_path.with_name(name).unlink(missing_ok=True)
+        if supervisor.restarts:
+            gap_frames = sum(g["frame_count"] for g in self.encoder_gaps)
+            print(f"⚠️ 编码器重启 {supervisor.restarts} 次，共 {len(files)} 个分段，缺口 {gap_frames} 帧")
+        for _profile, path in supervisor.outputs:
+            # 附加输出按主输出各分段的时长对齐，中断时少保存的尾部不会让后面的画面提前
+            entries = supervisor.output_segments(path)
+            self._join_segment_files([p for p, _ in entries], path, supervisor.fragmented,
+                                     durations=[d for _, d in entries])
+        if not self._join_segment_files(files, supervisor.output_path, supervisor.fragmented):
+            return
+        for segment in self.encoder_segments:
+            segment["file"] = supervisor.output_path.name
+            segment["outputs"] = {name: path.name for name, path in self.output_files.items()}
+        self._post_processing.append("segment_join")
+        if len(files) > 1:
+            print(f"✓ 已拼接 {len(files)} 个分段: {supervisor.output_path}")
+
+    def _retime_extra_outputs(self, actual_fps):
+        """附加输出按 30fps 的名义时间编码；实际帧率不同时以流复制方式缩放时间戳，与修正后的主输出对齐"""
+        ff = self._find_ffmpeg()
+        if not ff:
+            return
+        scale = 30.0 / actual_fps
+        for name, path in self.output_files.items():
+            if not path.exists():
+                continue
+            temp_path = path.with_name(path.name + ".tmp")
             try:
-                # 等待进程退出
-                self.ffmpeg_proc.wait(timeout=30)
-            except subprocess.TimeoutExpired:
-                print("⚠️ FFmpeg 进程超时，强制终止...")
-                try:
-                    self.ffmpeg_proc.kill()
-                    self.ffmpeg_proc.wait(timeout=5)
-                except Exception:
-                    pass
+                proc = run_ffmpeg(['-y', '-v', 'error', '-itsscale', f'{scale:.6f}', '-i', path, '-map', '0:v',
+                                   '-c', 'copy', '-f', 'mp4', temp_path], timeout=300, ffmpeg_path=ff)
+                if proc.returncode != 0:
+                    raise RuntimeError(proc.stderr.strip() or f"退出码 {proc.returncode}")
+                os.replace(temp_path, path)
+                print(f"✓ 已修正 {name} 输出的时间戳: {path}")
             except Exception as e:
-                print(f"⚠️ 关闭 FFmpeg 时出错: {e}")
-            finally:
-                self.ffmpeg_proc = None
+                temp_path.unlink(missing_ok=True)
+                print(f"⚠️ 修正 {name} 输出的时间戳失败: {e}")
+
+    @staticmethod
+    def _join_segment_files(files, output_path, fragmented, durations=None):
+        """把一个输出的各分段拼接到 output_path，返回是否拼接成功（只有一个普通 MP4 分段时无需拼接）"""
+        if not files or (len(files) == 1 and files[0] == output_path and not fragmented):
+            return False
+        try:
+            join_segments(files, output_path, durations=durations)
+        except RuntimeError as e:
+            print(f"✗ {e}（各分段保留为独立文件）")
+            return False
+        for path in files:
+            if path != output_path:
+                path.unlink(missing_ok=True)
+        return True
+
+    def _current_frame_index(self):
+        """最近一帧已捕获画面的序号（事件发生时屏幕上的那一帧）"""
+        if self.timeline is None:
+            return 0
+        return len(self.timeline) - 1
     
     def _on_key_press(self, key):
         """键盘按下事件"""
@@ -1137,7 +1383,7 @@ class ScreenRecorder:
             return
         
         try:
-            timestamp = time.time() - self.start_time
+            timestamp = self.clock.now()
             try:
                 key_name = key.char if hasattr(key, 'char') and key.char else str(key)
             except:
@@ -1149,6 +1395,7 @@ class ScreenRecorder:
                 "timestamp": round(timestamp, 3)
             }
             self.events_queue.put(event)
+            self.keyframes.note_key(timestamp, self._current_frame_index())
             # 调试：每10个事件打印一次
             if self.events_queue.qsize() % 10 == 0:
                 print(f"已记录 {self.events_queue.qsize()} 个事件")
@@ -1161,7 +1408,7 @@ class ScreenRecorder:
             return
         
         try:
-            timestamp = time.time() - self.start_time
+            timestamp = self.clock.now()
             try:
                 key_name = key.char if hasattr(key, 'char') and key.char else str(key)
             except:
@@ -1182,35 +1429,40 @@ class ScreenRecorder:
             return
         
         try:
-            # 减少鼠标移动事件的频率，避免事件过多
-            current_time = time.time()
-            if not hasattr(self, '_last_mouse_move_time'):
-                self._last_mouse_move_time = 0
-            
-            # 每0.1秒记录一次鼠标移动（降低频率）
-            if current_time - self._last_mouse_move_time < 0.1:
-                return
-            
-            self._last_mouse_move_time = current_time
-            timestamp = current_time - self.start_time
-            
-            event = {
-                "type": "mouse_move",
-                "x": x,
-                "y": y,
-                "timestamp": round(timestamp, 3)
-            }
-            self.events_queue.put(event)
+            # 只记录轨迹拐点，直线段由两端点还原（误差不超过容差）
+            timestamp = self.clock.now()
+            for px, py, pt in self._mouse_trajectory.add(x, y, timestamp):
+                self._put_mouse_move(px, py, pt)
         except Exception as e:
             print(f"记录鼠标移动事件时出错: {e}")
     
+    def _put_mouse_move(self, x, y, timestamp):
+        """把一个鼠标移动点放入事件队列"""
+        event = {
+            "type": "mouse_move",
+            "x": x,
+            "y": y,
+            "timestamp": round(timestamp, 3)
+        }
+        self.events_queue.put(event)
+    
+    def _flush_mouse_trajectory(self):
+        """输出轨迹压缩器中尚未输出的最后一个点"""
+        try:
+            for px, py, pt in self._mouse_trajectory.flush():
+                self._put_mouse_move(px, py, pt)
+        except Exception as e:
+            print(f"输出鼠标轨迹时出错: {e}")
+    
     def _on_mouse_click(self, x, y, button, pressed):
         """鼠标点击事件"""
         if not self.is_recording:
             return
         
         try:
-            timestamp = time.time() - self.start_time
+            # 先输出点击前的轨迹终点，保证轨迹与点击位置衔接
+            self._flush_mouse_trajectory()
+            timestamp = self.clock.now()
             event = {
                 "type": "mouse_click",
                 "x": x,
@@ -1220,6 +1472,8 @@ class ScreenRecorder:
                 "timestamp": round(timestamp, 3)
             }
             self.events_queue.put(event)
+            if pressed:
+                self.keyframes.note_click(timestamp, self._current_frame_index())
             print(f"记录鼠标点击: {button} {'按下' if pressed else '释放'} at ({x}, {y})")
         except Exception as e:
             print(f"记录鼠标点击事件时出错: {e}")
@@ -1230,7 +1484,7 @@ class ScreenRecorder:
             return
         
         try:
-            timestamp = time.time() - self.start_time
+            timestamp = self.clock.now()
             event = {
                 "type": "mouse_scroll",
                 "x": x,
@@ -1243,6 +1497,152 @@ class ScreenRecorder:
         except Exception as e:
             print(f"记录鼠标滚动事件时出错: {e}")
     
+    def _save_timeline(self):
+        """保存帧序号 -> 捕获时间 表"""
+        if self.timeline is None or self.timeline_path is None:
+            return None
+        try:
+            self.timeline.keyframe_requests = self.keyframes.frames()
+            self.timeline.save(self.timeline_path)
+            print(f"✓ 帧时间表保存成功: {self.timeline_path} ({len(self.timeline)} 帧, "
+                  f"丢帧 {len(self.timeline.dropped_times)})")
+            return self.timeline_path
+        except Exception as e:
+            print(f"✗ 保存帧时间表失败: {e}")
+            return None
+    
+    def _save_manifest(self):
+        """原子写入录制清单（recording_*.manifest.json）"""
+        try:
+            timeline = self.timeline
+            capture_times = timeline.capture_times if timeline is not None else []
+            # 无损录制模式下成品视频要等转码完成才生成，届时补全 video 信息
+            info = probe_container(self.video_path) if self.video_path.exists() else None
+            encoder = dict(self.encoder_profile or {})
+            encoder["post_processing"] = list(self._post_processing)
+            data = {
+                "clock": {
+                    "type": "monotonic",
+                    "epoch": self.clock.epoch,
+                    "start": datetime.fromtimestamp(self.clock.epoch).isoformat(timespec="milliseconds"),
+                },
+                "geometry": {
+                    "screen_width": self.screen_width,
+                    "screen_height": self.screen_height,
+                    "width": int(self.width),
+                    "height": int(self.height),
+                    "scale_factor": self.scale_factor,
+                },
+                "encoder": encoder,
+                "frames": {
+                    "target_fps": self.target_fps,
+                    "video_fps": timeline.video_fps if timeline is not None else None,
+                    "written": self._frames_written,
+                    "dropped": len(timeline.dropped_times) if timeline is not None else 0,
+                    "spill": self.spill_metrics,
+                    "actual_duration": round(getattr(self, '_actual_recording_duration', 0.0), 3),
+                    "actual_fps": round(getattr(self, '_actual_fps', 0.0), 3),
+                },
+                "video": container_summary(info) if info is not None else None,
+                "segments": self._manifest_segments(capture_times),
+                "gaps": [dict(gap, **self._frame_range_times(capture_times, gap["start_frame"], gap["frame_count"]))
+                         for gap in self.encoder_gaps],
+                "files": {
+                    "video": file_entry(self.video_path, self.manifest_checksums),
+                    "events": file_entry(self.events_path, self.manifest_checksums),
+                    "timeline": file_entry(self.timeline_path, self.manifest_checksums),
+                    "activity": file_entry(self.activity_path, self.manifest_checksums),
+                },
+            }
+            if self.intermediate_path is not None:
+                data["files"]["intermediate"] = file_entry(self.intermediate_path, checksum=False)
+            if self.live_stream_profile is not None:
+                data["live_stream"] = self.live_stream_profile
+            if self.frame_broadcast_stats is not None:
+                data["frame_broadcast"] = self.frame_broadcast_stats
+            if self.plugin_stats:
+                data["plugins"] = self.plugin_stats
+            if self.privacy_mask is not None:
+                data["privacy_mask"] = self.privacy_mask.to_dict()
+            if self.output_files:
+                data["files"]["outputs"] = {name: file_entry(path, self.manifest_checksums)
+                                            for name, path in self.output_files.items()}
+            self.manifest_path = save_manifest(manifest_path_for(self.video_path), data)
+            print(f"✓ 录制清单保存成功: {self.manifest_path}")
+            return self.manifest_path
+        except Exception as e:
+            print(f"✗ 保存录制清单失败: {e}")
+            return None
+    
+    @staticmethod
+    def _frame_range_times(capture_times, start, count):
+        """帧范围 [start, start + count) 的首尾捕获时间"""
+        end = min(start + count, len(capture_times)) - 1
+        return {
+            "start_time": round(capture_times[start], 4) if 0 <= start < len(capture_times) else None,
+            "end_time": round(capture_times[end], 4) if count > 0 and end >= 0 else None,
+        }
+
+    def _manifest_segments(self, capture_times):
+        """清单中的分段列表：没有发生编码器切换时只有一段"""
+        if not self.encoder_segments:
+            return [{"index": 0, "file": self.video_path.name, "start_frame": 0, "frame_count": len(capture_times),
+                     **self._frame_range_times(capture_times, 0, len(capture_times))}]
+        segments = []
+        for segment in self.encoder_segments:
+            entry = dict(segment)
+            if self.intermediate_path is not None and entry["file"] == self.intermediate_path.name:
+                entry["file"] = self.video_path.name  # 拼接后的中间文件转码为成品视频
+            entry.update(self._frame_range_times(capture_times, entry["start_frame"], entry["frame_count"]))
+            segments.append(entry)
+        return segments
+
+    def _resume_transcodes(self):
+        """继续上次未完成的转码任务（进程崩溃或退出时中断的）"""
+        try:
+            if pending_jobs(self.output_dir):
+                self.transcode_queue = TranscodeQueue()
+                count = self.transcode_queue.resume_pending(self.output_dir)
+                print(f"✓ 继续 {count} 个未完成的转码任务")
+        except Exception as e:
+            print(f"⚠️ 恢复转码任务失败: {e}")
+    
+    def _queue_transcode(self):
+        """为无损中间文件 / 打包帧文件创建转码任务并交给后台队列"""
+        try:
+            self.transcode_job_path = create_job(
+                self.intermediate_path, self.video_path, self._frames_written,
+                input_fps=self.target_fps if self.use_image_sequence else 30.0, video_fps=self.timeline.video_fps,
+                keyframes=self.keyframes.frames() if self.interaction_keyframes else (),
+                embed_event_subtitles=self.embed_event_subtitles, events_path=self.events_path,
+            )
+            if self.transcode_queue is None:
+                self.transcode_queue = TranscodeQueue()
+            self.transcode_queue.submit(self.transcode_job_path)
+            print(f"✓ 已加入后台转码队列: {self.transcode_job_path}")
+        except Exception as e:
+            print(f"✗ 创建转码任务失败: {e}（中间文件保留在 {self.intermediate_path}）")
+    
+    def _embed_event_subtitles(self):
+        """把事件字幕封装进录像（替换原文件）"""
+        try:
+            from luping.subtitles import mux_event_subtitles
+            if self.video_path.suffix not in ('.mp4', '.mov', '.mkv'):
+                # AVI 无法承载文本字幕，另存为 MKV
+                output = mux_event_subtitles(self.video_path, self.events_path,
+                                             self.video_path.with_suffix('.mkv'),
+                                             width=self.width, height=self.height)
+            else:
+                temp_path = self.video_path.with_name(self.video_path.stem + '.subs' + self.video_path.suffix)
+                mux_event_subtitles(self.video_path, self.events_path, temp_path,
+                                    width=self.width, height=self.height)
+                os.replace(str(temp_path), str(self.video_path))
+                output = self.video_path
+            print(f"✓ 已封装事件字幕: {output}")
+            self._post_processing.append("event_subtitles")
+        except Exception as e:
+            print(f"⚠️ 封装事件字幕失败: {e}")
+    
     def _save_events(self):
         """保存事件到JSON文件"""
         events = []
@@ -1263,8 +1663,10 @@ class ScreenRecorder:
         while not self.events_queue.empty():
             events.append(self.events_queue.get())
         
-        # 按时间戳排序
+        # 按时间戳排序，并标注每个事件所属的帧序号
         events.sort(key=lambda x: x["timestamp"])
+        if self.timeline is not None:
+            self.timeline.assign_frames(events)
         
         print(f"实际保存了 {len(events)} 个事件到 {self.events_path}")
         
@@ -0,0 +1,376 @@
+"""
+共享内存帧广播
+
+录制器把采集到的每一帧写进一块具名共享内存中的环形缓冲区，本机的其他进程（分析、预览、自动化脚本）
+直接映射这块内存读取最新画面，不需要再截一次屏。读者只读共享内存，不加锁、不与录制器通信，
+读者再多、读得再慢也不会拖慢录制。
+
+内存布局（小端）:
+
+    头部（128 字节）: magic, 版本, 槽位数, 宽, 高, 通道数, 头部大小, 槽位跨度, 每帧字节数,
+                      代数（已发布的帧数）, 发布者 pid, 已关闭标志
+    槽位 × N: 64 字节槽位头（seq, 代数, 帧序号, 捕获时间）+ 帧数据（按 64 字节对齐）
+
+第 g 帧（从 0 开始）写入第 g % N 个槽位。每个槽位用 seqlock 保护：写入前 seq 加一（变为奇数），
+写完帧数据和槽位头后再加一（变为偶数），最后更新头部的代数。读者先读 seq（必须是偶数）和槽位头，
+拿到帧数据的视图，用完后再读一次 seq，两次相同说明期间没有被覆盖。
+读者直接使用共享内存上的 numpy 视图（零拷贝），N 个槽位意味着一帧在被覆盖前至少能保留 N - 1 个帧间隔；
+需要长期保留时用 copy=True 取一份副本（复制后校验，读到一半被覆盖时自动重读）。
+
+发布（录制器内部使用）:
+
+    publisher = FramePublisher("luping_frames", 1920, 1080, slots=8)
+    publisher.publish(img, frame_index, capture_time)
+    publisher.close()
+
+订阅（其他进程）:
+
+    with FrameSubscriber("luping_frames") as sub:
+        for frame in sub.frames():            # 每次产出最新的一帧，跟不上时跳过中间的帧
+            process(frame.array)              # (高, 宽, 3) BGR，共享内存上的只读视图
+            if not frame.valid():             # 处理期间被覆盖，结果作废
+                continue
+
+用法:
+    python -m luping.shm_broadcast luping_frames --seconds 10   # 连接并统计收到的帧率、跳过和撕裂的帧
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_MAGIC = b'LPSHMFR1'
+_VERSION = 1
+# magic, 版本, 槽位数, 宽, 高, 通道数, 头部大小, 槽位跨度, 每帧字节数
+_HEADER = struct.Struct('<8sIIIIIIQQ')
+_HEADER_SIZE = 128
+_GENERATION_OFFSET = 64  # u64 已发布的帧数（单独对齐到 8 字节，整体写入）
+_PID_OFFSET = 72         # u32 发布者 pid
+_CLOSED_OFFSET = 76      # u32 发布者已关闭
+_SLOT_HEADER = 64        # u64 seq, u64 代数, u64 帧序号, f64 捕获时间
+_ALIGN = 64
+
+DEFAULT_NAME = "luping_frames"
+DEFAULT_SLOTS = 8
+POLL_INTERVAL = 0.002  # 等待新帧时的轮询间隔（秒）
+_published = set()  # 本进程创建的共享内存名称（由创建者负责删除）
+
+
+def _align(value):
+    return (value + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _attach(name):
+    """映射已存在的共享内存，不交给 resource_tracker 管理（否则读者进程退出时会把它删掉）"""
+    shm = shared_memory.SharedMemory(name=name)
+    if os.name == 'posix' and name not in _published:
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+    return shm
+
+
+def _pid_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # 没有权限发送信号，进程仍然存在
+    return True
+
+
+class _Layout:
+    """共享内存上的头部和各槽位视图（发布者和订阅者共用）"""
+
+    def __init__(self, buf):
+        magic, version, slots, width, height, channels, header_size, stride, frame_bytes = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC:
+            raise ValueError("不是录屏帧广播的共享内存")
+        if version != _VERSION:
+            raise ValueError(f"不支持的帧广播版本: {version}")
+        self.slots = slots
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.frame_bytes = frame_bytes
+        self.shape = (height, width, channels)
+        self.generation = np.ndarray((1,), dtype=np.uint64, buffer=buf, offset=_GENERATION_OFFSET)
+        self.pid = np.ndarray((1,), dtype=np.uint32, buffer=buf, offset=_PID_OFFSET)
+        self.closed = np.ndarray((1,), dtype=np.uint32, buffer=buf, offset=_CLOSED_OFFSET)
+        self.meta = []   # 每个槽位: uint64[3]（seq, 代数, 帧序号）
+        self.times = []  # 每个槽位: float64[1]（捕获时间）
+        self.data = []   # 每个槽位: (高, 宽, 通道) uint8
+        for i in range(slots):
+            offset = header_size + i * stride
+            self.meta.append(np.ndarray((3,), dtype=np.uint64, buffer=buf, offset=offset))
+            self.times.append(np.ndarray((1,), dtype=np.float64, buffer=buf, offset=offset + 24))
+            self.data.append(np.ndarray(self.shape, dtype=np.uint8, buffer=buf, offset=offset + _SLOT_HEADER))
+
+    def release(self):
+        """释放所有视图（SharedMemory.close() 要求没有导出的视图）"""
+        self.generation = self.pid = self.closed = None
+        self.meta = self.times = self.data = []
+
+
+class FramePublisher:
+    """把帧写入具名共享内存环形缓冲区（只能有一个发布者）"""
+
+    def __init__(self, name, width, height, channels=3, slots=DEFAULT_SLOTS):
+        """
+        Args:
+            name: 共享内存名称（订阅者据此连接）
+            width, height, channels: 帧尺寸（uint8）
+            slots: 环形缓冲区的槽位数
+
+        Raises:
+            RuntimeError: 同名共享内存正被另一个仍在运行的发布者使用
+        """
+        if slots < 2:
+            raise ValueError("至少需要 2 个槽位")
+        self.name = name
+        self.width = int(width)
+        self.height = int(height)
+        self.channels = int(channels)
+        self.slots = int(slots)
+        self.published = 0
+        frame_bytes = self.width * self.height * self.channels
+        stride = _SLOT_HEADER + _align(frame_bytes)
+        size = _HEADER_SIZE + stride * self.slots
+        self._shm = self._create(name, size)
+        _published.add(name)
+        _HEADER.pack_into(self._shm.buf, 0, _MAGIC, _VERSION, self.slots, self.width, self.height, self.channels,
+                          _HEADER_SIZE, stride, frame_bytes)
+        self._layout = _Layout(self._shm.buf)
+        self._layout.pid[0] = os.getpid()
+
+    @staticmethod
+    def _create(name, size):
+        try:
+            return shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            pass
+        # 上一次录制崩溃时留下的共享内存：发布者已经不在了就删掉重建
+        stale = shared_memory.SharedMemory(name=name)
+        try:
+            pid = struct.unpack_from('<I', stale.buf, _PID_OFFSET)[0] if stale.size >= _HEADER_SIZE else 0
+            closed = struct.unpack_from('<I', stale.buf, _CLOSED_OFFSET)[0] if stale.size >= _HEADER_SIZE else 1
+            if not closed and pid != os.getpid() and _pid_alive(pid):
+                raise RuntimeError(f"共享内存 {name} 正被进程 {pid} 使用")
+        finally:
+            stale.close()
+        stale.unlink()
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+
+    def publish(self, img, frame_index, capture_time):
+        """写入一帧（复制一次到共享内存）
+
+        Raises:
+            ValueError: 帧尺寸与创建时不一致
+        """
+        layout = self._layout
+        if img.shape != layout.shape or img.dtype != np.uint8:
+            raise ValueError(f"帧尺寸 {img.shape} / {img.dtype} 与广播的 {layout.shape} / uint8 不一致")
+        generation = self.published
+        slot = generation % self.slots
+        meta = layout.meta[slot]
+        meta[0] += 1  # seq 变为奇数：写入中
+        np.copyto(layout.data[slot], img)
+        meta[1] = generation
+        meta[2] = frame_index
+        layout.times[slot][0] = capture_time
+        meta[0] += 1  # seq 变为偶数：写入完成
+        self.published = generation + 1
+        layout.generation[0] = self.published
+
+    def stats(self):
+        return {"name": self.name, "slots": self.slots, "width": self.width, "height": self.height,
+                "published": self.published}
+
+    def close(self, unlink=True):
+        """标记为已关闭并释放共享内存（已连接的订阅者仍可读完手里的映射）"""
+        if self._shm is None:
+            return
+        self._layout.closed[0] = 1
+        self._layout.release()
+        self._shm.close()
+        if unlink:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+        _published.discard(self.name)
+        self._shm = None
+
+
+class SharedFrame:
+    """订阅者读到的一帧：array 是共享内存上的只读视图，处理完后用 valid() 确认没有被覆盖"""
+
+    def __init__(self, array, generation, frame_index, capture_time, seq, meta):
+        self.array = array
+        self.generation = generation
+        self.frame_index = frame_index
+        self.capture_time = capture_time
+        self._seq = seq
+        self._meta = meta
+
+    def valid(self):
+        """从读取到现在，这一帧所在的槽位没有被发布者改写"""
+        return self._meta is None or int(self._meta[0]) == self._seq
+
+
+class FrameSubscriber:
+    """连接发布者的共享内存，读取最新帧"""
+
+    def __init__(self, name=DEFAULT_NAME):
+        """
+        Raises:
+            FileNotFoundError: 没有这个名称的帧广播
+            ValueError: 共享内存不是帧广播
+        """
+        self.name = name
+        self._shm = _attach(name)
+        try:
+            self._layout = _Layout(self._shm.buf)
+        except ValueError:
+            self._shm.close()
+            raise
+        self.width = self._layout.width
+        self.height = self._layout.height
+        self.channels = self._layout.channels
+        self.slots = self._layout.slots
+        self.torn = 0  # 读取时被发布者覆盖而重读的次数
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def generation(self):
+        """发布者已发布的帧数"""
+        return int(self._layout.generation[0])
+
+    @property
+    def closed(self):
+        """发布者已停止（之后不会再有新帧；录制器下次启动会建一块新的共享内存，需要重新连接）"""
+        return bool(self._layout.closed[0])
+
+    def read(self, generation, copy=False):
+        """读取第 generation 帧；已被覆盖或尚未发布时返回 None"""
+        layout = self._layout
+        slot = generation % self.slots
+        meta = layout.meta[slot]
+        for _attempt in range(3):
+            seq = int(meta[0])
+            if seq % 2 or int(meta[1]) != generation or generation >= self.generation:
+                if seq % 2:
+                    self.torn += 1
+                    continue
+                return None
+            frame_index = int(meta[2])
+            capture_time = float(layout.times[slot][0])
+            array = layout.data[slot]
+            if copy:
+                array = array.copy()
+            if int(meta[0]) != seq or int(meta[1]) != generation:
+                self.torn += 1
+                continue
+            if copy:
+                return SharedFrame(array, generation, frame_index, capture_time, seq, None)
+            view = array.view()
+            view.flags.writeable = False
+            return SharedFrame(view, generation, frame_index, capture_time, seq, meta)
+        return None
+
+    def latest(self, copy=False):
+        """最新发布的一帧，还没有帧时返回 None"""
+        for _attempt in range(3):
+            generation = self.generation
+            if generation == 0:
+                return None
+            frame = self.read(generation - 1, copy=copy)
+            if frame is not None:
+                return frame
+        return None
+
+    def wait_next(self, after=None, timeout=None, copy=False):
+        """等待比第 after 帧更新的帧（默认比当前最新帧更新），返回最新的一帧；超时或发布者关闭时返回 None"""
+        if after is None:
+            after = self.generation - 1
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.generation - 1 > after:
+                frame = self.latest(copy=copy)
+                if frame is not None and frame.generation > after:
+                    return frame
+            if self.closed or (deadline is not None and time.monotonic() >= deadline):
+                return None
+            time.sleep(POLL_INTERVAL)
+
+    def frames(self, copy=False, timeout=None):
+        """依次产出最新的帧；处理慢于发布时跳过中间的帧，发布者关闭或等待超时后结束"""
+        after = self.generation - 1
+        while True:
+            frame = self.wait_next(after, timeout=timeout, copy=copy)
+            if frame is None:
+                return
+            after = frame.generation
+            yield frame
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._layout.release()
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # 调用方仍持有帧视图，映射随进程退出释放
+        self._shm = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="连接录屏帧广播，统计收到的帧")
+    parser.add_argument("name", nargs="?", default=DEFAULT_NAME, help="共享内存名称")
+    parser.add_argument("--seconds", type=float, default=10.0, help="统计时长（秒）")
+    args = parser.parse_args()
+
+    try:
+        sub = FrameSubscriber(args.name)
+    except FileNotFoundError:
+        print(f"✗ 没有名为 {args.name} 的帧广播（录制器是否已开启 frame_broadcast？）")
+        sys.exit(1)
+    with sub:
+        print(f"✓ 已连接 {args.name}: {sub.width}x{sub.height}x{sub.channels}, {sub.slots} 个槽位")
+        received = skipped = invalid = 0
+        last = None
+        start = time.monotonic()
+        for frame in sub.frames(timeout=1.0):
+            received += 1
+            if last is not None:
+                skipped += frame.generation - last - 1
+            last = frame.generation
+            float(frame.array[::64, ::64].mean())  # 模拟读取画面
+            if not frame.valid():
+                invalid += 1
+            if time.monotonic() - start >= args.seconds:
+                break
+        elapsed = time.monotonic() - start
+        closed = sub.closed
+    print(f"收到 {received} 帧（{received / elapsed:.1f} fps），跳过 {skipped} 帧，"
+          f"读取中被覆盖 {invalid} 帧，重读 {sub.torn} 次")
+    if closed:
+        print("发布者已停止")
+
+
+if __name__ == "__main__":
+    main()
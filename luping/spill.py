@@ -0,0 +1,207 @@
+"""
+写入队列的磁盘溢出层
+
+编码器短暂卡顿（磁盘忙、CPU 被抢占）时，写入线程跟不上采集，原来内存队列满 90 帧后就开始丢帧。
+SpillQueue 在内存队列之后加一层溢出：内存放满后，新帧写入本地磁盘上的内存映射环形文件
+（可选 LZ4 压缩），写入线程先取完内存中的帧，再按顺序取溢出文件中的帧，短时间卡顿不丢帧。
+只有溢出文件也写满时才丢帧。
+
+顺序保证：只要溢出文件中还有帧，新帧就继续写入溢出文件，因此内存中的帧总是比溢出文件中的帧早。
+
+溢出文件是稀疏文件，只在第一次溢出时创建，关闭时删除；metrics() 提供溢出深度和吞吐量。
+"""
+import mmap
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+try:
+    import lz4.frame as _lz4
+except ImportError:
+    _lz4 = None
+
+DEFAULT_RAM_FRAMES = 90                   # 内存中最多缓冲的帧数（30fps 下 3 秒）
+DEFAULT_SPILL_BYTES = 2 * 1024 ** 3       # 溢出文件容量
+
+
+class SpillQueue:
+    """内存 + 磁盘环形文件两级的帧队列，元素为 (图像, 附加信息) 或 None（结束信号）
+
+    接口与 queue.Queue 的 put_nowait / get / qsize 一致；溢出文件也满时 put_nowait 抛出 queue.Full。
+    """
+
+    def __init__(self, ram_frames=DEFAULT_RAM_FRAMES, spill_bytes=DEFAULT_SPILL_BYTES, spill_dir=None,
+                 compress=False):
+        """
+        Args:
+            ram_frames: 内存中最多缓冲的帧数
+            spill_bytes: 溢出文件容量（0 表示不溢出，等同于原来的有界队列）
+            spill_dir: 溢出文件所在目录（默认系统临时目录，应在本地磁盘上）
+            compress: 用 LZ4 压缩溢出的帧（未安装 lz4 时忽略）
+        """
+        self.ram_frames = ram_frames
+        self.spill_bytes = int(spill_bytes)
+        self.spill_dir = spill_dir
+        self.compress = bool(compress and _lz4 is not None)
+        if compress and _lz4 is None:
+            print("⚠️ 未安装 lz4，溢出帧不压缩")
+        self._ram = deque()
+        self._spill = deque()  # (偏移, 字节数, shape, dtype, 是否压缩, 附加信息)；None 表示结束信号
+        self._write_pos = 0
+        self._spill_used = 0  # 溢出文件中未取出的字节数
+        self._spill_path = None
+        self._spill_file = None
+        self._map = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {
+            "spilled_frames": 0,
+            "spilled_bytes": 0,
+            "max_spill_depth": 0,
+            "max_spill_bytes": 0,
+            "dropped": 0,
+            "spill_write_seconds": 0.0,
+            "spill_read_seconds": 0.0,
+            "unspilled_bytes": 0,
+        }
+
+    def qsize(self):
+        with self._cond:
+            return len(self._ram) + len(self._spill)
+
+    def spill_depth(self):
+        """溢出文件中等待写入的帧数"""
+        with self._cond:
+            return len(self._spill)
+
+    def put_nowait(self, item):
+        """加入一帧；内存和溢出文件都满时抛出 queue.Full"""
+        with self._cond:
+            if not self._spill and len(self._ram) < self.ram_frames:
+                self._ram.append(item)
+            elif not self._spill_item(item):
+                self._stats["dropped"] += 1
+                raise queue.Full
+            self._cond.notify()
+
+    def put(self, item):
+        """加入结束信号 None（不受容量限制，排在所有帧之后）"""
+        with self._cond:
+            if self._spill:
+                self._spill.append(None)
+            else:
+                self._ram.append(item)
+            self._cond.notify()
+
+    def get(self):
+        """按加入顺序取出一项，没有时阻塞"""
+        with self._cond:
+            while not self._ram and not self._spill:
+                self._cond.wait()
+            if self._ram:
+                return self._ram.popleft()
+            record = self._spill.popleft()
+            if record is None:
+                return None
+            return self._read_record(record)
+
+    def metrics(self):
+        """溢出统计：累计溢出帧数 / 字节、最大溢出深度、丢帧数和溢出文件读写吞吐量（MB/s）"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["spill_depth"] = len(self._spill)
+            stats["spill_bytes_used"] = self._spill_used
+            stats["compressed"] = self.compress
+        write_seconds = stats.pop("spill_write_seconds")
+        read_seconds = stats.pop("spill_read_seconds")
+        unspilled = stats.pop("unspilled_bytes")
+        stats["spill_write_mb_per_s"] = round(stats["spilled_bytes"] / write_seconds / 1e6, 1) if write_seconds else None
+        stats["spill_read_mb_per_s"] = round(unspilled / read_seconds / 1e6, 1) if read_seconds else None
+        return stats
+
+    def close(self):
+        """释放并删除溢出文件（队列中剩余的溢出帧随之丢弃）"""
+        with self._cond:
+            self._closed = True
+            self._spill.clear()
+            self._spill_used = 0
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+            if self._spill_path is not None:
+                try:
+                    os.unlink(self._spill_path)
+                except OSError:
+                    pass
+                self._spill_path = None
+
+    # -------------------- 溢出文件 --------------------
+    def _open_spill(self):
+        fd, self._spill_path = tempfile.mkstemp(prefix="luping_spill_", suffix=".ring", dir=self.spill_dir)
+        self._spill_file = os.fdopen(fd, 'r+b')
+        self._spill_file.truncate(self.spill_bytes)  # 稀疏文件，写入前不占磁盘空间
+        self._map = mmap.mmap(self._spill_file.fileno(), self.spill_bytes)
+
+    def _alloc(self, size):
+        """在环形文件中分配 size 字节，返回偏移；空间不足时返回 None"""
+        if not self._spill or self._spill[0] is None:
+            self._write_pos = 0
+            return 0 if size <= self.spill_bytes else None
+        head = self._spill[0][0]
+        pos = self._write_pos
+        if pos >= head:
+            # 尚未回绕：先用文件尾部的空间，不够时回到开头（不能追上最早的记录）
+            if pos + size <= self.spill_bytes:
+                return pos
+            return 0 if size < head else None
+        return pos if pos + size < head else None
+
+    def _spill_item(self, item):
+        if self.spill_bytes <= 0 or self._closed:
+            return False
+        img, extra = item
+        start = time.perf_counter()
+        img = np.ascontiguousarray(img)
+        data = _lz4.compress(img.data, compression_level=0) if self.compress else img.data
+        size = len(data) if self.compress else img.nbytes
+        try:
+            if self._map is None:
+                self._open_spill()
+            offset = self._alloc(size)
+        except OSError as e:
+            print(f"⚠️ 无法创建溢出文件，不再溢出: {e}")
+            self.spill_bytes = 0
+            return False
+        if offset is None:
+            return False
+        self._map[offset:offset + size] = data
+        self._write_pos = offset + size
+        self._spill.append((offset, size, img.shape, img.dtype.str, self.compress, extra))
+        stats = self._stats
+        stats["spilled_frames"] += 1
+        stats["spilled_bytes"] += size
+        stats["spill_write_seconds"] += time.perf_counter() - start
+        stats["max_spill_depth"] = max(stats["max_spill_depth"], len(self._spill))
+        self._spill_used += size
+        stats["max_spill_bytes"] = max(stats["max_spill_bytes"], self._spill_used)
+        return True
+
+    def _read_record(self, record):
+        offset, size, shape, dtype, compressed, extra = record
+        start = time.perf_counter()
+        data = self._map[offset:offset + size]
+        if compressed:
+            data = _lz4.decompress(data)
+        img = np.frombuffer(data, dtype=np.dtype(dtype)).reshape(shape)
+        self._stats["spill_read_seconds"] += time.perf_counter() - start
+        self._stats["unspilled_bytes"] += size
+        self._spill_used -= size
+        return img, extra
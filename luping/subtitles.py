@@ -0,0 +1,275 @@
+"""
+把事件日志转成字幕轨道并封装进视频
+
+按键和鼠标点击被转换为 WebVTT / ASS 字幕，再用 ffmpeg 以流复制方式封装进 MP4/MKV：
+视频流不重新编码，一小时的录像也只需几秒。播放器打开字幕即可看到输入叠加。
+
+用法:
+    python -m luping.subtitles recordings/recording_20250101_120000.mp4
+    python -m luping.subtitles recording.mp4 --events events.json -o out.mkv
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from luping.container import probe_container
+from luping.eventlog import EventLogReader, events_path_for
+from luping.ffmpeg_tools import find_ffmpeg, run_ffmpeg
+from luping.timeline import FrameTimeline, event_video_time, timeline_path_for
+
+KEY_WINDOW = 1.0  # 相邻按键间隔不超过该值时视为同一段输入（秒）
+KEY_HOLD = 1.5  # 一段输入结束后字幕保留时长（秒）
+CLICK_HOLD = 0.8  # 点击字幕显示时长（秒）
+MAX_KEY_TEXT = 40  # 输入字幕最多显示的字符数（超出后只保留末尾）
+
+_MODIFIER_LABELS = {
+    "ctrl": "Ctrl", "ctrl_l": "Ctrl", "ctrl_r": "Ctrl",
+    "alt": "Alt", "alt_l": "Alt", "alt_r": "Alt", "alt_gr": "AltGr",
+    "cmd": "Cmd", "cmd_l": "Cmd", "cmd_r": "Cmd",
+    "shift": "Shift", "shift_l": "Shift", "shift_r": "Shift",
+}
+_SPECIAL_LABELS = {
+    "space": " ", "enter": "⏎", "tab": "⇥", "backspace": "⌫", "delete": "⌦",
+    "esc": "Esc", "up": "↑", "down": "↓", "left": "←", "right": "→",
+    "home": "Home", "end": "End", "page_up": "PgUp", "page_down": "PgDn",
+    "caps_lock": "CapsLock",
+}
+_BUTTON_LABELS = {"Button.left": "左键", "Button.right": "右键", "Button.middle": "中键"}
+
+
+def _key_id(key):
+    """pynput 的按键字符串 -> (是否特殊键, 名称)"""
+    if key.startswith("Key."):
+        return True, key[4:]
+    return False, key
+
+
+def _key_label(key, modifiers):
+    special, name = _key_id(key)
+    if special:
+        label = _SPECIAL_LABELS.get(name, name.capitalize())
+    elif len(name) == 1 and ord(name) < 32:
+        # 按住 Ctrl 时 pynput 可能给出控制字符（如 '\x03' 表示 Ctrl+C）
+        label = chr(ord(name) + 64)
+    else:
+        label = name
+    combo = [m for m in ("Ctrl", "Alt", "AltGr", "Cmd") if m in modifiers]
+    if combo:
+        if "Shift" in modifiers:
+            combo.append("Shift")
+        return " " + "+".join(combo + [label.strip() or "Space"]) + " "
+    if special and len(label) > 1:
+        return f" {label} "
+    return label
+
+
+def build_cues(events, video_fps=None):
+    """把（按时间排序的）事件转换为字幕条目
+
+    Returns:
+        [(start, end, text, kind), ...]，kind 为 "keys" 或 "mouse"
+    """
+    key_presses = []  # (time, label)
+    mouse_cues = []
+    modifiers = set()
+    scroll = None  # [start, last, direction, count]
+
+    def flush_scroll():
+        if scroll:
+            arrow = "↑" if scroll[2] > 0 else "↓"
+            text = f"滚轮 {arrow}" + (f" ×{scroll[3]}" if scroll[3] > 1 else "")
+            mouse_cues.append((scroll[0], scroll[1] + CLICK_HOLD, text, "mouse"))
+
+    for event in events:
+        kind = event.get("type")
+        t = event_video_time(event, video_fps)
+        if kind == "key_press":
+            special, name = _key_id(str(event.get("key", "")))
+            if special and name in _MODIFIER_LABELS:
+                modifiers.add(_MODIFIER_LABELS[name])
+                continue
+            key_presses.append((t, _key_label(str(event.get("key", "")), modifiers)))
+        elif kind == "key_release":
+            special, name = _key_id(str(event.get("key", "")))
+            if special and name in _MODIFIER_LABELS:
+                modifiers.discard(_MODIFIER_LABELS[name])
+        elif kind == "mouse_click" and event.get("pressed"):
+            button = _BUTTON_LABELS.get(str(event.get("button")), str(event.get("button")))
+            mouse_cues.append((t, t + CLICK_HOLD, f"{button} ({event.get('x')}, {event.get('y')})", "mouse"))
+        elif kind == "mouse_scroll":
+            direction = 1 if (event.get("dy") or 0) > 0 else -1
+            if scroll and scroll[2] == direction and t - scroll[1] <= KEY_WINDOW:
+                scroll[1] = t
+                scroll[3] += 1
+            else:
+                flush_scroll()
+                scroll = [t, t, direction, 1]
+    flush_scroll()
+
+    # 输入字幕逐键递增显示，直到下一次按键或本段结束
+    key_cues = []
+    text = ""
+    for i, (t, label) in enumerate(key_presses):
+        if i > 0 and t - key_presses[i - 1][0] > KEY_WINDOW:
+            text = ""
+        if label == "⌫" and text and not text.endswith(" "):
+            text = text[:-1]
+        else:
+            text += label
+        shown = text.strip()
+        if len(shown) > MAX_KEY_TEXT:
+            shown = "…" + shown[-MAX_KEY_TEXT:]
+        end = t + KEY_HOLD
+        if i + 1 < len(key_presses):
+            end = min(end, key_presses[i + 1][0])
+        if shown and end > t:
+            key_cues.append((t, end, shown, "keys"))
+
+    cues = key_cues + mouse_cues
+    cues.sort(key=lambda c: c[0])
+    return cues
+
+
+def _format_time(seconds, sep=".", ass=False):
+    seconds = max(0.0, seconds)
+    hours = int(seconds // 3600)
+    minutes = int(seconds % 3600 // 60)
+    secs = seconds % 60
+    if ass:
+        return f"{hours:d}:{minutes:02d}:{secs:05.2f}"
+    return f"{hours:02d}:{minutes:02d}:{secs:06.3f}".replace(".", sep)
+
+
+def to_webvtt(cues):
+    """字幕条目 -> WebVTT 文本（点击显示在画面顶部，输入显示在底部）"""
+    lines = ["WEBVTT", ""]
+    for i, (start, end, text, kind) in enumerate(cues, 1):
+        setting = " line:5%" if kind == "mouse" else ""
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        lines.append(str(i))
+        lines.append(f"{_format_time(start)} --> {_format_time(end)}{setting}")
+        lines.append(text)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def to_ass(cues, width=1920, height=1080):
+    """字幕条目 -> ASS 文本"""
+    font_size = max(16, height // 24)
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Keys,Noto Sans,{font_size},&H00FFFFFF,&H00FFFFFF,&H00000000,&H80000000,"
+        "0,0,0,0,100,100,0,0,3,2,0,2,20,20,30,1",
+        f"Style: Mouse,Noto Sans,{font_size},&H0000FFFF,&H0000FFFF,&H00000000,&H80000000,"
+        "0,0,0,0,100,100,0,0,3,2,0,8,20,20,30,1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for start, end, text, kind in cues:
+        style = "Mouse" if kind == "mouse" else "Keys"
+        text = text.replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}")
+        lines.append(f"Dialogue: 0,{_format_time(start, ass=True)},{_format_time(end, ass=True)},"
+                     f"{style},,0,0,0,,{text}")
+    return "\n".join(lines) + "\n"
+
+
+def write_subtitles(video_path, events_path=None, fmt="vtt", output_path=None, width=1920, height=1080):
+    """根据事件日志生成字幕文件，返回字幕文件路径"""
+    video_path = Path(video_path)
+    events_path = Path(events_path) if events_path else events_path_for(video_path)
+    video_fps = None
+    timeline_path = timeline_path_for(video_path)
+    if timeline_path.exists():
+        video_fps = FrameTimeline.load(timeline_path).video_fps
+    with EventLogReader(events_path) as log:
+        cues = build_cues(iter(log), video_fps=video_fps)
+    if output_path is None:
+        output_path = video_path.with_name(f"{video_path.stem}.events.{fmt}")
+    output_path = Path(output_path)
+    text = to_ass(cues, width, height) if fmt == "ass" else to_webvtt(cues)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return output_path
+
+
+def mux_event_subtitles(video_path, events_path=None, output_path=None, timeout=600, width=None, height=None):
+    """把事件字幕以流复制方式封装进视频，返回输出文件路径
+
+    MP4/MOV 使用 mov_text 字幕轨，其他容器输出为 MKV 并保留 ASS 样式。
+    width/height 是视频画面尺寸（ASS 定位用），不给时从视频文件读取。
+
+    Raises:
+        RuntimeError: 找不到 ffmpeg 或封装失败
+    """
+    video_path = Path(video_path)
+    if output_path is None:
+        suffix = video_path.suffix if video_path.suffix in ('.mp4', '.mov', '.mkv') else '.mkv'
+        output_path = video_path.with_name(f"{video_path.stem}_events{suffix}")
+    output_path = Path(output_path)
+    is_mp4 = output_path.suffix in ('.mp4', '.mov')
+    fmt = "vtt" if is_mp4 else "ass"
+
+    ffmpeg_path = find_ffmpeg()
+    if not ffmpeg_path:
+        raise RuntimeError("未找到 ffmpeg，无法封装字幕")
+    if not width or not height:
+        info = probe_container(video_path)
+        width, height = info["width"] or 1920, info["height"] or 1080
+    # 字幕只是封装的中间文件，封装完删除，不在录像旁边留下副本
+    subs_path = write_subtitles(video_path, events_path, fmt=fmt,
+                                output_path=output_path.with_name(f"{output_path.stem}.events.tmp.{fmt}"),
+                                width=width, height=height)
+    args = [
+        '-y', '-loglevel', 'error',
+        '-i', video_path,
+        '-i', subs_path,
+        # 只取原视频的音视频流，重复封装时替换而不是叠加旧的事件字幕
+        '-map', '0:v', '-map', '0:a?', '-map', '1',
+        '-c', 'copy',
+        '-c:s', 'mov_text' if is_mp4 else 'ass',
+        '-metadata:s:s:0', 'title=输入事件',
+        '-metadata:s:s:0', 'language=chi',
+        '-disposition:s:0', 'default',
+        output_path,
+    ]
+    try:
+        proc = run_ffmpeg(args, timeout=timeout, ffmpeg_path=ffmpeg_path)
+    finally:
+        subs_path.unlink(missing_ok=True)
+    if proc.returncode != 0 or not output_path.exists():
+        raise RuntimeError(f"封装字幕失败: {proc.stderr.strip()[-500:]}")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把事件日志转为字幕并封装进视频（不重新编码）")
+    parser.add_argument("video", help="录像文件")
+    parser.add_argument("--events", default=None, help="事件文件（默认按录像文件名推断）")
+    parser.add_argument("-o", "--output", default=None, help="输出文件（.mp4/.mkv）")
+    parser.add_argument("--subtitles-only", choices=("vtt", "ass"), default=None,
+                        help="只生成字幕文件，不封装")
+    args = parser.parse_args()
+
+    try:
+        if args.subtitles_only:
+            path = write_subtitles(args.video, args.events, fmt=args.subtitles_only, output_path=args.output)
+            print(f"✓ 字幕已生成: {path}")
+        else:
+            path = mux_event_subtitles(args.video, args.events, args.output)
+            print(f"✓ 已封装事件字幕: {path}")
+    except Exception as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+会话时钟与帧时间表
+
+事件和帧使用同一个单调时钟打点：事件的 timestamp 与帧的捕获时间可以直接比较。
+录制结束后把"帧序号 -> 捕获时间"表写到视频旁边（recording_*.frames.json），
+保存事件时为每个事件标注所属帧序号，之后查找"点击发生时的那一帧"只需读取 event["frame"]。
+"""
+import json
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+
+TIMELINE_VERSION = 1
+
+
+class SessionClock:
+    """录制会话时钟（单调时钟，不受系统时间调整影响）"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.epoch = time.time()
+
+    def start(self):
+        """重置时钟起点，返回对应的墙钟时间"""
+        self.origin = time.perf_counter()
+        self.epoch = time.time()
+        return self.epoch
+
+    def now(self):
+        """自会话开始以来的秒数"""
+        return time.perf_counter() - self.origin
+
+
+class FrameTimeline:
+    """帧序号 -> 捕获时间 表
+
+    帧序号即写入视频的帧序号；被丢弃的帧不占序号，只记录其捕获时间。
+    """
+
+    def __init__(self, video_fps=30.0):
+        """
+        Args:
+            video_fps: 帧序号到视频时间的换算帧率（视频时间 = 帧序号 / video_fps）
+        """
+        self.video_fps = float(video_fps)
+        self.epoch = None
+        self.capture_times = array('d')
+        self.dropped_times = array('d')
+        self.keyframe_requests = []  # 请求强制关键帧的帧序号
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.capture_times)
+
+    def append(self, capture_time):
+        """登记一帧已进入写入队列，返回该帧的序号"""
+        with self._lock:
+            self.capture_times.append(capture_time)
+            return len(self.capture_times) - 1
+
+    def note_dropped(self, capture_time):
+        """登记一帧被丢弃"""
+        with self._lock:
+            self.dropped_times.append(capture_time)
+
+    def frame_at(self, t):
+        """返回捕获时间不晚于 t 的最后一帧序号（t 早于第一帧时返回 0，没有帧时返回 None）"""
+        if not self.capture_times:
+            return None
+        return max(0, bisect_right(self.capture_times, t) - 1)
+
+    def time_of(self, index):
+        """帧的捕获时间（会话时钟）"""
+        return self.capture_times[index]
+
+    def video_time_of(self, index):
+        """帧在视频文件中的显示时间"""
+        return index / self.video_fps if self.video_fps > 0 else 0.0
+
+    def assign_frames(self, events):
+        """为按时间排序的事件列表原地标注 "frame" 字段（线性归并）"""
+        times = self.capture_times
+        if not times:
+            return events
+        count = len(times)
+        index = 0
+        for event in events:
+            t = event.get("timestamp", 0.0)
+            while index + 1 < count and times[index + 1] <= t:
+                index += 1
+            event["frame"] = index
+        return events
+
+    def to_dict(self):
+        return {
+            "version": TIMELINE_VERSION,
+            "clock": "monotonic",
+            "epoch": self.epoch,
+            "video_fps": self.video_fps,
+            "frame_count": len(self.capture_times),
+            "dropped_count": len(self.dropped_times),
+            "capture_times": [round(t, 4) for t in self.capture_times],
+            "dropped_times": [round(t, 4) for t in self.dropped_times],
+            "keyframe_requests": list(self.keyframe_requests),
+        }
+
+    def save(self, path):
+        """原子写入帧时间表"""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """从 recording_*.frames.json 读取帧时间表"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        timeline = cls(video_fps=data.get("video_fps", 30.0))
+        timeline.epoch = data.get("epoch")
+        timeline.capture_times = array('d', data.get("capture_times", []))
+        timeline.dropped_times = array('d', data.get("dropped_times", []))
+        timeline.keyframe_requests = list(data.get("keyframe_requests", []))
+        return timeline
+
+
+def event_video_time(event, video_fps=None):
+    """事件在视频中的时间：优先用帧序号换算，旧日志回退到时间戳"""
+    if video_fps and "frame" in event:
+        return event["frame"] / video_fps
+    return float(event.get("timestamp", 0.0))
+
+
+def timeline_path_for(video_path):
+    """视频文件对应的帧时间表路径（与视频同名，后缀 .frames.json）"""
+    video_path = Path(video_path)
+    return video_path.with_name(video_path.stem + ".frames.json")
@@ -0,0 +1,100 @@
+"""
+鼠标轨迹压缩
+
+按固定时间间隔丢弃鼠标移动事件会让快速手势失真。这里改为按"偏离直线的距离"取点：
+只有当轨迹偏离上一个输出点到当前点的直线超过容差时才输出拐点，
+因此直线移动只留下端点，弯曲处保留足够的点，回放时用折线即可在容差内还原轨迹。
+"""
+import math
+import threading
+
+
+def _segment_distance(px, py, ax, ay, bx, by):
+    """点 P 到线段 AB 的距离"""
+    dx = bx - ax
+    dy = by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - ax, py - ay)
+    u = ((px - ax) * dx + (py - ay) * dy) / length_sq
+    if u < 0.0:
+        u = 0.0
+    elif u > 1.0:
+        u = 1.0
+    return math.hypot(px - (ax + u * dx), py - (ay + u * dy))
+
+
+class TrajectoryCompressor:
+    """流式轨迹压缩器（开窗式 Douglas-Peucker）
+
+    add() 每收到一个点，返回需要立即输出的点列表 [(x, y, t), ...]。
+    保证：相邻两个输出点之间的所有原始点，到两点连线的距离都不超过 tolerance。
+    """
+
+    def __init__(self, tolerance=3.0, max_gap=0.5, max_pending=64):
+        """
+        Args:
+            tolerance: 允许的最大偏离距离（像素）
+            max_gap: 持续移动时两个输出点之间的最大时间间隔（秒）
+            max_pending: 窗口内最多缓存的点数，超过后强制输出，限制单次计算量
+        """
+        self.tolerance = float(tolerance)
+        self.max_gap = float(max_gap)
+        self.max_pending = max(2, int(max_pending))
+        self._lock = threading.Lock()
+        self._anchor = None  # 最近一次输出的点
+        self._pending = []  # 自 anchor 以来尚未输出的点
+
+    def reset(self):
+        """清空状态（每次开始录制时调用）"""
+        with self._lock:
+            self._anchor = None
+            self._pending = []
+
+    def add(self, x, y, t):
+        """加入一个原始点，返回需要输出的点"""
+        with self._lock:
+            point = (x, y, t)
+            if self._anchor is None:
+                self._anchor = point
+                return [point]
+
+            # 位置没有变化的重复点直接忽略
+            last = self._pending[-1] if self._pending else self._anchor
+            if last[0] == x and last[1] == y:
+                return []
+
+            emitted = []
+            if self._pending and t - self._pending[-1][2] >= self.max_gap:
+                # 光标停留过：先输出停留点，保留它的时间，否则回放会把停留摊成一段慢速移动
+                emitted.append(self._emit_last_pending())
+            elif self._pending and self._deviates(point):
+                # 加入当前点后直线不再能代表窗口内的轨迹，输出上一个点作为拐点
+                emitted.append(self._emit_last_pending())
+            self._pending.append(point)
+
+            if t - self._anchor[2] >= self.max_gap or len(self._pending) >= self.max_pending:
+                emitted.append(self._emit_last_pending())
+            return emitted
+
+    def flush(self):
+        """输出窗口中最后一个点（点击前、停止录制时调用），返回需要输出的点"""
+        with self._lock:
+            if not self._pending:
+                return []
+            return [self._emit_last_pending()]
+
+    def _deviates(self, point):
+        ax, ay, _ = self._anchor
+        bx, by, _ = point
+        tol = self.tolerance
+        for px, py, _ in self._pending:
+            if _segment_distance(px, py, ax, ay, bx, by) > tol:
+                return True
+        return False
+
+    def _emit_last_pending(self):
+        point = self._pending[-1]
+        self._anchor = point
+        self._pending = []
+        return point
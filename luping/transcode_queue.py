@@ -0,0 +1,430 @@
+"""
+无损录制的后台转码队列
+
+4K 等高分辨率屏幕上实时 libx264 编码跟不上采集，写入队列满了就会丢帧。无损录制模式下，
+录制时只把帧写成编码开销极低的无损中间文件（recording_*.lossless.mkv，Ut Video / FFV1，全部为关键帧），
+停止录制后生成转码任务文件，由后台线程在机器空闲时以最低优先级转码为 H.264：
+
+    recordings/.transcode/recording_<时间戳>.job.json   任务（源文件、帧数、帧率、关键帧请求、进度）
+    recordings/.transcode/recording_<时间戳>.part0000.mp4 ...  已完成的分段
+
+转码按固定帧数分段进行，每段写完后原子重命名，任务文件记录进度；进程崩溃或退出后，
+下次启动录制器（或运行本模块）时跳过已完成的分段继续。各段编码参数相同，最后流复制拼接为
+recording_<时间戳>.mp4，帧数核对无误后才删除中间文件、分段和任务文件，并补全录制清单。
+
+没有可用编码器时备用方案写出的打包帧文件（recording_*.mjpeg，见 luping.frame_pack）也走同一个队列：
+按索引把每段对应的字节范围交给 ffmpeg 的 subfile 协议读取，不需要复制数据。
+
+用法:
+    python -m luping.transcode_queue recordings            # 立即执行目录中未完成的转码任务
+    python -m luping.transcode_queue recordings --adopt    # 另外为崩溃遗留、没有任务文件的中间文件创建任务
+"""
+import argparse
+import json
+import math
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from luping.container import probe_container
+from luping.frame_pack import PACK_SUFFIX, index_path_for, load_pack_index
+from luping.ffmpeg_tools import find_ffmpeg, nice_command, subprocess_kwargs
+from luping.manifest import container_summary, file_entry, load_manifest, manifest_path_for, save_manifest
+
+JOB_VERSION = 1
+JOB_DIR_NAME = ".transcode"
+INTERMEDIATE_MARKER = ".lossless"
+DEFAULT_CHUNK_FRAMES = 1800  # 每段 1800 帧（30fps 下 1 分钟）
+DEFAULT_MAX_LOAD = 0.5       # 每核平均负载低于该值才视为空闲
+DELIVERY_ENCODER = {"codec": "libx264", "preset": "veryfast", "pix_fmt": "yuv420p"}
+
+_lossless_args = {}
+
+
+def lossless_encode_args(ffmpeg_path=None):
+    """无损中间文件的编码参数：优先 Ut Video（最快），其次 FFV1"""
+    ffmpeg_path = ffmpeg_path or find_ffmpeg()
+    if ffmpeg_path not in _lossless_args:
+        args = ['-c:v', 'ffv1', '-level', '3', '-g', '1', '-slices', '4']
+        try:
+            proc = subprocess.run([ffmpeg_path, '-hide_banner', '-encoders'],
+                                  **subprocess_kwargs(capture_output=True, text=True, timeout=10))
+            if re.search(r'^\s*V\S*\s+utvideo\s', proc.stdout, re.MULTILINE):
+                args = ['-c:v', 'utvideo']
+        except (OSError, subprocess.SubprocessError):
+            pass
+        _lossless_args[ffmpeg_path] = args
+    return list(_lossless_args[ffmpeg_path])
+
+
+def intermediate_path_for(video_path):
+    """录像对应的无损中间文件路径（recording_*.lossless.mkv）"""
+    video_path = Path(video_path)
+    return video_path.with_name(video_path.stem + INTERMEDIATE_MARKER + ".mkv")
+
+
+def job_path_for(video_path):
+    """录像对应的转码任务文件路径"""
+    video_path = Path(video_path)
+    return video_path.parent / JOB_DIR_NAME / (video_path.stem + ".job.json")
+
+
+def _part_path(job_path, index):
+    job_path = Path(job_path)
+    return job_path.with_name(job_path.name[:-len(".job.json")] + f".part{index:04d}.mp4")
+
+
+def _save_job(job_path, job):
+    tmp_path = job_path.with_name(job_path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, job_path)
+
+
+def load_job(job_path):
+    """读取任务文件，不存在或无法解析时返回 None"""
+    try:
+        with open(job_path, 'r', encoding='utf-8') as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(job, dict) or job.get("version", 0) > JOB_VERSION:
+        return None
+    return job
+
+
+def create_job(intermediate_path, output_path, frame_count, input_fps=30.0, video_fps=None, keyframes=(),
+               embed_event_subtitles=False, events_path=None, chunk_frames=None, source_format=None):
+    """写入转码任务文件，返回任务路径
+
+    Args:
+        frame_count: 中间文件的帧数
+        source_format: 中间文件格式，"mjpeg" 表示打包帧文件（默认根据文件后缀判断）
+        input_fps: 中间文件的帧率（管道输入帧率）
+        video_fps: 实际帧率与 input_fps 相差较大时，拼接时按该帧率重写时间戳（与实时模式的帧率修正一致）
+        keyframes: 需要强制关键帧的帧序号
+    """
+    output_path = Path(output_path)
+    job_path = job_path_for(output_path)
+    job_path.parent.mkdir(parents=True, exist_ok=True)
+    job = {
+        "version": JOB_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": Path(intermediate_path).name,
+        "output": output_path.name,
+        "frame_count": int(frame_count),
+        "input_fps": input_fps,
+        "video_fps": video_fps or input_fps,
+        "keyframes": sorted(int(i) for i in keyframes),
+        "encoder": dict(DELIVERY_ENCODER),
+        "chunk_frames": int(chunk_frames or DEFAULT_CHUNK_FRAMES),
+        "chunks_done": 0,
+        "embed_event_subtitles": bool(embed_event_subtitles),
+        "events": Path(events_path).name if events_path else None,
+    }
+    if source_format or Path(intermediate_path).suffix == PACK_SUFFIX:
+        job["source_format"] = source_format or "mjpeg"
+    _save_job(job_path, job)
+    return job_path
+
+
+def count_frames(path, ffmpeg_path=None):
+    """流复制读一遍统计帧数（中间文件没有可靠索引时使用），失败时返回 None"""
+    ffmpeg_path = ffmpeg_path or find_ffmpeg()
+    # framecrc 每个包输出一行（以 # 开头的是注释）
+    proc = subprocess.run([ffmpeg_path, '-v', 'error', '-i', str(path), '-map', '0:v:0', '-c', 'copy',
+                           '-f', 'framecrc', '-'], **subprocess_kwargs(capture_output=True, text=True))
+    if proc.returncode != 0:
+        return None
+    return sum(1 for line in proc.stdout.splitlines() if line and not line.startswith('#')) or None
+
+
+def _low_priority_kwargs(**kwargs):
+    """以最低优先级运行子进程（Windows；其他平台见 nice_command）"""
+    kwargs = subprocess_kwargs(**kwargs)
+    if sys.platform == 'win32':
+        kwargs['creationflags'] = kwargs.get('creationflags', 0) | subprocess.IDLE_PRIORITY_CLASS
+    return kwargs
+
+
+def _run_low_priority(cmd, what):
+    proc = subprocess.run(nice_command([str(a) for a in cmd], 19),
+                          **_low_priority_kwargs(capture_output=True, text=True))
+    if proc.returncode != 0:
+        raise RuntimeError(f"{what}失败: {proc.stderr.strip()[-500:]}")
+
+
+def _source_args(source, start, frames, job):
+    """分段的输入参数"""
+    if job.get("source_format") == "mjpeg":
+        # 打包帧文件没有时间戳，按索引只读取该段帧的字节范围
+        offsets, sizes = load_pack_index(source)
+        end = start + frames - 1
+        return ['-f', 'mjpeg', '-framerate', f"{job['input_fps']:g}",
+                '-i', f"subfile,,start,{offsets[start]},end,{offsets[end] + sizes[end]},,:{source}"]
+    # 全部为关键帧的中间文件可以精确定位：从目标帧之前半帧处开始，按帧数截止
+    return ['-ss', f"{max(0.0, (start - 0.5) / job['input_fps']):.6f}", '-i', source]
+
+
+def _encode_part(ffmpeg_path, source, part_path, start, frames, job):
+    input_fps = job["input_fps"]
+    encoder = job["encoder"]
+    # 中间文件的时间戳按毫秒取整，setpts 重新生成等间隔时间戳
+    cmd = [ffmpeg_path, '-y', '-loglevel', 'error', *_source_args(source, start, frames, job),
+           '-frames:v', str(frames), '-map', '0:v:0',
+           '-vf', f"setpts=N/({input_fps:g}*TB)", '-r', f"{input_fps:g}",
+           '-c:v', encoder["codec"], '-preset', encoder["preset"], '-pix_fmt', encoder["pix_fmt"]]
+    times = [math.floor((i - start) / input_fps * 1000) / 1000
+             for i in job["keyframes"] if start < i < start + frames]
+    if times:
+        cmd += ['-force_key_frames', ",".join(f"{t:.3f}" for t in times)]
+    tmp_path = part_path.with_name(part_path.stem + ".tmp.mp4")
+    _run_low_priority(cmd + ['-avoid_negative_ts', 'make_zero', tmp_path], f"转码分段 {part_path.name} ")
+    os.replace(tmp_path, part_path)
+
+
+def run_job(job_path, ffmpeg_path=None, wait_idle=None):
+    """执行（或继续执行）一个转码任务，返回 (是否成功, 说明)
+
+    Args:
+        wait_idle: 每段开始前调用，阻塞到机器空闲；返回 False 表示放弃（如队列停止）
+    """
+    job_path = Path(job_path)
+    job = load_job(job_path)
+    if job is None:
+        return False, f"无法读取任务文件: {job_path}"
+    directory = job_path.parent.parent
+    source = directory / job["source"]
+    output_path = directory / job["output"]
+    ffmpeg_path = ffmpeg_path or find_ffmpeg()
+    if not ffmpeg_path:
+        return False, "未找到 ffmpeg"
+    if not source.exists():
+        return False, f"中间文件不存在: {source.name}"
+
+    chunk_frames = job["chunk_frames"]
+    chunks = max(1, math.ceil(job["frame_count"] / chunk_frames))
+    try:
+        for index in range(chunks):
+            part_path = _part_path(job_path, index)
+            if part_path.exists():
+                continue  # 分段写完后才重命名，存在即完整
+            if wait_idle is not None and not wait_idle():
+                return False, "转码已暂停，稍后继续"
+            start = index * chunk_frames
+            _encode_part(ffmpeg_path, source, part_path, start, min(chunk_frames, job["frame_count"] - start), job)
+            job["chunks_done"] = index + 1
+            _save_job(job_path, job)
+
+        list_path = job_path.with_name(job_path.name[:-len(".job.json")] + ".parts.txt")
+        list_path.write_text("".join(f"file '{_part_path(job_path, i).name}'\n" for i in range(chunks)),
+                             encoding='utf-8')
+        cmd = [ffmpeg_path, '-y', '-loglevel', 'error']
+        if abs(job["video_fps"] - job["input_fps"]) > 1e-6:
+            # 与实时模式的帧率修正一致：第 i 帧显示在 i / video_fps 处
+            cmd += ['-itsscale', f"{job['input_fps'] / job['video_fps']:.9f}"]
+        tmp_path = output_path.with_name(output_path.stem + ".tmp" + output_path.suffix)
+        cmd += ['-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', '-movflags', '+faststart', tmp_path]
+        _run_low_priority(cmd, "拼接分段")
+        frame_count = probe_container(tmp_path).get("frame_count")
+        if frame_count != job["frame_count"]:
+            tmp_path.unlink()
+            return False, f"转码后帧数不一致: {frame_count} / {job['frame_count']}，保留中间文件"
+        os.replace(tmp_path, output_path)
+    except (OSError, RuntimeError) as e:
+        return False, str(e)
+
+    post_processing = ["pack_assembly" if job.get("source_format") == "mjpeg" else "lossless_transcode"]
+    if job.get("embed_event_subtitles") and job.get("events"):
+        try:
+            from luping.subtitles import mux_event_subtitles
+            temp_path = output_path.with_name(output_path.stem + '.subs' + output_path.suffix)
+            mux_event_subtitles(output_path, directory / job["events"], temp_path)
+            os.replace(temp_path, output_path)
+            post_processing.append("event_subtitles")
+        except Exception as e:
+            print(f"⚠️ 封装事件字幕失败: {e}")
+    _update_manifest(output_path, job, post_processing)
+
+    # 成品核对无误后再清理中间文件、分段和任务文件
+    for index in range(chunks):
+        _part_path(job_path, index).unlink(missing_ok=True)
+    list_path.unlink(missing_ok=True)
+    source.unlink(missing_ok=True)
+    if job.get("source_format") == "mjpeg":
+        index_path_for(source).unlink(missing_ok=True)
+    job_path.unlink(missing_ok=True)
+    return True, f"转码完成: {output_path.name}"
+
+
+def _update_manifest(output_path, job, post_processing):
+    """转码完成后补全录制清单中的视频信息"""
+    path = manifest_path_for(output_path)
+    manifest = load_manifest(path)
+    if manifest is None:
+        return
+    files = manifest.setdefault("files", {})
+    checksum = any("sha256" in (entry or {}) for entry in files.values())
+    manifest["video"] = container_summary(probe_container(output_path))
+    files["video"] = file_entry(output_path, checksum)
+    files.pop("intermediate", None)
+    encoder = manifest.setdefault("encoder", {})
+    encoder.update({"backend": "transcode_queue", "intermediate_codec": encoder.get("codec"), **job["encoder"]})
+    encoder.pop("lossless", None)
+    encoder.setdefault("post_processing", []).extend(post_processing)
+    save_manifest(path, manifest)
+
+
+def pending_jobs(directory):
+    """目录中未完成的转码任务文件"""
+    job_dir = Path(directory) / JOB_DIR_NAME
+    if not job_dir.is_dir():
+        return []
+    return sorted(job_dir.glob("*.job.json"))
+
+
+def adopt_orphans(directory, ffmpeg_path=None):
+    """为没有任务文件的中间文件 / 打包帧文件（录制时进程崩溃）创建任务，返回新任务路径列表"""
+    directory = Path(directory)
+    created = []
+    for source in sorted(directory.glob(f"*{INTERMEDIATE_MARKER}.mkv")):
+        output_path = source.with_name(source.name[:-len(INTERMEDIATE_MARKER + ".mkv")] + ".mp4")
+        if job_path_for(output_path).exists() or output_path.exists():
+            continue
+        frame_count = count_frames(source, ffmpeg_path)
+        if frame_count:
+            created.append(create_job(source, output_path, frame_count))
+    for source in sorted(directory.glob(f"*{PACK_SUFFIX}")):
+        output_path = source.with_suffix(".mp4")
+        if job_path_for(output_path).exists() or output_path.exists():
+            continue
+        try:
+            frame_count = len(load_pack_index(source)[0])
+        except (OSError, ValueError):
+            continue
+        if frame_count:
+            created.append(create_job(source, output_path, frame_count))
+    return created
+
+
+class TranscodeQueue:
+    """后台转码线程：逐个执行任务，每段开始前等待机器空闲；录制期间暂停"""
+
+    def __init__(self, max_load=DEFAULT_MAX_LOAD, poll_interval=5.0):
+        """
+        Args:
+            max_load: 每核平均负载上限（None 表示不检查负载，只在暂停时等待）
+            poll_interval: 等待空闲时的检查间隔（秒）
+        """
+        self.max_load = max_load
+        self.poll_interval = poll_interval
+        self.results = []
+        self._jobs = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._paused = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def submit(self, job_path):
+        """加入任务（同一任务不会重复排队）"""
+        job_path = Path(job_path)
+        with self._lock:
+            if job_path in self._queued:
+                return
+            self._queued.add(job_path)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="transcode-queue", daemon=True)
+                self._thread.start()
+        self._jobs.put(job_path)
+
+    def resume_pending(self, directory):
+        """把目录中未完成的任务重新排队，返回任务数"""
+        jobs = pending_jobs(directory)
+        for job_path in jobs:
+            self.submit(job_path)
+        return len(jobs)
+
+    def pause(self):
+        """暂停（当前分段完成后不再开始新的分段）"""
+        self._paused.set()
+
+    def resume(self):
+        self._paused.clear()
+
+    def stop(self):
+        self._stopped.set()
+        self._jobs.put(None)
+
+    def wait(self, timeout=None):
+        """等待已排队的任务全部结束，返回是否全部结束"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._queued:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+
+    def machine_idle(self):
+        if self._paused.is_set():
+            return False
+        if self.max_load is None:
+            return True
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return True  # Windows 没有平均负载，依靠最低优先级让出 CPU
+        return load <= self.max_load
+
+    def _wait_idle(self):
+        while not self.machine_idle():
+            if self._stopped.wait(self.poll_interval):
+                return False
+        return not self._stopped.is_set()
+
+    def _worker(self):
+        while not self._stopped.is_set():
+            job_path = self._jobs.get()
+            if job_path is None:
+                break
+            try:
+                ok, message = run_job(job_path, wait_idle=self._wait_idle)
+            except Exception as e:
+                ok, message = False, str(e)
+            print(f"{'✓' if ok else '⚠️'} {message}")
+            self.results.append((job_path, ok, message))
+            with self._lock:
+                self._queued.discard(job_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="执行无损录制 / 打包帧备用方案留下的转码任务（可中断，重新运行时继续）")
+    parser.add_argument("directory", help="录像目录")
+    parser.add_argument("--adopt", action="store_true", help="为崩溃遗留、没有任务文件的中间文件 / 打包帧文件创建任务")
+    parser.add_argument("--when-idle", action="store_true", help="每段开始前等待机器空闲")
+    args = parser.parse_args()
+
+    if args.adopt:
+        for job_path in adopt_orphans(args.directory):
+            print(f"已创建任务: {job_path}")
+    jobs = pending_jobs(args.directory)
+    if not jobs:
+        print("没有未完成的转码任务")
+        return
+    transcoder = TranscodeQueue(max_load=DEFAULT_MAX_LOAD if args.when_idle else None)
+    for job_path in jobs:
+        transcoder.submit(job_path)
+    transcoder.wait()
+    failed = [result for result in transcoder.results if not result[1]]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
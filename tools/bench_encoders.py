@@ -0,0 +1,131 @@
+"""
+实时编码后端基准测试
+
+用合成画面（滚动的色块和噪点文字区，接近屏幕内容）分别驱动每个可用的编码后端（luping.encoders），
+统计编码吞吐量（fps）、输入数据吞吐量（GB/s）、单帧 write() 耗时分布（p50/p99/max）和 close() 收尾耗时；
+管道后端另外报告实际管道大小和部分写入次数。
+单帧耗时是写入线程被占用的时间：超过 1/目标帧率 时写入队列会积压。
+加 --proxy 时同时编码 720p / 5 fps 的预览代理（PROXY_PROFILE），用来评估附加输出的开销。
+
+用法:
+    python tools/bench_encoders.py [--width 1920] [--height 1080] [--frames 300] [--backend pipe --backend pyav]
+    python tools/bench_encoders.py --width 2560 --height 1440 --proxy
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from luping.encoders import BACKEND_ORDER, BACKENDS, PROXY_PROFILE, available_backends, percentile
+
+
+def _make_frames(width, height, count=30):
+    """预先生成一组循环使用的合成帧，避免把生成画面的开销算进编码耗时"""
+    rng = np.random.default_rng(0)
+    text = rng.integers(0, 255, (height // 3, width, 3), dtype=np.uint8)
+    frames = []
+    for i in range(count):
+        img = np.full((height, width, 3), 235, dtype=np.uint8)
+        x = (i * 16) % max(1, width - 200)
+        img[height // 6:height // 6 + 120, x:x + 200] = (40, 120, 220)
+        img[height // 2:height // 2 + text.shape[0]] = np.roll(text, i * 4, axis=0)
+        frames.append(img)
+    return frames
+
+
+def run_benchmark(backend, width, height, frames, fps=30.0, lossless=False, proxy=False):
+    """用一个后端编码 frames 帧（proxy=True 时同时输出预览代理），返回统计结果"""
+    source = _make_frames(width, height)
+    suffix = ".mkv" if lossless else ".mp4"
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / f"bench_{backend}{suffix}"
+        outputs = [(PROXY_PROFILE, PROXY_PROFILE.path_for(output))] if proxy else []
+        # 后端启动时的提示不计入结果
+        with redirect_stdout(StringIO()):
+            encoder = BACKENDS[backend](output, width, height, fps=fps, lossless=lossless, outputs=outputs).start()
+        samples = []
+        start = time.perf_counter()
+        for i in range(frames):
+            t0 = time.perf_counter_ns()
+            encoder.write(source[i % len(source)])
+            samples.append(time.perf_counter_ns() - t0)
+        t0 = time.perf_counter()
+        encoder.close()
+        close_seconds = time.perf_counter() - t0
+        elapsed = time.perf_counter() - start
+        size = sum(path.stat().st_size for path in [output] + [p for _, p in outputs] if path.exists())
+    values = sorted(samples)
+    stats = encoder.stats()
+    return {
+        "backend": backend,
+        "codec": encoder.profile.get("codec"),
+        "frames": frames,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "throughput_gbps": stats["throughput_gbps"] or 0.0,
+        "write_p50_ms": percentile(values, 50) / 1e6,
+        "write_p99_ms": percentile(values, 99) / 1e6,
+        "write_max_ms": values[-1] / 1e6 if values else 0.0,
+        "close_ms": close_seconds * 1000,
+        "output_mb": size / 1e6,
+        "pipe_size": stats.get("pipe_size"),
+        "partial_writes": stats.get("partial_writes"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="实时编码后端基准测试")
+    parser.add_argument("--width", type=int, default=1920, help="帧宽度")
+    parser.add_argument("--height", type=int, default=1080, help="帧高度")
+    parser.add_argument("--frames", type=int, default=300, help="每个后端编码的帧数")
+    parser.add_argument("--fps", type=float, default=30.0, help="目标帧率（用于判断能否实时编码）")
+    parser.add_argument("--lossless", action="store_true", help="测试无损中间文件编码")
+    parser.add_argument("--proxy", action="store_true", help="同时输出 720p / 5 fps 预览代理")
+    parser.add_argument("--backend", dest="backends", action="append", choices=BACKEND_ORDER,
+                        help="只测试指定后端（可重复，默认测试全部可用后端）")
+    parser.add_argument("--json", dest="json_path", default=None, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    backends = args.backends or available_backends()
+    missing = [name for name in backends if not BACKENDS[name].available()]
+    for name in missing:
+        print(f"⚠️ {name} 后端不可用，跳过")
+    backends = [name for name in backends if name not in missing]
+    if not backends:
+        print("✗ 没有可用的编码后端")
+        sys.exit(1)
+
+    results = [run_benchmark(name, args.width, args.height, args.frames, args.fps, args.lossless, args.proxy)
+               for name in backends]
+    budget_ms = 1000.0 / args.fps
+    print("=" * 80)
+    print(f"编码后端对比（{args.width}x{args.height}, {args.frames} 帧, "
+          f"{'无损' if args.lossless else 'H.264'}{' + 预览代理' if args.proxy else ''}，实时预算 {budget_ms:.1f} ms/帧）")
+    print("=" * 80)
+    print(f"{'后端':<14}{'编码器':<10}{'fps':>8}{'GB/s':>8}{'p50(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}"
+          f"{'收尾(ms)':>10}{'大小(MB)':>10}")
+    for r in results:
+        print(f"{r['backend']:<14}{r['codec']:<10}{r['fps']:>8.1f}{r['throughput_gbps']:>8.2f}"
+              f"{r['write_p50_ms']:>10.2f}{r['write_p99_ms']:>10.2f}{r['write_max_ms']:>10.2f}{r['close_ms']:>10.1f}{r['output_mb']:>10.2f}")
+    for r in results:
+        ok = r["fps"] >= args.fps
+        print(f"{'✓' if ok else '⚠️'} {r['backend']}: {r['fps']:.1f} fps {'可以' if ok else '无法'}实时编码")
+        if r["pipe_size"]:
+            print(f"  管道 {r['pipe_size'] // 1024} KiB，部分写入 {r['partial_writes']} 次")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({"width": args.width, "height": args.height, "lossless": args.lossless, "proxy": args.proxy,
+                       "results": results}, f, indent=2, ensure_ascii=False)
+        print(f"✓ 结果已写入: {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
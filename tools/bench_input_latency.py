@@ -0,0 +1,218 @@
+"""
+输入监听回调延迟基准测试
+
+ScreenRecorder 安装的是全局键盘/鼠标钩子，回调里的任何停顿都会拖慢整个系统的输入。
+本脚本在受控速率下向录制器的回调方法注入合成事件，同时施加以下负载：
+  - 60 fps 的屏幕捕获（分配并拷贝整帧）
+  - 忙碌的编码器（持续 JPEG 编码 + tobytes）
+  - GC 压力（持续产生循环引用垃圾）
+并统计每个回调的耗时分布（p50/p99/p999）。p99 超过预算时以非零状态退出，供 CI 使用。
+
+用法:
+    python tools/bench_input_latency.py [--rate 500] [--duration 10] [--budget-p99-ms 2.0]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import cv2
+import numpy as np
+
+from luping.encoders import percentile
+from luping.recorder import ScreenRecorder
+
+
+class _FakeKey:
+    """模拟 pynput 的按键对象（只需要 char 属性）"""
+
+    def __init__(self, char):
+        self.char = char
+
+    def __str__(self):
+        return f"'{self.char}'"
+
+
+def _summarize(samples_ns):
+    """把纳秒样本汇总为毫秒统计"""
+    values = sorted(samples_ns)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50) / 1e6,
+        "p99_ms": percentile(values, 99) / 1e6,
+        "p999_ms": percentile(values, 99.9) / 1e6,
+        "max_ms": (values[-1] / 1e6) if values else 0.0,
+    }
+
+
+def _capture_load(stop, width, height, fps):
+    """模拟 60 fps 屏幕捕获：每帧分配 BGRA 缓冲并切片拷贝为 BGR"""
+    source = np.random.randint(0, 255, (height, width, 4), dtype=np.uint8)
+    interval = 1.0 / fps
+    next_time = time.perf_counter()
+    while not stop.is_set():
+        img = np.array(source)
+        img = np.ascontiguousarray(img[:, :, :3])
+        next_time += interval
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_time = time.perf_counter()
+
+
+def _encoder_load(stop, width, height):
+    """模拟忙碌的编码器线程：持续编码并序列化帧"""
+    frame = np.random.randint(0, 255, (height, width, 3), dtype=np.uint8)
+    while not stop.is_set():
+        cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        frame.tobytes()
+
+
+def _gc_load(stop):
+    """制造 GC 压力：不断产生循环引用的小对象"""
+    while not stop.is_set():
+        garbage = []
+        for i in range(2000):
+            node = {"i": i, "payload": [i] * 4}
+            node["self"] = node
+            garbage.append(node)
+        del garbage
+        time.sleep(0.001)
+
+
+def _make_injectors(recorder):
+    """构造合成事件注入函数（名称 -> 可调用对象）"""
+    state = {"n": 0}
+
+    def mouse_move():
+        state["n"] += 1
+        n = state["n"]
+        recorder._on_mouse_move(100 + (n * 7) % 1500, 100 + (n * 3) % 800)
+
+    def mouse_click():
+        recorder._on_mouse_click(640, 480, "Button.left", True)
+        recorder._on_mouse_click(640, 480, "Button.left", False)
+
+    def mouse_scroll():
+        recorder._on_mouse_scroll(640, 480, 0, -1)
+
+    keys = [_FakeKey(c) for c in "abcdefghijklmnopqrstuvwxyz"]
+
+    def key_press():
+        recorder._on_key_press(keys[state["n"] % len(keys)])
+
+    def key_release():
+        recorder._on_key_release(keys[state["n"] % len(keys)])
+
+    # 权重大致反映真实输入：鼠标移动远多于点击和按键
+    return [
+        ("mouse_move", mouse_move, 12),
+        ("key_press", key_press, 2),
+        ("key_release", key_release, 2),
+        ("mouse_click", mouse_click, 1),
+        ("mouse_scroll", mouse_scroll, 1),
+    ]
+
+
+def run_benchmark(rate, duration, width, height, capture_fps, load=True):
+    """运行基准测试，返回 {回调名: 统计}，以及 'all' 汇总"""
+    output_dir = tempfile.mkdtemp(prefix="luping_bench_")
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        recorder = ScreenRecorder(output_dir=output_dir)
+    # 只准备回调所需的状态，不启动真实监听器和捕获线程
+    recorder.is_recording = True
+    recorder.start_time = recorder.clock.start()
+
+    stop = threading.Event()
+    threads = []
+    if load:
+        threads.append(threading.Thread(target=_capture_load, args=(stop, width, height, capture_fps), daemon=True))
+        threads.append(threading.Thread(target=_encoder_load, args=(stop, width, height), daemon=True))
+        threads.append(threading.Thread(target=_gc_load, args=(stop,), daemon=True))
+    for t in threads:
+        t.start()
+
+    injectors = _make_injectors(recorder)
+    schedule = []
+    for name, fn, weight in injectors:
+        schedule.extend([(name, fn)] * weight)
+    samples = {name: [] for name, _, _ in injectors}
+
+    interval = 1.0 / rate
+    total = int(rate * duration)
+    next_time = time.perf_counter()
+    # 回调中的 print 同样计入耗时，但输出丢弃，避免刷屏
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        for i in range(total):
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            name, fn = schedule[i % len(schedule)]
+            t0 = time.perf_counter_ns()
+            fn()
+            samples[name].append(time.perf_counter_ns() - t0)
+            next_time += interval
+            # 定期清空事件队列，避免基准本身的内存无限增长
+            if i % 1000 == 999:
+                while not recorder.events_queue.empty():
+                    recorder.events_queue.get_nowait()
+
+    stop.set()
+    for t in threads:
+        t.join(timeout=2)
+    recorder.is_recording = False
+
+    report = {name: _summarize(values) for name, values in samples.items()}
+    report["all"] = _summarize([v for values in samples.values() for v in values])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量输入回调在负载下的延迟")
+    parser.add_argument("--rate", type=float, default=500.0, help="注入速率（事件/秒）")
+    parser.add_argument("--duration", type=float, default=10.0, help="测试时长（秒）")
+    parser.add_argument("--width", type=int, default=1920, help="模拟帧宽度")
+    parser.add_argument("--height", type=int, default=1080, help="模拟帧高度")
+    parser.add_argument("--capture-fps", type=float, default=60.0, help="模拟捕获帧率")
+    parser.add_argument("--no-load", action="store_true", help="不施加背景负载（基线对照）")
+    parser.add_argument("--budget-p99-ms", type=float, default=None, help="p99 预算（毫秒），超出则以状态 1 退出")
+    parser.add_argument("--json", dest="json_path", default=None, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    gc.collect()
+    report = run_benchmark(args.rate, args.duration, args.width, args.height,
+                           args.capture_fps, load=not args.no_load)
+
+    print("=" * 60)
+    print(f"输入回调延迟（速率 {args.rate:.0f}/s, 时长 {args.duration:.0f}s, "
+          f"负载: {'无' if args.no_load else f'{args.capture_fps:.0f}fps 捕获 + 编码 + GC'}）")
+    print("=" * 60)
+    print(f"{'回调':<14}{'次数':>8}{'p50(ms)':>11}{'p99(ms)':>11}{'p999(ms)':>11}{'max(ms)':>11}")
+    for name, stats in report.items():
+        print(f"{name:<14}{stats['count']:>8}{stats['p50_ms']:>11.3f}{stats['p99_ms']:>11.3f}"
+              f"{stats['p999_ms']:>11.3f}{stats['max_ms']:>11.3f}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"✓ 结果已写入: {args.json_path}")
+
+    if args.budget_p99_ms is not None:
+        p99 = report["all"]["p99_ms"]
+        if p99 > args.budget_p99_ms:
+            print(f"✗ p99 {p99:.3f} ms 超出预算 {args.budget_p99_ms:.3f} ms")
+            sys.exit(1)
+        print(f"✓ p99 {p99:.3f} ms 在预算 {args.budget_p99_ms:.3f} ms 之内")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+隐私打码基准测试
+
+在合成画面上按每种打码方式（luping.masking）处理一组区域，统计单帧打码耗时分布（p50/p99/max）。
+打码在采集线程里执行，耗时直接占用帧间隔；fill / pixelate 的 p99 超过预算时以非零状态退出，供 CI 使用。
+blur 要插值放大整个区域，大面积区域本来就超出 1 ms 预算，只报告耗时、不参与判断。
+默认区域：两个密码框（420x40）和一个聊天面板（560x1000），约占 1440p 画面的 16%。
+
+用法:
+    python tools/bench_masking.py [--width 2560] [--height 1440] [--frames 300] [--budget-p99-ms 1.0]
+    python tools/bench_masking.py --region 0,0,1280,720 --region 1280,720,640,360
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from luping.encoders import percentile
+from luping.masking import BLUR, MODES, PrivacyMask
+
+
+def default_regions(width, height):
+    """两个密码框和右侧聊天面板（按画面大小缩放）"""
+    sx, sy = width / 2560, height / 1440
+    boxes = [(300, 400, 420, 40), (300, 500, 420, 40), (1960, 300, 560, 1000)]
+    return [(int(x * sx), int(y * sy), max(1, int(w * sx)), max(1, int(h * sy))) for x, y, w, h in boxes]
+
+
+def run_benchmark(mode, width, height, regions, frames):
+    """用一种打码方式处理 frames 帧，返回统计结果"""
+    rng = np.random.default_rng(0)
+    source = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(2)]
+    mask = PrivacyMask(regions, mode=mode)
+    samples = []
+    for i in range(frames):
+        # 每帧都是新数组，与录制时一致（打码原地修改刚采集到的帧）
+        img = source[i % len(source)].copy()
+        t0 = time.perf_counter_ns()
+        mask(img, i, 0.0)
+        samples.append(time.perf_counter_ns() - t0)
+    values = sorted(samples)
+    return {
+        "mode": mode,
+        "frames": frames,
+        "p50_ms": percentile(values, 50) / 1e6,
+        "p99_ms": percentile(values, 99) / 1e6,
+        "max_ms": values[-1] / 1e6 if values else 0.0,
+        "errors": mask.errors,
+    }
+
+
+def _parse_region(text):
+    parts = [int(v) for v in text.split(",")]
+    if len(parts) != 4:
+        raise argparse.ArgumentTypeError(f"区域格式应为 x,y,宽,高: {text}")
+    return tuple(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="隐私打码基准测试")
+    parser.add_argument("--width", type=int, default=2560, help="帧宽度")
+    parser.add_argument("--height", type=int, default=1440, help="帧高度")
+    parser.add_argument("--frames", type=int, default=300, help="每种方式处理的帧数")
+    parser.add_argument("--region", dest="regions", action="append", type=_parse_region,
+                        help="打码区域 x,y,宽,高（可重复，默认两个密码框和一个聊天面板）")
+    parser.add_argument("--budget-p99-ms", type=float, default=1.0, help="单帧打码耗时 p99 预算（毫秒）")
+    parser.add_argument("--json", dest="json_path", default=None, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    regions = args.regions or default_regions(args.width, args.height)
+    area = sum(w * h for _, _, w, h in regions) / (args.width * args.height)
+    results = [run_benchmark(mode, args.width, args.height, regions, args.frames) for mode in MODES]
+    print("=" * 60)
+    print(f"隐私打码（{args.width}x{args.height}, {len(regions)} 个区域, 占画面 {area:.0%}, {args.frames} 帧）")
+    print("=" * 60)
+    print(f"{'方式':<12}{'p50(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for r in results:
+        print(f"{r['mode']:<12}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['max_ms']:>10.3f}")
+    over = [r["mode"] for r in results if r["mode"] != BLUR and r["p99_ms"] > args.budget_p99_ms]
+    if over:
+        print(f"⚠️ 超出预算 {args.budget_p99_ms} ms: {', '.join(over)}")
+    else:
+        print(f"✓ fill / pixelate 的 p99 在预算 {args.budget_p99_ms} ms 以内")
+    blur = next(r for r in results if r["mode"] == BLUR)
+    if blur["p99_ms"] > args.budget_p99_ms:
+        print(f"  blur p99 {blur['p99_ms']:.3f} ms，不在预算内（大区域请用 pixelate）")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({"width": args.width, "height": args.height, "regions": regions, "results": results},
+                      f, indent=2, ensure_ascii=False)
+        print(f"✓ 结果已写入: {args.json_path}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
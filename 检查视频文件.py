@@ -1,12 +1,18 @@
 """
 检查视频文件是否有效的工具脚本
-用法: python 检查视频文件.py <视频文件路径>
+用法: python 检查视频文件.py <视频文件路径> [--decode]
+      python 检查视频文件.py <录像目录>        # 批量并行校验，等同 python -m luping.batch_verify
+
+默认只解析容器结构（MP4 box / AVI chunk），不解码视频，长录像也能立即得到结果；
+加 --decode 时再用 OpenCV 读取前 10 帧和最后一帧。
 """
 import sys
-import cv2
 from pathlib import Path
 
-def check_video_file(video_path):
+from luping.container import probe_container, verify_container
+from luping.manifest import manifest_for
+
+def check_video_file(video_path, decode=False):
     """检查视频文件"""
     video_path = Path(video_path)
     
@@ -29,60 +35,57 @@ def check_video_file(video_path):
         print("❌ 错误: 文件大小为 0")
         return False
     
-    # 3. 检查文件头
-    print("\n检查文件头...")
-    try:
-        with open(video_path, 'rb') as f:
-            header = f.read(16)
-            print(f"前16字节 (hex): {header.hex()}")
-            print(f"前16字节 (ascii): {header}")
-            
-            if video_path.suffix == '.mp4':
-                if header[4:8] == b'ftyp':
-                    print("✓ MP4 文件头正确 (ftyp box)")
-                else:
-                    print("⚠️ 警告: MP4 文件头可能不正确")
-                    print(f"   4-8字节应该是 'ftyp'，实际是: {header[4:8]}")
-            elif video_path.suffix == '.avi':
-                if header[:4] == b'RIFF':
-                    print("✓ AVI 文件头正确 (RIFF)")
-                else:
-                    print("⚠️ 警告: AVI 文件头可能不正确")
-                    print(f"   前4字节应该是 'RIFF'，实际是: {header[:4]}")
-    except Exception as e:
-        print(f"⚠️ 读取文件头时出错: {e}")
+    # 3. 解析容器结构
+    print("\n解析容器结构...")
+    info = probe_container(video_path)
+    # 有匹配的录制清单时，与录制时记录的帧数和时长对照
+    manifest = manifest_for(video_path)
+    expected_frames = expected_duration = None
+    if manifest is not None:
+        expected_frames = manifest.get("video", {}).get("frame_count")
+        expected_duration = manifest.get("frames", {}).get("actual_duration")
+        print(f"✓ 找到录制清单（写入帧数 {manifest.get('frames', {}).get('written')}, "
+              f"丢帧 {manifest.get('frames', {}).get('dropped')}, 实际时长 {expected_duration} 秒）")
+    ok, problems = verify_container(info, expected_frames=expected_frames, expected_duration=expected_duration)
+    print(f"  格式: {info['format']}")
+    print(f"  帧率 (FPS): {info['fps']:.2f}")
+    print(f"  总帧数: {info['frame_count']}")
+    print(f"  分辨率: {info['width']}x{info['height']}")
+    print(f"  时长: {info['duration']:.2f} 秒")
+    print(f"  编码器: {info['codec']}")
+    if info['keyframes'] is not None:
+        times = ", ".join(f"{t:.2f}" for t in (info['keyframe_times'] or [])[:10])
+        more = " ..." if len(info['keyframes']) > 10 else ""
+        print(f"  关键帧: {len(info['keyframes'])} 个 (秒: {times}{more})")
+    for problem in problems:
+        print(f"⚠️ {problem}")
+    
+    if not ok:
+        print("\n" + "=" * 60)
+        print("❌ 视频文件验证失败")
+        return False
     
-    # 4. 用 OpenCV 检查
-    print("\n用 OpenCV 检查视频...")
+    # 4. 可选：用 OpenCV 解码
+    if decode and not decode_check(video_path, info['frame_count']):
+        print("\n" + "=" * 60)
+        print("❌ 视频文件验证失败")
+        return False
+    
+    print("\n" + "=" * 60)
+    print("✓ 视频文件验证通过")
+    return True
+
+def decode_check(video_path, frame_count):
+    """用 OpenCV 读取前 10 帧和最后一帧"""
+    import cv2
+    print("\n用 OpenCV 解码检查...")
     cap = cv2.VideoCapture(str(video_path))
     
     if not cap.isOpened():
         print("❌ 错误: OpenCV 无法打开视频文件")
         return False
     
-    # 获取视频属性
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
-    fourcc_str = "".join([chr((fourcc >> 8 * i) & 0xFF) for i in range(4)])
-    duration = frame_count / fps if fps > 0 else 0
-    
-    print(f"✓ OpenCV 可以打开视频")
-    print(f"  帧率 (FPS): {fps}")
-    print(f"  总帧数: {frame_count}")
-    print(f"  分辨率: {width}x{height}")
-    print(f"  时长: {duration:.2f} 秒")
-    print(f"  编码器 (FourCC): {fourcc_str} ({fourcc})")
-    
-    if frame_count == 0:
-        print("❌ 错误: 视频没有帧数据")
-        cap.release()
-        return False
-    
     # 尝试读取帧
-    print("\n尝试读取帧...")
     frames_read = 0
     for i in range(min(10, frame_count)):  # 读取前10帧
         ret, frame = cap.read()
@@ -106,21 +109,18 @@ def check_video_file(video_path):
             print("⚠️ 警告: 无法读取最后一帧")
     
     cap.release()
-    
-    print("\n" + "=" * 60)
-    if frames_read > 0:
-        print("✓ 视频文件验证通过")
-        return True
-    else:
-        print("❌ 视频文件验证失败")
-        return False
+    return frames_read > 0
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("用法: python 检查视频文件.py <视频文件路径>")
+    args = [a for a in sys.argv[1:] if a != "--decode"]
+    if len(args) < 1:
+        print("用法: python 检查视频文件.py <视频文件路径|录像目录> [--decode]")
         sys.exit(1)
     
-    video_path = sys.argv[1]
-    success = check_video_file(video_path)
+    video_path = args[0]
+    if Path(video_path).is_dir():
+        from luping.batch_verify import main as batch_main
+        sys.argv = [sys.argv[0]] + args
+        batch_main()
+    success = check_video_file(video_path, decode="--decode" in sys.argv[1:])
     sys.exit(0 if success else 1)
-